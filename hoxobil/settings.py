@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import os
+from decimal import Decimal
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
@@ -106,6 +107,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'shop.context_processors.cart',
             ],
         },
     },
@@ -196,6 +198,36 @@ PAYSTACK_SECRET_KEY = os.getenv('PAYSTACK_SECRET_KEY')
 PAYSTACK_PUBLIC_KEY = os.getenv('PAYSTACK_PUBLIC_KEY')
 PRINTIFY_API_TOKEN = os.getenv('PRINTIFY_API_TOKEN')
 PRINTIFY_SHOP_ID = os.getenv('PRINTIFY_SHOP_ID')
+# USD -> NGN rate used until the first ExchangeRate row is added in the admin
+USD_TO_NGN_RATE = Decimal(os.getenv('USD_TO_NGN_RATE', '1607.00'))
+# Secret given to Printify when registering webhooks (`manage.py register_printify_webhooks`)
+PRINTIFY_WEBHOOK_SECRET = os.getenv('PRINTIFY_WEBHOOK_SECRET')
+
+# Catalog read mode: 'local' serves the storefront from the synced Product table,
+# 'live' calls the Printify API on every page view (the old behaviour).
+CATALOG_READ_MODE = os.getenv('CATALOG_READ_MODE', 'local').lower()
+# Local catalog data older than this (based on Product.last_synced_at) is considered stale.
+CATALOG_MAX_AGE_SECONDS = int(os.getenv('CATALOG_MAX_AGE_SECONDS', 6 * 60 * 60))
+# Product detail pages older than this are refreshed from Printify in the background.
+PRODUCT_DETAIL_TTL_SECONDS = int(os.getenv('PRODUCT_DETAIL_TTL_SECONDS', 15 * 60))
+# Number of Printify product pages fetched in parallel during a catalog sync.
+PRINTIFY_SYNC_CONCURRENCY = int(os.getenv('PRINTIFY_SYNC_CONCURRENCY', 4))
+# How often `manage.py sync_printify --every` runs a full catalog sync.
+PRINTIFY_SYNC_INTERVAL_SECONDS = int(os.getenv('PRINTIFY_SYNC_INTERVAL_SECONDS', 60 * 60))
+# Printify order submission (`manage.py process_printify_outbox`): attempts before an order is
+# marked failed, and the first retry delay in seconds, doubled per attempt up to the maximum.
+PRINTIFY_ORDER_MAX_ATTEMPTS = int(os.getenv('PRINTIFY_ORDER_MAX_ATTEMPTS', 8))
+PRINTIFY_ORDER_RETRY_BACKOFF = int(os.getenv('PRINTIFY_ORDER_RETRY_BACKOFF', 60))
+PRINTIFY_ORDER_RETRY_MAX_DELAY = int(os.getenv('PRINTIFY_ORDER_RETRY_MAX_DELAY', 6 * 60 * 60))
+# How often `manage.py reconcile_printify_orders --every` copies order status and tracking from Printify.
+PRINTIFY_RECONCILE_INTERVAL_SECONDS = int(os.getenv('PRINTIFY_RECONCILE_INTERVAL_SECONDS', 30 * 60))
+
+# Outbound HTTP (Printify/Paystack) connection pooling and retries, per gunicorn worker.
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 4)) # Number of per-host pools kept
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 8)) # Keep-alive connections per host
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 3))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', 0.5)) # Seconds; doubled per retry, plus jitter
+HTTP_RETRY_AFTER_MAX = int(os.getenv('HTTP_RETRY_AFTER_MAX', 30)) # Cap on any single Retry-After wait
 
 
 # Production Security Settings (activated when DEBUG=False)
@@ -2,20 +2,33 @@ from django.contrib import admin
 from django.urls import reverse # Moved import to top
 from django.utils.html import format_html
 import json 
-from .models import Product, Order, OrderItem, WinningCode, CompetitionAttempt, SiteEvent, UserProfile
+from .models import Product, Order, OrderItem, WinningCode, CompetitionAttempt, SiteEvent, UserProfile, SyncRun, CatalogFacet, ProductVariant, ExchangeRate, Cart, CartItem, PendingCheckout, PrintifyOrderOutbox, PaystackEvent
+from .fulfilment import requeue_entries
+
+class ProductVariantInline(admin.TabularInline):
+    model = ProductVariant
+    extra = 0
+    can_delete = False
+    fields = ('printify_variant_id', 'title', 'color', 'size', 'price_kobo', 'is_enabled', 'is_available')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False # Variants come from the Printify sync
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    inlines = [ProductVariantInline]
     list_display = (
         'title', 
         'printify_id', 
+        'category',
         'base_price_ngn', 
         'is_published', 
         'last_synced_at', 
         'created_at'
     )
     search_fields = ('title', 'printify_id', 'description', 'tags__icontains') 
-    list_filter = ('is_published', 'last_synced_at', 'created_at', 'updated_at', 'printify_shop_id', 'printify_print_provider_id')
+    list_filter = ('is_published', 'category', 'last_synced_at', 'created_at', 'updated_at', 'printify_shop_id', 'printify_print_provider_id')
     
     readonly_fields = (
         'printify_id', 
@@ -27,7 +40,7 @@ class ProductAdmin(admin.ModelAdmin):
     )
     
     fieldsets = (
-        (None, {'fields': ('title', 'printify_id', 'description', 'primary_image_url', 'base_price_ngn', 'is_published')}),
+        (None, {'fields': ('title', 'printify_id', 'description', 'primary_image_url', 'image_urls', 'base_price_ngn', 'is_published')}),
         ('Printify Meta Data', {'classes': ('collapse',), 'fields': ('printify_shop_id', 'printify_blueprint_id', 'printify_print_provider_id', 'tags')}),
         ('Advanced Data (JSON)', {'classes': ('collapse',), 'fields': ('product_options_data_display', 'variants_data_display')}),
         ('Timestamps', {'classes': ('collapse',), 'fields': ('last_synced_at', 'created_at', 'updated_at')})
@@ -47,10 +60,10 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'get_customer_identifier', 'total_amount', 'paid', 'paystack_reference', 'created_at') # Changed method name
-    list_filter = ('paid', 'created_at', 'user')
-    search_fields = ('id', 'email', 'paystack_reference', 'first_name', 'last_name', 'user__email') # Changed user__username
-    readonly_fields = ('paystack_reference', 'created_at', 'updated_at', 'total_amount', 'user') 
+    list_display = ('id', 'get_customer_identifier', 'total_amount', 'paid', 'paystack_reference', 'printify_status', 'created_at') # Changed method name
+    list_filter = ('paid', 'printify_status', 'created_at', 'user')
+    search_fields = ('id', 'email', 'paystack_reference', 'external_id', 'printify_order_id', 'tracking_number', 'first_name', 'last_name', 'user__email') # Changed user__username
+    readonly_fields = ('paystack_reference', 'external_id', 'printify_order_id', 'printify_status', 'tracking_carrier', 'tracking_number', 'tracking_url', 'fulfilled_at', 'created_at', 'updated_at', 'total_amount', 'user') 
     
     class OrderItemInline(admin.TabularInline): 
         model = OrderItem
@@ -80,6 +93,53 @@ class OrderItemAdmin(admin.ModelAdmin):
         return format_html('<a href="{}">Order #{}</a>', link, obj.order.id)
 
 
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'created_at', 'updated_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('user', 'created_at', 'updated_at')
+    list_select_related = ('user',)
+
+    class CartItemInline(admin.TabularInline):
+        model = CartItem
+        fields = ('key', 'title', 'variant_title', 'price_kobo', 'quantity', 'is_custom', 'updated_at')
+        readonly_fields = fields
+        extra = 0
+
+    inlines = [CartItemInline]
+
+
+@admin.register(PendingCheckout)
+class PendingCheckoutAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'status', 'user', 'amount_kobo', 'order', 'created_at', 'completed_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('reference', 'user__email', 'customer__email')
+    readonly_fields = ('reference', 'user', 'cart', 'amount_kobo', 'customer', 'lines', 'printify_order', 'order', 'last_error', 'created_at', 'updated_at', 'completed_at')
+    list_select_related = ('user', 'order')
+
+
+@admin.register(PaystackEvent)
+class PaystackEventAdmin(admin.ModelAdmin):
+    list_display = ('event', 'reference', 'result', 'received_at')
+    list_filter = ('event', 'received_at')
+    search_fields = ('reference',)
+    readonly_fields = ('event', 'reference', 'payload', 'result', 'received_at')
+
+
+@admin.register(PrintifyOrderOutbox)
+class PrintifyOrderOutboxAdmin(admin.ModelAdmin):
+    list_display = ('order', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('order__id', 'order__paystack_reference', 'order__external_id')
+    readonly_fields = ('order', 'payload', 'status', 'attempts', 'next_attempt_at', 'locked_at', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_failed']
+
+    @admin.action(description="Retry submitting the selected failed orders")
+    def retry_failed(self, request, queryset):
+        count = requeue_entries(queryset)
+        self.message_user(request, f"Re-queued {count} order(s) for submission to Printify.")
+
+
 @admin.register(WinningCode)
 class WinningCodeAdmin(admin.ModelAdmin):
     list_display = ('code', 'prize_description', 'is_claimed', 'get_claimed_by_user_email', 'claimed_at', 'created_at') # Changed method name
@@ -152,3 +212,48 @@ class UserProfileAdmin(admin.ModelAdmin):
         ('Competition Reward', {'fields': ('unlocked_first_digit', 'unlocked_digit_from_code', 'digit_unlocked_at')}),
         ('Timestamps', {'fields': ('created_at', 'updated_at'), 'classes': ('collapse',)})
     )
+
+@admin.register(SyncRun)
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'trigger', 'created_at', 'started_at', 'finished_at', 'pages_fetched', 'pages_total', 'products_created', 'products_updated', 'products_skipped', 'products_removed')
+    list_filter = ('status', 'trigger', 'created_at')
+    readonly_fields = ('status', 'trigger', 'requested_by', 'created_at', 'started_at', 'finished_at', 'pages_total', 'pages_fetched', 'products_created', 'products_updated', 'products_skipped', 'products_removed', 'errors_display')
+    exclude = ('errors',)
+
+    @admin.display(description='Errors (JSON)')
+    def errors_display(self, obj):
+        if obj.errors:
+            return format_html("<pre>{}</pre>", json.dumps(obj.errors, indent=2))
+        return "-"
+
+@admin.register(CatalogFacet)
+class CatalogFacetAdmin(admin.ModelAdmin):
+    list_display = ('facet', 'category', 'value', 'product_count', 'updated_at')
+    list_filter = ('facet', 'category')
+    search_fields = ('value',)
+    readonly_fields = ('facet', 'category', 'value', 'product_count', 'updated_at')
+
+@admin.register(ProductVariant)
+class ProductVariantAdmin(admin.ModelAdmin):
+    list_display = ('title', 'product', 'printify_variant_id', 'color', 'size', 'price_kobo', 'is_enabled', 'is_available')
+    list_filter = ('is_enabled', 'is_available', 'color', 'size')
+    search_fields = ('title', 'printify_variant_id', 'sku', 'product__title', 'product__printify_id')
+    list_select_related = ('product',)
+    readonly_fields = ('product', 'printify_variant_id', 'option_value_ids', 'last_synced_at')
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('usd_to_ngn', 'effective_at', 'applied_at', 'note', 'created_by', 'created_at')
+    readonly_fields = ('applied_at', 'created_by', 'created_at')
+    actions = ['reprice_now']
+
+    def save_model(self, request, obj, form, change):
+        if not obj.created_by_id:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description="Reprice the catalog now with the rate in effect")
+    def reprice_now(self, request, queryset):
+        from .sync import reprice_catalog
+        repriced = reprice_catalog(force=True)
+        self.message_user(request, f"Repriced {repriced} products at the current exchange rate.")
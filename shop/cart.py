@@ -0,0 +1,330 @@
+# shop/cart.py
+"""
+Database-backed shopping carts.
+
+A signed-in user's cart is found by user; a guest cart by the 'cart_id' session key,
+which is written once when the cart is created. Adding, updating and removing lines
+touch only the affected CartItem row, so the session is not rewritten on cart changes.
+When a guest signs in, their cart is merged into the user's cart (see signals.py).
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .catalog import lookup_variant, lookup_variants
+from .models import Cart, CartItem, CustomDesign
+from .pricing import CartPricing, line_unit_kobo, ngn_to_kobo
+
+logger = logging.getLogger(__name__)
+
+CART_SESSION_KEY = 'cart_id'
+# Carts stored in the session before the cart moved to the database
+LEGACY_SESSION_CART_KEY = 'cart'
+
+CART_BATCH_MAX_OPERATIONS = 50
+# Custom design states from which a design can be put in the cart
+CART_READY_DESIGN_STATUSES = ('uploaded_to_printify', 'pending', 'added_to_cart')
+NO_IMAGE_URL = 'https://placehold.co/100x100?text=No+Img'
+
+
+class CartOperationError(ValueError):
+    """An operation of a cart batch could not be applied; `index` is its position in the batch."""
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+def get_cart(request, create=False):
+    """
+    Returns the request's Cart, or None if it has none and create is False.
+    A cart left in the session by the old session-based cart is moved into the database.
+    """
+    cart = None
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart is None and create:
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+    else:
+        cart_id = request.session.get(CART_SESSION_KEY)
+        if cart_id:
+            cart = Cart.objects.filter(pk=cart_id, user__isnull=True).first()
+        if cart is None and create:
+            cart = Cart.objects.create()
+            request.session[CART_SESSION_KEY] = cart.pk
+
+    legacy_lines = request.session.get(LEGACY_SESSION_CART_KEY)
+    if legacy_lines:
+        if cart is None:
+            return get_cart(request, create=True)
+        import_session_lines(cart, legacy_lines)
+    if LEGACY_SESSION_CART_KEY in request.session:
+        del request.session[LEGACY_SESSION_CART_KEY]
+    return cart
+
+
+def cart_lines(cart):
+    """The cart's lines as {cart key: line dict}, in the order they were added. Empty for no cart."""
+    if cart is None:
+        return {}
+    return {item.key: item.as_line() for item in cart.items.all()}
+
+
+def cart_item_count(cart):
+    """Number of distinct lines in the cart, as shown on the cart badge."""
+    return cart.items.count() if cart is not None else 0
+
+
+def get_item(cart, key):
+    if cart is None:
+        return None
+    return cart.items.filter(key=key).first()
+
+
+def _touch(cart):
+    Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+
+
+def add_item(cart, key, quantity, touch=True, **line):
+    """
+    Adds `quantity` of the line `key`. If the cart already has that line its quantity is
+    incremented in place; otherwise a CartItem is created with the `line` field values.
+    Returns True if a new line was created.
+    """
+    created = False
+    if not CartItem.objects.filter(cart=cart, key=key).update(quantity=F('quantity') + quantity, updated_at=timezone.now()):
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=cart, key=key, quantity=quantity, **line)
+            created = True
+        except IntegrityError:
+            # A concurrent request created the same line first
+            CartItem.objects.filter(cart=cart, key=key).update(quantity=F('quantity') + quantity, updated_at=timezone.now())
+    if touch:
+        _touch(cart)
+    return created
+
+
+def set_quantity(cart, key, quantity, touch=True):
+    """Sets the quantity of an existing line. Returns False if the cart has no such line."""
+    updated = CartItem.objects.filter(cart=cart, key=key).update(quantity=quantity, updated_at=timezone.now())
+    if updated and touch:
+        _touch(cart)
+    return bool(updated)
+
+
+def remove_item(cart, key, touch=True):
+    """Deletes the line `key` and returns the removed CartItem, or None if it was not in the cart."""
+    item = get_item(cart, key)
+    if item is not None:
+        item.delete()
+        if touch:
+            _touch(cart)
+    return item
+
+
+def clear_cart(cart):
+    if cart is not None:
+        cart.items.all().delete()
+        _touch(cart)
+
+
+def _line_fields(line):
+    """CartItem field values for a session-style cart line dict."""
+    return {
+        'printify_product_id': str(line.get('id') or ''),
+        'variant_id': str(line.get('variant_id') or ''),
+        'custom_design_id': line.get('custom_design_id') or None,
+        'title': line.get('title') or '',
+        'variant_title': line.get('variant_title') or '',
+        'price_kobo': line_unit_kobo(line),
+        'image_url': line.get('image_url') or '',
+        'is_custom': bool(line.get('is_custom')),
+    }
+
+
+def import_session_lines(cart, lines):
+    """Adds the lines of an old session cart ({cart key: line dict}) to `cart`."""
+    for key, line in lines.items():
+        try:
+            quantity = int(line.get('quantity', 0))
+        except (TypeError, ValueError):
+            continue
+        if quantity > 0:
+            add_item(cart, key, quantity, **_line_fields(line))
+    logger.info(f"🛒 Moved {len(lines)} session cart line(s) into cart {cart.pk}.")
+
+
+@transaction.atomic
+def merge_carts(source, target):
+    """
+    Moves every line of `source` into `target`, adding quantities of lines both carts
+    contain, and deletes `source`.
+    """
+    existing = {item.key: item for item in target.items.select_for_update()}
+    moved = []
+    for item in source.items.all():
+        if item.key in existing:
+            CartItem.objects.filter(pk=existing[item.key].pk).update(quantity=F('quantity') + item.quantity, updated_at=timezone.now())
+        else:
+            moved.append(item.pk)
+    CartItem.objects.filter(pk__in=moved).update(cart=target)
+    source.delete()
+    _touch(target)
+
+
+def merge_guest_cart(request, user):
+    """
+    Called at login: merges the session's guest cart into the user's cart. If the user
+    has no cart yet, the guest cart simply becomes theirs.
+    """
+    cart_id = request.session.pop(CART_SESSION_KEY, None)
+    if not cart_id:
+        return
+    guest_cart = Cart.objects.filter(pk=cart_id, user__isnull=True).first()
+    if guest_cart is None:
+        return
+    user_cart = Cart.objects.filter(user=user).first()
+    if user_cart is None:
+        guest_cart.user = user
+        guest_cart.save(update_fields=['user', 'updated_at'])
+        logger.info(f"🛒 Guest cart {guest_cart.pk} now belongs to user {user.pk}.")
+    else:
+        merge_carts(guest_cart, user_cart)
+        logger.info(f"🛒 Merged guest cart {cart_id} into cart {user_cart.pk} of user {user.pk}.")
+
+
+def load_cart_references(lines, user):
+    """
+    Loads everything the lines of a cart ({cart key: line dict}) refer to, in two queries:
+    the variant lookups of the standard lines, keyed by (printify id, variant id) as from
+    lookup_variants, and the user's CustomDesigns of the custom lines with their products,
+    as {design id: CustomDesign}.
+    """
+    variants = lookup_variants(
+        (line.get('id'), line.get('variant_id')) for line in lines.values() if not line.get('is_custom')
+    )
+    design_ids = [
+        int(line['custom_design_id']) for line in lines.values()
+        if line.get('is_custom') and str(line.get('custom_design_id') or '').isdigit()
+    ]
+    designs = CustomDesign.objects.select_related('product').filter(user=user).in_bulk(design_ids) if design_ids else {}
+    return variants, designs
+
+
+def _operation_quantity(index, operation, minimum=1):
+    try:
+        quantity = int(operation.get('quantity', 1))
+    except (TypeError, ValueError):
+        raise CartOperationError(index, "quantity must be an integer.")
+    if quantity < minimum:
+        raise CartOperationError(index, f"quantity must be at least {minimum}.")
+    return quantity
+
+
+def apply_cart_operations(cart, operations, user):
+    """
+    Applies a list of cart operations in order. Call inside transaction.atomic() so a
+    failing operation (CartOperationError) leaves the cart untouched. Operations:
+
+        {"op": "add", "product_id": "<printify id>", "variant_id": "<variant id>", "quantity": 1}
+        {"op": "add_custom_design", "custom_design_id": 12, "quantity": 1}
+        {"op": "set_quantity", "key": "<cart key>", "quantity": 3}   (0 removes the line)
+        {"op": "remove", "key": "<cart key>"}
+
+    Returns the IDs of custom designs whose lines were removed; the caller deletes them
+    once the transaction has committed, as remove_from_cart does.
+    """
+    if len(operations) > CART_BATCH_MAX_OPERATIONS:
+        raise CartOperationError(None, f"At most {CART_BATCH_MAX_OPERATIONS} operations per request.")
+
+    removed_design_ids = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise CartOperationError(index, "Each operation must be an object.")
+        op = operation.get('op')
+
+        if op == 'add':
+            product_id, variant_id = str(operation.get('product_id') or ''), str(operation.get('variant_id') or '')
+            quantity = _operation_quantity(index, operation)
+            variant = lookup_variant(product_id, variant_id) if product_id and variant_id else None
+            if not variant:
+                raise CartOperationError(index, "Variant not found.")
+            if not (variant['is_enabled'] and variant['is_available']):
+                raise CartOperationError(index, f"{variant['product_title']} ({variant['title']}) is unavailable.")
+            add_item(
+                cart, f"{product_id}-{variant_id}", quantity, touch=False,
+                printify_product_id=product_id,
+                variant_id=variant_id,
+                title=variant['product_title'],
+                variant_title=variant['title'] or 'N/A',
+                price_kobo=variant['price_kobo'],
+                image_url=variant['image_url'] or NO_IMAGE_URL,
+                is_custom=False,
+            )
+
+        elif op == 'add_custom_design':
+            quantity = _operation_quantity(index, operation)
+            design_id = str(operation.get('custom_design_id') or '')
+            design = CustomDesign.objects.select_related('product').filter(id=design_id, user=user).first() if design_id.isdigit() else None
+            if design is None:
+                raise CartOperationError(index, "Custom design not found.")
+            if design.status not in CART_READY_DESIGN_STATUSES:
+                raise CartOperationError(index, "Custom design is not in a valid state to be added to cart.")
+            add_item(
+                cart, f"custom_design_{design.id}", quantity, touch=False,
+                printify_product_id=design.product.printify_id,
+                custom_design=design,
+                title=design.product.title,
+                variant_title=f"Custom: {design.selected_size}, {design.selected_color}",
+                price_kobo=ngn_to_kobo(design.product.base_price_ngn),
+                image_url=design.design_image.url,
+                is_custom=True,
+            )
+            if design.status != 'added_to_cart':
+                design.status = 'added_to_cart'
+                design.save(update_fields=['status'])
+
+        elif op in ('set_quantity', 'remove'):
+            key = str(operation.get('key') or '')
+            quantity = _operation_quantity(index, operation, minimum=0) if op == 'set_quantity' else 0
+            if quantity:
+                if not set_quantity(cart, key, quantity, touch=False):
+                    raise CartOperationError(index, f"Item {key} is not in the cart.")
+            else:
+                removed = remove_item(cart, key, touch=False)
+                if removed is not None and removed.is_custom and removed.custom_design_id:
+                    removed_design_ids.append(removed.custom_design_id)
+
+        else:
+            raise CartOperationError(index, f"Unknown operation {op!r}.")
+
+    if operations:
+        _touch(cart)
+    return removed_design_ids
+
+
+def cart_summary(cart):
+    """JSON-ready lines and totals of the cart, as returned by the batch endpoint."""
+    pricing = CartPricing(cart_lines(cart))
+    return {
+        'items': [
+            {
+                'key': line.key,
+                'title': line.item.get('title'),
+                'variant_title': line.item.get('variant_title'),
+                'image_url': line.item.get('image_url'),
+                'is_custom': line.item.get('is_custom', False),
+                'quantity': line.quantity,
+                'unit_price_kobo': line.unit_kobo,
+                'line_total_kobo': line.total_kobo,
+            }
+            for line in pricing.lines
+        ],
+        'subtotal_kobo': pricing.subtotal_kobo,
+        'total_kobo': pricing.total_kobo,
+        'total_ngn': str(pricing.total_ngn),
+        'cart_total_items': len(pricing.lines),
+    }
@@ -0,0 +1,685 @@
+# shop/catalog.py
+"""
+Read-side helpers for the Printify catalog that sync_products_to_db stores
+in the local Product table. The storefront views use these instead of
+calling the Printify API on every page view.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import CatalogFacet, ExchangeRate, Product, ProductVariant, SyncRun
+from .printify import PrintifyAPI
+
+logger = logging.getLogger(__name__)
+
+# The current USD -> NGN rate is cached per process for this long (see current_usd_ngn_rate)
+EXCHANGE_RATE_CACHE_KEY = 'catalog:usd-ngn-rate'
+EXCHANGE_RATE_CACHE_SECONDS = 60
+
+PLACEHOLDER_IMAGE_URL = 'https://placehold.co/600x400?text=No+Image'
+
+# Bump when build_product_defaults changes what it stores, so the next sync
+# rewrites every product instead of skipping the unchanged ones.
+SYNC_TRANSFORM_VERSION = 4
+
+# Cache keys used to coordinate background product refreshes.
+REFRESH_LOCK_KEY = 'catalog:product-refresh:{printify_id}'
+REFRESH_FAILED_KEY = 'catalog:product-refresh-failed:{printify_id}'
+
+# Only the columns the product list renders; the rest stays in the database.
+PRODUCT_LIST_FIELDS = (
+    'printify_id', 'title', 'category', 'base_price_ngn', 'primary_image_url',
+    'variants_data', 'product_options_data',
+)
+
+# Compact columns for the JSON catalog API; no variant or option JSON is loaded.
+CATALOG_API_FIELDS = ('printify_id', 'title', 'category', 'base_price_ngn', 'primary_image_url')
+
+# ProductVariant columns read by lookup_variant/lookup_variants for cart and checkout.
+VARIANT_LOOKUP_COLUMNS = ('title', 'price_kobo', 'is_enabled', 'is_available', 'image_url', 'product_id', 'product__title', 'product__printify_print_provider_id')
+
+CATALOG_PAGE_SIZE = 24
+CATALOG_MAX_PAGE_SIZE = 100
+
+# (category, URL slug, title keywords), checked in order. The first match wins.
+CATEGORY_RULES = [
+    ("Hoodies & Sweatshirts", 'hoodies', ("hoodie", "hooded sweatshirt")),
+    ("T-Shirts", 't-shirts', ("t-shirt", "tee")),
+    ("Joggers & Sweatpants", 'joggers', ("jogger", "sweatpants")),
+    ("Tank Tops", 'tank-tops', ("tank top",)),
+    ("Mugs", 'mugs', ("mug",)),
+    ("Posters & Wall Art", 'posters', ("poster",)),
+]
+DEFAULT_CATEGORY = "Other"
+
+# Printify option types counted as facets
+FACET_OPTION_TYPES = ('color', 'size')
+
+
+def use_local_catalog():
+    """Returns True when the storefront should read from the local Product table."""
+    return settings.CATALOG_READ_MODE == 'local'
+
+
+def last_completed_sync_at():
+    """When the last successful full sync finished (it confirms unchanged rows without rewriting them)."""
+    return (
+        SyncRun.objects.filter(status='succeeded', finished_at__isnull=False)
+        .order_by('-finished_at').values_list('finished_at', flat=True).first()
+    )
+
+
+def catalog_last_synced_at():
+    """
+    Returns when the catalog was last confirmed against Printify: the later of the last
+    successful full sync and the newest Product.last_synced_at. None if nothing was synced yet.
+    """
+    latest_row = Product.objects.aggregate(latest=Max('last_synced_at'))['latest']
+    return max(filter(None, [latest_row, last_completed_sync_at()]), default=None)
+
+
+def product_synced_at(product):
+    """
+    When this product's data was last confirmed against Printify. A completed full sync
+    confirms unchanged products without rewriting their rows.
+    """
+    return max(filter(None, [product.last_synced_at, last_completed_sync_at()]), default=None)
+
+
+def is_fresh(synced_at, max_age_seconds=None):
+    """
+    Checks a sync timestamp against the freshness threshold
+    (settings.CATALOG_MAX_AGE_SECONDS unless max_age_seconds is given).
+    """
+    if synced_at is None:
+        return False
+    if max_age_seconds is None:
+        max_age_seconds = settings.CATALOG_MAX_AGE_SECONDS
+    return timezone.now() - synced_at <= timedelta(seconds=max_age_seconds)
+
+
+def published_products(category=None, fields=PRODUCT_LIST_FIELDS):
+    """Published products (optionally one category) with only the given columns loaded."""
+    products = Product.objects.filter(is_published=True)
+    if category:
+        products = products.filter(category=category)
+    return products.only(*fields)
+
+
+def encode_cursor(direction, product):
+    """Opaque keyset cursor for the product just before/after a page boundary."""
+    raw = json.dumps([direction, product.title, product.pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (direction, title, pk) from encode_cursor. Raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        direction, title, pk = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor.") from e
+    if direction not in ('next', 'prev') or not isinstance(title, str) or not isinstance(pk, int):
+        raise ValueError("Invalid cursor.")
+    return direction, title, pk
+
+
+def catalog_page(category=None, cursor=None, page_size=CATALOG_PAGE_SIZE, fields=PRODUCT_LIST_FIELDS):
+    """
+    One page of published products in (title, id) order using keyset pagination: the page
+    starts right after (or ends right before) the product encoded in `cursor`, so every page
+    is a single indexed range query however deep the visitor goes.
+    Returns (products, next_cursor, prev_cursor); a cursor is None at that end of the catalog.
+    Raises ValueError for a malformed cursor.
+    """
+    page_size = max(1, min(page_size, CATALOG_MAX_PAGE_SIZE))
+    products = published_products(category, fields)
+
+    direction = None
+    if cursor:
+        direction, title, pk = decode_cursor(cursor)
+        if direction == 'next':
+            products = products.filter(Q(title__gt=title) | Q(title=title, pk__gt=pk))
+        else:
+            products = products.filter(Q(title__lt=title) | Q(title=title, pk__lt=pk))
+    products = products.order_by('-title', '-pk') if direction == 'prev' else products.order_by('title', 'pk')
+
+    rows = list(products[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'prev':
+        rows.reverse()
+
+    has_next = has_more if direction != 'prev' else True
+    has_prev = has_more if direction == 'prev' else direction == 'next'
+    next_cursor = encode_cursor('next', rows[-1]) if rows and has_next else None
+    prev_cursor = encode_cursor('prev', rows[0]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+
+def infer_category_from_title(title):
+    """
+    Infers a product category based on keywords in its title.
+    This is a simple heuristic and can be expanded (see CATEGORY_RULES).
+    """
+    title_lower = (title or '').lower()
+    for category, _slug, keywords in CATEGORY_RULES:
+        if any(keyword in title_lower for keyword in keywords):
+            return category
+    return DEFAULT_CATEGORY
+
+
+def resolve_category(value):
+    """
+    Maps a ?category= value (a slug like 'hoodies' or the full category name, any case)
+    to the stored category name. Returns None if it matches no category.
+    """
+    value = (value or '').strip().lower()
+    if not value:
+        return None
+    for category, slug, _keywords in CATEGORY_RULES + [(DEFAULT_CATEGORY, 'other', ())]:
+        if value in (slug, category.lower()):
+            return category
+    return None
+
+
+def category_slug(category):
+    """URL slug for a stored category name."""
+    return next((slug for name, slug, _keywords in CATEGORY_RULES if name == category), 'other')
+
+
+def option_facet_values(product_options_data):
+    """
+    Returns {'color': {...}, 'size': {...}}: the option value titles a product offers,
+    read from its stored Printify options.
+    """
+    values = {facet: set() for facet in FACET_OPTION_TYPES}
+    for option in product_options_data or []:
+        facet = option.get('type')
+        if facet in values:
+            values[facet].update(v.get('title') for v in option.get('values', []) if v.get('title'))
+    return values
+
+
+def rebuild_catalog_facets():
+    """
+    Recomputes the CatalogFacet table from the published products: product counts per
+    category, and per color/size for the whole catalog and within each category.
+    Reads only the category and options columns, one product at a time.
+    """
+    counts = {}
+    for category, options in (
+        Product.objects.filter(is_published=True)
+        .values_list('category', 'product_options_data').iterator(chunk_size=1000)
+    ):
+        for facet, facet_values in option_facet_values(options).items():
+            for value in facet_values:
+                for scope in ('', category):
+                    key = (facet, scope, value[:100])
+                    counts[key] = counts.get(key, 0) + 1
+
+    category_counts = (
+        Product.objects.filter(is_published=True)
+        .values('category').annotate(n=Count('id')).values_list('category', 'n')
+    )
+    facets = [CatalogFacet(facet='category', value=category, product_count=n) for category, n in category_counts]
+    facets += [CatalogFacet(facet=facet, category=scope, value=value, product_count=n) for (facet, scope, value), n in counts.items()]
+
+    with transaction.atomic():
+        CatalogFacet.objects.all().delete()
+        CatalogFacet.objects.bulk_create(facets, batch_size=500)
+    logger.info(f"🏷️ Rebuilt {len(facets)} catalog facets.")
+    return len(facets)
+
+
+def product_facet_keys(printify_id):
+    """
+    The (facet, category scope, value) CatalogFacet keys one stored product counts towards;
+    empty unless it is published. Read before and after a single-product change.
+    """
+    row = Product.objects.filter(printify_id=str(printify_id), is_published=True).values_list('category', 'product_options_data').first()
+    if row is None:
+        return set()
+    category, options = row
+    keys = {('category', '', category)}
+    for facet, facet_values in option_facet_values(options).items():
+        for value in facet_values:
+            for scope in ('', category):
+                keys.add((facet, scope, value[:100]))
+    return keys
+
+
+def _facet_filter(keys):
+    condition = Q()
+    for facet, scope, value in keys:
+        condition |= Q(facet=facet, category=scope, value=value)
+    return condition
+
+
+def adjust_catalog_facets(keys_before, keys_after):
+    """
+    Moves the facet counts by one product's change, in a few queries instead of a full
+    rebuild: -1 for the facets it left (dropping rows that reach 0), +1 for those it joined.
+    """
+    left, joined = keys_before - keys_after, keys_after - keys_before
+    if not left and not joined:
+        return
+    with transaction.atomic():
+        if left:
+            CatalogFacet.objects.filter(_facet_filter(left), product_count__gt=0).update(product_count=F('product_count') - 1)
+            CatalogFacet.objects.filter(_facet_filter(left), product_count=0).delete()
+        if joined:
+            CatalogFacet.objects.bulk_create(
+                [CatalogFacet(facet=facet, category=scope, value=value, product_count=0) for facet, scope, value in joined],
+                ignore_conflicts=True,
+            )
+            CatalogFacet.objects.filter(_facet_filter(joined)).update(product_count=F('product_count') + 1)
+
+
+def catalog_facets(category=None):
+    """
+    Returns the precomputed facet counts for the list page:
+    {'category': [(name, slug, count), ...], 'color': [(value, count), ...], 'size': [...]}.
+    Color and size counts are scoped to `category` when one is given.
+    """
+    facets = {'category': [], 'color': [], 'size': []}
+    rows = CatalogFacet.objects.filter(facet='category') | CatalogFacet.objects.filter(facet__in=FACET_OPTION_TYPES, category=category or '')
+    for facet, value, count in rows.order_by('facet', '-product_count', 'value').values_list('facet', 'value', 'product_count'):
+        if facet == 'category':
+            facets['category'].append((value, category_slug(value), count))
+        else:
+            facets[facet].append((value, count))
+    return facets
+
+
+def product_to_list_item(product):
+    """
+    Builds the dict the product list template expects from a local Product row.
+    variants_data is already stored in the processed shape (id, title, price_ngn, ...),
+    so no price conversion happens here.
+    """
+    return {
+        'id': product.printify_id,
+        'title': product.title,
+        'price': float(product.base_price_ngn),
+        'image_url': product.primary_image_url or PLACEHOLDER_IMAGE_URL,
+        'variants': product.variants_data or [],
+        'options': product.product_options_data or [],
+    }
+
+
+def product_to_api_item(product):
+    """Compact JSON representation of a product for the catalog and search APIs."""
+    return {
+        'id': product.printify_id,
+        'title': product.title,
+        'category': product.category,
+        'price': float(product.base_price_ngn),
+        'image_url': product.primary_image_url or PLACEHOLDER_IMAGE_URL,
+        'url': reverse('product_detail', kwargs={'product_id': product.printify_id}),
+    }
+
+
+def current_exchange_rate():
+    """The ExchangeRate in effect now, or None if none was added yet."""
+    return ExchangeRate.objects.filter(effective_at__lte=timezone.now()).order_by('-effective_at', '-id').first()
+
+
+def current_usd_ngn_rate():
+    """
+    The USD -> NGN rate in effect now (settings.USD_TO_NGN_RATE until an ExchangeRate exists).
+    Cached for EXCHANGE_RATE_CACHE_SECONDS so pricing code never queries it per product.
+    """
+    rate = cache.get(EXCHANGE_RATE_CACHE_KEY)
+    if rate is None:
+        current = current_exchange_rate()
+        rate = current.usd_to_ngn if current else settings.USD_TO_NGN_RATE
+        cache.set(EXCHANGE_RATE_CACHE_KEY, rate, EXCHANGE_RATE_CACHE_SECONDS)
+    return rate
+
+
+def cents_to_ngn(price_cents, rate=None):
+    """Converts a Printify USD-cents price to NGN at `rate` (default: the current rate), rounded to the kobo."""
+    rate = current_usd_ngn_rate() if rate is None else rate
+    return ((Decimal(price_cents) / Decimal('100.0')) * rate).quantize(Decimal('0.01'), ROUND_HALF_UP)
+
+
+def option_value_titles(product_options_data):
+    """Maps each Printify option value ID to (option type, value title), e.g. '521' -> ('color', 'Black')."""
+    return {
+        str(value.get('id')): (option.get('type'), value.get('title'))
+        for option in product_options_data or []
+        for value in option.get('values', [])
+    }
+
+
+def variant_option_types(variant, value_titles):
+    """Returns {'color': ..., 'size': ...} (whichever the variant has) for one processed variant."""
+    by_type = dict(value_titles[oid] for oid in variant['option_value_ids'] if oid in value_titles)
+    if not by_type and ' / ' in (variant['title'] or ''):
+        # Older products without typed options: titles read "Color / Size"
+        by_type = dict(zip(('color', 'size'), variant['title'].split(' / ', 1)))
+    return by_type
+
+
+def normalize_option_title(title):
+    """Case- and whitespace-insensitive form of an option title: ' Sport  Grey' -> 'sport grey'."""
+    return ' '.join(str(title or '').split()).lower()
+
+
+def variant_map_key(color, size):
+    """Key of Product.variant_map for a (color, size) selection, e.g. 'black|m'. Either part may be empty."""
+    return f"{normalize_option_title(color)}|{normalize_option_title(size)}"
+
+
+def build_variant_map(pd, proc_vars):
+    """
+    Builds Product.variant_map: normalized 'color|size' -> Printify variant ID, for the
+    enabled and available variants only. Combinations missing from the map cannot be ordered.
+    """
+    value_titles = option_value_titles(pd.get('options'))
+    variant_map = {}
+    for v in proc_vars:
+        if v['is_enabled'] and v['is_available']:
+            by_type = variant_option_types(v, value_titles)
+            variant_map.setdefault(variant_map_key(by_type.get('color'), by_type.get('size')), v['id'])
+    return variant_map
+
+
+def resolve_variant_id(product, color, size):
+    """
+    Returns the Printify variant ID for a color/size selection on `product` from its
+    precomputed variant_map, or None if that combination is not orderable.
+    """
+    return (product.variant_map or {}).get(variant_map_key(color, size))
+
+
+def build_variant_rows(pd, proc_vars):
+    """
+    Builds the ProductVariant field values for one Printify product from its processed
+    variants: price in kobo, color and size titles resolved from the option value IDs,
+    and the first product image tagged with the variant (default image first).
+    """
+    images = sorted(pd.get('images', []), key=lambda img: not img.get('is_default', False))
+    primary_image = pd.get('images', [{}])[0].get('src', '') if pd.get('images') else ''
+    variant_images = {}
+    for img in images:
+        for vid in img.get('variant_ids', []):
+            variant_images.setdefault(str(vid), img.get('src'))
+
+    value_titles = option_value_titles(pd.get('options'))
+    rate = current_usd_ngn_rate()
+    rows = []
+    for v in proc_vars:
+        by_type = variant_option_types(v, value_titles)
+        rows.append({
+            'printify_variant_id': v['id'],
+            'title': (v['title'] or '')[:255],
+            'sku': (v['sku'] or '')[:100],
+            'option_value_ids': '|'.join(sorted(v['option_value_ids'], key=lambda oid: (len(oid), oid))),
+            'price_cents': v['price_cents'],
+            'color': (by_type.get('color') or '')[:100],
+            'size': (by_type.get('size') or '')[:100],
+            'price_kobo': int(cents_to_ngn(v['price_cents'], rate) * 100),
+            'is_enabled': v['is_enabled'],
+            'is_available': v['is_available'],
+            'image_url': variant_images.get(v['id'], primary_image) or '',
+        })
+    return rows
+
+
+def save_product_variants(products):
+    """
+    Upserts the ProductVariant rows of already-saved products and deletes variants that
+    Printify no longer lists. `products` is a list of (product_pk, pd, proc_vars).
+    """
+    now = timezone.now()
+    variants = [
+        ProductVariant(product_id=product_pk, last_synced_at=now, **row)
+        for product_pk, pd, proc_vars in products
+        for row in build_variant_rows(pd, proc_vars)
+    ]
+    with transaction.atomic():
+        ProductVariant.objects.bulk_create(
+            variants,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['product', 'printify_variant_id'],
+            update_fields=['title', 'sku', 'option_value_ids', 'color', 'size', 'price_cents', 'price_kobo', 'is_enabled', 'is_available', 'image_url', 'last_synced_at'],
+        )
+        ProductVariant.objects.filter(product_id__in=[pk for pk, _pd, _vars in products], last_synced_at__lt=now).delete()
+    return len(variants)
+
+
+def lookup_variant(printify_id, variant_id):
+    """
+    Resolves one (Printify product ID, variant ID) pair with a single indexed ProductVariant
+    query. Returns 'title', 'price_kobo', 'is_enabled', 'is_available', 'image_url' plus
+    'product_pk', 'product_title' and 'print_provider_id', or None if the product or variant is unknown.
+    """
+    row = (
+        ProductVariant.objects.filter(product__printify_id=str(printify_id), printify_variant_id=str(variant_id))
+        .values(*VARIANT_LOOKUP_COLUMNS)
+        .first()
+    )
+    return _variant_lookup_result(row) if row else None
+
+
+def lookup_variants(pairs):
+    """
+    Resolves many (Printify product ID, variant ID) pairs with one query.
+    Returns {(printify_id, variant_id): lookup_variant() dict} for the pairs that exist, keyed by strings.
+    """
+    wanted = {(str(printify_id), str(variant_id)) for printify_id, variant_id in pairs}
+    if not wanted:
+        return {}
+    rows = ProductVariant.objects.filter(
+        product__printify_id__in={p for p, _ in wanted},
+        printify_variant_id__in={v for _, v in wanted},
+    ).values(*VARIANT_LOOKUP_COLUMNS, 'product__printify_id', 'printify_variant_id')
+    found = {}
+    for row in rows:
+        key = (row['product__printify_id'], row['printify_variant_id'])
+        if key in wanted:
+            found[key] = _variant_lookup_result(row)
+    return found
+
+
+def _variant_lookup_result(row):
+    return {
+        'title': row['title'],
+        'price_kobo': row['price_kobo'],
+        'is_enabled': row['is_enabled'],
+        'is_available': row['is_available'],
+        'image_url': row['image_url'],
+        'product_pk': row['product_id'],
+        'product_title': row['product__title'],
+        'print_provider_id': row['product__printify_print_provider_id'],
+    }
+
+
+def product_content_hash(pd):
+    """
+    Hash of everything that determines a product's stored fields: the raw Printify
+    product and the transform version. Exchange-rate changes are applied to stored
+    prices by reprice_catalog, so they do not force a rewrite.
+    """
+    payload = json.dumps([pd, SYNC_TRANSFORM_VERSION], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def build_product_defaults(pd, content_hash=None):
+    """
+    Transforms one product dict from the Printify API into the field values stored
+    on the local Product model. Shared by the full sync and single-product refreshes.
+    Pass content_hash if the caller already computed product_content_hash(pd).
+    """
+    vars_api = pd.get("variants", [])
+    rate = current_usd_ngn_rate() # Read once per product, not per variant
+
+    # Print provider ID is usually available at the product level or in variants
+    print_provider_id = pd.get('print_provider_id')
+    if not print_provider_id and vars_api: # Fallback to first variant's print_provider_id
+        print_provider_id = vars_api[0].get('print_provider_id')
+
+    proc_vars = []
+    for v_api in vars_api:
+        v_p_cents = v_api.get("price", 0)
+        proc_vars.append({
+            "id": str(v_api.get("id")),
+            "title": v_api.get("title"),
+            "price_cents": v_p_cents,
+            "price_ngn": float(cents_to_ngn(v_p_cents, rate)),
+            "sku": v_api.get("sku"),
+            "is_available": v_api.get("is_available", True),
+            "is_enabled": v_api.get("is_enabled", True),
+            'option_value_ids': [str(opt_id) for opt_id in v_api.get('options', [])]
+        })
+
+    # Get base price from the first variant if available
+    p_cents = vars_api[0].get("price", 0) if vars_api else 0
+
+    return {
+        'title': pd.get("title", "N/A"),
+        'category': infer_category_from_title(pd.get("title", "")),
+        'description': pd.get("description", ""),
+        'base_price_ngn': cents_to_ngn(p_cents, rate),
+        'primary_image_url': pd.get("images", [{}])[0].get("src", ""),
+        'image_urls': [img['src'] for img in pd.get("images", []) if img.get('src')], # Gallery on the detail page
+        'variants_data': proc_vars, # Store all variants data (ProductVariant rows are saved alongside)
+        'variant_map': build_variant_map(pd, proc_vars),
+        'product_options_data': pd.get('options', []), # Store all options data
+        'tags': pd.get('tags', []),
+        'printify_shop_id': settings.PRINTIFY_SHOP_ID,
+        'printify_blueprint_id': pd.get('blueprint_id'),
+        'printify_print_provider_id': print_provider_id,
+        'is_published': pd.get('visible', True),
+        'last_synced_at': timezone.now(),
+        'content_hash': content_hash or product_content_hash(pd),
+        'printify_updated_at': parse_datetime(pd['updated_at']) if pd.get('updated_at') else None,
+        'removed_from_printify_at': None,
+        # 'mockup_image' is set manually in Django admin for each product
+    }
+
+
+def product_to_detail(product):
+    """
+    Builds the dict the product detail template expects from a local Product row.
+    """
+    opts = [
+        {
+            'name': o.get('name'),
+            'type': o.get('type'),
+            'values': [{'id': str(v.get('id')), 'title': v.get('title')} for v in o.get('values', [])],
+        }
+        for o in (product.product_options_data or [])
+    ]
+    variants = product.variants_data or []
+    image_urls = product.image_urls or ([product.primary_image_url] if product.primary_image_url else [])
+    return {
+        'id': product.printify_id,
+        'title': product.title,
+        'description': product.description or '',
+        'images': [{'src': src} for src in image_urls],
+        'options': opts,
+        'variants': variants,
+        'price': variants[0].get('price_ngn', 0.0) if variants else float(product.base_price_ngn),
+        'mockup_image_url': product.mockup_image.url if product.mockup_image else None,
+    }
+
+
+def refresh_product(printify_id):
+    """
+    Fetches one product from Printify and upserts it into the Product table.
+    Returns the Product, or None if Printify could not be reached.
+    """
+    try:
+        client = PrintifyAPI()
+    except ValueError:
+        return None
+    item = client.get_product_details(settings.PRINTIFY_SHOP_ID, printify_id)
+    if not item or item.get('error') or not item.get('id'):
+        logger.error(f"❌ Could not refresh product {printify_id}: {(item or {}).get('error', 'empty response')}")
+        return None
+    return upsert_product(item)
+
+
+def upsert_product(pd):
+    """Saves one Printify product and its variants. Returns the Product."""
+    defaults = build_product_defaults(pd)
+    with transaction.atomic():
+        product, _ = Product.objects.update_or_create(printify_id=str(pd['id']), defaults=defaults)
+        save_product_variants([(product.pk, pd, defaults['variants_data'])])
+    return product
+
+
+def mark_product_removed(printify_id):
+    """
+    Unpublishes one product that was deleted in Printify and stamps removed_from_printify_at.
+    Clears the content hash, so the next sync republishes the product if it is back.
+    Returns True if a stored product was changed.
+    """
+    now = timezone.now()
+    return bool(
+        Product.objects.filter(printify_id=str(printify_id), removed_from_printify_at__isnull=True)
+        .update(is_published=False, removed_from_printify_at=now, content_hash='', last_synced_at=now, updated_at=now)
+    )
+
+
+def invalidate_product_caches(printify_id, facet_keys_before=None):
+    """
+    Drops cached state derived from one product after it changed outside a full sync.
+    Given the product_facet_keys() read before the change, also moves the catalog facet
+    counts by just this product; the full rebuild is left to the next sync.
+    """
+    cache.delete_many([
+        REFRESH_LOCK_KEY.format(printify_id=printify_id),
+        REFRESH_FAILED_KEY.format(printify_id=printify_id),
+    ])
+    if facet_keys_before is not None:
+        adjust_catalog_facets(facet_keys_before, product_facet_keys(printify_id))
+
+
+def _refresh_product_worker(printify_id):
+    try:
+        if refresh_product(printify_id):
+            cache.delete(REFRESH_FAILED_KEY.format(printify_id=printify_id))
+            logger.info(f"🔄 Refreshed product {printify_id} in the background.")
+        else:
+            cache.set(REFRESH_FAILED_KEY.format(printify_id=printify_id), True, settings.PRODUCT_DETAIL_TTL_SECONDS)
+    except Exception:
+        logger.exception(f"❌ Background refresh of product {printify_id} failed:")
+        cache.set(REFRESH_FAILED_KEY.format(printify_id=printify_id), True, settings.PRODUCT_DETAIL_TTL_SECONDS)
+    finally:
+        cache.delete(REFRESH_LOCK_KEY.format(printify_id=printify_id))
+        connections.close_all() # This thread opened its own DB connection
+
+
+def refresh_product_in_background(printify_id):
+    """
+    Starts a background refresh of one product unless one is already running.
+    Returns immediately; the caller keeps serving the stored data.
+    """
+    if not cache.add(REFRESH_LOCK_KEY.format(printify_id=printify_id), True, 60):
+        return False
+    threading.Thread(target=_refresh_product_worker, args=(printify_id,), daemon=True).start()
+    return True
+
+
+def last_refresh_failed(printify_id):
+    """True if the most recent background refresh of this product could not reach Printify."""
+    return bool(cache.get(REFRESH_FAILED_KEY.format(printify_id=printify_id)))
@@ -0,0 +1,178 @@
+# shop/checkout.py
+"""
+Paystack checkouts and their completion.
+
+checkout_submit stores a PendingCheckout (keyed by the Paystack reference) before sending
+the customer to Paystack; the session only keeps the reference. Once Paystack confirms the
+payment, complete_checkout() turns the record into an Order and queues it for Printify
+(shop/fulfilment.py). Status changes go through
+transition_checkout(), a conditional UPDATE, so the callback and the webhook can both try
+to complete the same checkout and exactly one of them creates the order.
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .cart import clear_cart, load_cart_references
+from .fulfilment import enqueue_printify_order
+from .models import CustomDesign, Order, OrderItem, PendingCheckout
+from .pricing import kobo_to_ngn, line_unit_kobo
+
+logger = logging.getLogger(__name__)
+
+# Keys of PendingCheckout.customer, copied onto the Order
+CUSTOMER_FIELDS = ('first_name', 'last_name', 'email', 'phone', 'address', 'city', 'state', 'zipcode', 'country')
+
+
+def transition_checkout(pending, to_status, **fields):
+    """
+    Moves `pending` to `to_status` if its current status allows it (PendingCheckout.TRANSITIONS),
+    also setting `fields`. Returns True if this call made the change; `pending` is updated in place.
+    """
+    allowed_from = [status for status, targets in PendingCheckout.TRANSITIONS.items() if to_status in targets]
+    updated = PendingCheckout.objects.filter(pk=pending.pk, status__in=allowed_from).update(
+        status=to_status, updated_at=timezone.now(), **fields
+    )
+    if updated:
+        pending.status = to_status
+        for name, value in fields.items():
+            setattr(pending, name, value)
+    return bool(updated)
+
+
+def create_pending_checkout(reference, user, cart, pricing, customer, printify_order):
+    """Records a checkout about to be sent to Paystack. `pricing` is the CartPricing of the cart being paid for."""
+    return PendingCheckout.objects.create(
+        reference=reference,
+        user=user if user is not None and user.is_authenticated else None,
+        cart=cart,
+        amount_kobo=pricing.total_kobo,
+        customer={name: customer.get(name, '') for name in CUSTOMER_FIELDS},
+        lines=pricing.snapshot(),
+        printify_order=printify_order,
+    )
+
+
+def fail_checkout(pending, error):
+    """Marks a checkout whose payment failed (or could not be started). Returns True if the status changed."""
+    changed = transition_checkout(pending, 'failed', last_error=str(error)[:1000])
+    if changed:
+        logger.warning(f"⚠️ Checkout {pending.reference} failed: {error}")
+    return changed
+
+
+def completed_order(reference):
+    """The Order already created for a Paystack reference, or None. One read on the unique paystack_reference index."""
+    return Order.objects.filter(paystack_reference=reference).first()
+
+
+def _insert_order(pending):
+    """
+    Inserts the Order row of a paid checkout, or fetches the one already stored under its
+    reference (the unique paystack_reference decides, not a prior exists() check).
+    Returns (order, created).
+    """
+    try:
+        with transaction.atomic():
+            return Order.objects.create(
+                user=pending.user,
+                total_amount=kobo_to_ngn(pending.amount_kobo),
+                paid=True,
+                paystack_reference=pending.reference,
+                external_id=pending.printify_order.get('external_id') or f"hoxobil_order_{pending.reference}",
+                printify_status='queued',
+                **{name: pending.customer.get(name) or '' for name in CUSTOMER_FIELDS},
+            ), True
+    except IntegrityError:
+        order = completed_order(pending.reference)
+        if order is None:
+            raise
+        return order, False
+
+
+def _create_order(pending):
+    """
+    Creates the Order and its OrderItems for a paid checkout, or returns the existing order
+    for its reference. Runs inside complete_checkout's transaction. Returns (order, created).
+    """
+    order, created = _insert_order(pending)
+    if not created:
+        logger.warning(f"⚠️ Order {order.id} already existed for checkout {pending.reference}; no items added.")
+        return order, False
+
+    lines = pending.lines
+
+    # Everything the order rows refer to is loaded up front (two queries)
+    standard_variants, custom_designs = load_cart_references(lines, pending.user)
+    order_items = []
+    ordered_design_ids = []
+    for item_data in lines.values():
+        custom_design_id = item_data.get('custom_design_id')
+        custom_design_obj = None
+        product_pk = None
+
+        if custom_design_id:
+            custom_design_obj = custom_designs.get(int(custom_design_id)) if str(custom_design_id).isdigit() else None
+            if custom_design_obj:
+                product_pk = custom_design_obj.product_id # The base product
+                ordered_design_ids.append(custom_design_obj.id)
+            else:
+                # The item is still recorded, without its design
+                logger.warning(f"⚠️ CustomDesign {custom_design_id} not found during order item creation for order {order.id}.")
+        else:
+            # For standard product, resolve the local Product ID from the variant index
+            variant = standard_variants.get((str(item_data.get('id')), str(item_data.get('variant_id'))))
+            if variant:
+                product_pk = variant['product_pk']
+            else:
+                logger.warning(f"⚠️ Product with Printify ID {item_data.get('id')} not found for order item {order.id}.")
+
+        order_items.append(OrderItem(
+            order=order,
+            product_id=product_pk,
+            custom_design=custom_design_obj,
+            product_title=item_data.get('title'),
+            variant_title=item_data.get('variant_title'),
+            quantity=item_data.get('quantity'),
+            price_at_purchase=kobo_to_ngn(line_unit_kobo(item_data)),
+            printify_variant_id=item_data.get('variant_id'),
+        ))
+    OrderItem.objects.bulk_create(order_items)
+    # Mark the custom designs as part of an order
+    if ordered_design_ids:
+        CustomDesign.objects.filter(id__in=ordered_design_ids).update(status='order_created')
+    # Submitted to Printify by the outbox worker once this transaction commits
+    enqueue_printify_order(order, pending.printify_order)
+    return order, True
+
+
+def complete_checkout(pending):
+    """
+    Creates the Order of a checkout whose payment Paystack has confirmed, queues its
+    Printify submission and empties the cart it came from. Safe to call repeatedly and
+    concurrently: the status change to 'paid', the order, its items and the design status
+    changes are committed together, so only one caller creates the order. A duplicate
+    call returns the existing order from a single indexed read.
+
+    Returns (order, created). order is None if the checkout cannot be completed (e.g. it is
+    being completed by another request right now).
+    """
+    if pending.status == 'completed':
+        return completed_order(pending.reference), False
+    try:
+        with transaction.atomic():
+            if not transition_checkout(pending, 'paid'):
+                # Completed (or being completed) by another callback or webhook delivery
+                return completed_order(pending.reference), False
+            order, created = _create_order(pending)
+            transition_checkout(pending, 'completed', order=order, completed_at=timezone.now(), last_error='')
+    except Exception as e:
+        pending.refresh_from_db(fields=['status', 'order'])
+        PendingCheckout.objects.filter(pk=pending.pk).update(last_error=f"Order creation failed: {e}"[:1000])
+        raise
+
+    if created:
+        logger.info(f"📝 Order {order.id} created for checkout {pending.reference} ({len(pending.lines)} item(s)).")
+    clear_cart(pending.cart)
+    return order, created
@@ -0,0 +1,19 @@
+# shop/context_processors.py
+from django.utils.functional import SimpleLazyObject
+
+from .cart import CART_SESSION_KEY
+from .models import CartItem
+
+
+def cart(request):
+    """
+    Adds `cart_item_count` (number of cart lines, for the header badge). It is counted
+    on first use in a template, with one query.
+    """
+    def count():
+        if request.user.is_authenticated:
+            return CartItem.objects.filter(cart__user=request.user).count()
+        cart_id = request.session.get(CART_SESSION_KEY)
+        return CartItem.objects.filter(cart_id=cart_id).count() if cart_id else 0
+
+    return {'cart_item_count': SimpleLazyObject(count)}
@@ -0,0 +1,276 @@
+# shop/fulfilment.py
+"""
+Submission of paid orders to Printify through a transactional outbox.
+
+complete_checkout() writes a PrintifyOrderOutbox entry in the same transaction as the
+Order, and `manage.py process_printify_outbox` submits due entries with retries and
+exponential backoff. Each payload carries the order's external_id; before re-submitting an
+entry whose earlier attempt may have reached Printify, the worker looks for an existing
+Printify order with that external_id, so a retry never creates a second order.
+
+Once submitted, `manage.py reconcile_printify_orders` pages through the shop's Printify
+orders and copies their status and tracking details onto the matching Orders (and marks
+custom designs fulfilled). Printify lists orders newest first and cannot filter by update
+time, so the high-water mark is the creation time of the oldest order that is not yet in
+a final state: older orders cannot change any more, and paging stops there.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import CustomDesign, Order, PrintifyOrderOutbox
+from .printify import PrintifyAPI
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 20
+# Entries a worker claimed but did not finish within this time (worker killed) are retried
+OUTBOX_LOCK_SECONDS = 10 * 60
+# Printify orders read per page when looking for an external_id before a retry
+EXISTING_ORDER_PAGE_SIZE = 50
+# Orders created this long before the outbox entry are still searched (clock skew)
+EXISTING_ORDER_SEARCH_MARGIN = timedelta(hours=1)
+
+# Printify order statuses after which nothing about the order changes
+PRINTIFY_FINAL_STATUSES = ('fulfilled', 'canceled')
+RECONCILE_PAGE_SIZE = 50
+# Safety stop for a single reconciliation run
+RECONCILE_MAX_PAGES = 40
+# Printify creates its order after ours (via the outbox); also allows for clock skew
+RECONCILE_WATERMARK_MARGIN = timedelta(hours=1)
+
+
+def enqueue_printify_order(order, payload):
+    """Queues the Printify submission of `order`. Call inside the transaction that creates the order."""
+    payload = dict(payload, external_id=order.external_id)
+    return PrintifyOrderOutbox.objects.create(order=order, payload=payload)
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of failed attempts: doubling from PRINTIFY_ORDER_RETRY_BACKOFF, capped."""
+    return min(settings.PRINTIFY_ORDER_RETRY_BACKOFF * 2 ** max(attempts - 1, 0), settings.PRINTIFY_ORDER_RETRY_MAX_DELAY)
+
+
+def release_stale_entries():
+    """Puts entries left in 'processing' by a worker that stopped back in the queue."""
+    cutoff = timezone.now() - timedelta(seconds=OUTBOX_LOCK_SECONDS)
+    return PrintifyOrderOutbox.objects.filter(status='processing', locked_at__lt=cutoff).update(status='pending', locked_at=None)
+
+
+def claim_due_entries(limit=OUTBOX_BATCH_SIZE):
+    """
+    Atomically moves up to `limit` due entries to 'processing' and returns them.
+    Safe when several workers poll the outbox at once. The claim also counts the attempt,
+    so an attempt cut short by a crash is still known to have happened.
+    """
+    now = timezone.now()
+    claimed = []
+    due_ids = PrintifyOrderOutbox.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at').values_list('id', flat=True)[:limit]
+    for entry_id in due_ids:
+        if PrintifyOrderOutbox.objects.filter(id=entry_id, status='pending').update(status='processing', locked_at=now, attempts=F('attempts') + 1):
+            claimed.append(entry_id)
+    return list(PrintifyOrderOutbox.objects.select_related('order').filter(id__in=claimed).order_by('next_attempt_at'))
+
+
+def _printify_external_id(printify_order):
+    return printify_order.get('external_id') or (printify_order.get('metadata') or {}).get('shop_order_id')
+
+
+def find_existing_printify_order(api, shop_id, external_id, since=None):
+    """
+    Looks for a Printify order already created with `external_id` (Printify reports it as
+    external_id, or as metadata.shop_order_id). Pages through the shop's orders, newest
+    first, until they were created before `since` (an order cannot predate its outbox
+    entry), or through all of them if `since` is None. Returns the order or None.
+    """
+    page = 1
+    while True:
+        result = api.get_orders(shop_id, limit=EXISTING_ORDER_PAGE_SIZE, page=page)
+        if not isinstance(result, dict) or result.get('error'):
+            raise RuntimeError(f"Could not list Printify orders: {result.get('error') if isinstance(result, dict) else result}")
+        data = result.get('data', [])
+        for printify_order in data:
+            if _printify_external_id(printify_order) == external_id:
+                return printify_order
+        oldest = parse_datetime(str(data[-1].get('created_at') or '')) if data else None
+        if not data or page >= int(result.get('last_page') or page) or (since and oldest and oldest < since):
+            return None
+        page += 1
+
+
+def _mark_sent(entry, printify_order):
+    now = timezone.now()
+    with transaction.atomic():
+        PrintifyOrderOutbox.objects.filter(pk=entry.pk).update(status='sent', sent_at=now, locked_at=None, last_error='')
+        Order.objects.filter(pk=entry.order_id).update(
+            printify_order_id=str(printify_order['id']),
+            printify_status=printify_order.get('status') or 'submitted',
+            updated_at=now,
+        )
+    entry.status = 'sent'
+    logger.info(f"✅ Order {entry.order_id} submitted to Printify as {printify_order['id']} (attempt {entry.attempts}).")
+
+
+def _mark_failed_attempt(entry, error):
+    if entry.attempts >= settings.PRINTIFY_ORDER_MAX_ATTEMPTS:
+        entry.status = 'failed'
+        next_attempt_at = timezone.now()
+        Order.objects.filter(pk=entry.order_id).update(printify_status='failed', updated_at=timezone.now())
+        logger.error(f"❌ Giving up submitting order {entry.order_id} to Printify after {entry.attempts} attempts: {error}")
+    else:
+        entry.status = 'pending'
+        next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(entry.attempts))
+        logger.warning(f"⚠️ Printify submission of order {entry.order_id} failed (attempt {entry.attempts}), retrying at {next_attempt_at:%H:%M:%S}: {error}")
+    PrintifyOrderOutbox.objects.filter(pk=entry.pk).update(
+        status=entry.status, next_attempt_at=next_attempt_at, locked_at=None, last_error=str(error)[:2000]
+    )
+
+
+def submit_outbox_entry(entry, api, shop_id):
+    """Makes one submission attempt for a claimed entry. Returns True if the order is now on Printify."""
+    try:
+        external_id = entry.payload.get('external_id')
+        # An earlier attempt may have created the order even though we saw an error (e.g. a
+        # timeout) or never got to record it (a crash). Requeued entries restart at attempt 1
+        # but keep their last_error.
+        existing = None
+        if (entry.attempts > 1 or entry.last_error) and external_id:
+            existing = find_existing_printify_order(api, shop_id, external_id, since=entry.created_at - EXISTING_ORDER_SEARCH_MARGIN)
+        if existing is not None:
+            logger.info(f"ℹ️ Order {entry.order_id} was already on Printify as {existing.get('id')}.")
+            _mark_sent(entry, existing)
+            return True
+
+        result = api.create_order(shop_id=shop_id, order_payload=entry.payload)
+        if isinstance(result, dict) and result.get('id'):
+            _mark_sent(entry, result)
+            return True
+        error = result.get('error') if isinstance(result, dict) else result
+        _mark_failed_attempt(entry, error or 'Printify did not return an order ID.')
+    except Exception as e:
+        logger.exception(f"❌ Unexpected error submitting order {entry.order_id} to Printify:")
+        _mark_failed_attempt(entry, e)
+    return False
+
+
+def process_outbox(api=None, shop_id=None, limit=OUTBOX_BATCH_SIZE):
+    """Submits the currently due outbox entries. Returns (sent, failed_attempts)."""
+    shop_id = shop_id or settings.PRINTIFY_SHOP_ID
+    entries = claim_due_entries(limit)
+    if not entries:
+        return 0, 0
+    api = api or PrintifyAPI()
+    sent = sum(1 for entry in entries if submit_outbox_entry(entry, api, shop_id))
+    return sent, len(entries) - sent
+
+
+def requeue_entries(queryset):
+    """Puts failed entries back in the queue for another full round of attempts (admin action)."""
+    order_ids = list(queryset.filter(status='failed').values_list('order_id', flat=True))
+    with transaction.atomic():
+        count = PrintifyOrderOutbox.objects.filter(order_id__in=order_ids, status='failed').update(
+            status='pending', attempts=0, next_attempt_at=timezone.now(), locked_at=None
+        )
+        Order.objects.filter(pk__in=order_ids).update(printify_status='queued', updated_at=timezone.now())
+    return count
+
+
+def reconcile_high_water_mark():
+    """
+    Oldest creation time (less a margin) of a submitted order Printify has not finished
+    with, or None when every submitted order is final and there is nothing to reconcile.
+    """
+    oldest = (
+        Order.objects.exclude(printify_order_id='')
+        .exclude(printify_status__in=PRINTIFY_FINAL_STATUSES)
+        .aggregate(oldest=Min('created_at'))['oldest']
+    )
+    return oldest - RECONCILE_WATERMARK_MARGIN if oldest else None
+
+
+def fetch_recent_printify_orders(api, shop_id, since, page_size=RECONCILE_PAGE_SIZE, max_pages=RECONCILE_MAX_PAGES):
+    """
+    Pages through the shop's orders (newest first) until one was created before `since`.
+    Returns the orders read, keyed by external_id; orders without one are skipped.
+    """
+    orders = {}
+    for page in range(1, max_pages + 1):
+        result = api.get_orders(shop_id, limit=page_size, page=page)
+        if not isinstance(result, dict) or result.get('error'):
+            raise RuntimeError(f"Could not list Printify orders (page {page}): {result.get('error') if isinstance(result, dict) else result}")
+        data = result.get('data', [])
+        reached_mark = False
+        for printify_order in data:
+            created_at = parse_datetime(str(printify_order.get('created_at') or ''))
+            if created_at and created_at < since:
+                reached_mark = True
+                break
+            external_id = _printify_external_id(printify_order)
+            if external_id:
+                orders[str(external_id)] = printify_order
+        if reached_mark or not data or page >= int(result.get('last_page') or page):
+            break
+    else:
+        logger.warning(f"⚠️ Stopped reconciling after {max_pages} pages of Printify orders.")
+    return orders
+
+
+def _apply_printify_order(order, printify_order):
+    """Copies status and shipping details onto `order`. Returns True if anything changed."""
+    shipments = printify_order.get('shipments') or []
+    numbers = list(dict.fromkeys(str(s['number']) for s in shipments if s.get('number')))
+    values = {
+        'printify_order_id': str(printify_order.get('id') or order.printify_order_id),
+        'printify_status': printify_order.get('status') or order.printify_status,
+        'tracking_carrier': next((s['carrier'] for s in shipments if s.get('carrier')), order.tracking_carrier)[:100],
+        'tracking_number': ', '.join(numbers)[:255] or order.tracking_number,
+        'tracking_url': next((s['url'] for s in shipments if s.get('url')), order.tracking_url)[:1024],
+        'fulfilled_at': parse_datetime(str(printify_order.get('fulfilled_at') or '')) or order.fulfilled_at,
+    }
+    changed = False
+    for name, value in values.items():
+        if getattr(order, name) != value:
+            setattr(order, name, value)
+            changed = True
+    return changed
+
+
+def reconcile_printify_orders(api=None, shop_id=None, since=None):
+    """
+    Updates the Printify status and tracking details of recently active orders in bulk.
+    `since` overrides the high-water mark. Returns (orders_read, orders_updated, orders_fulfilled).
+    """
+    since = since or reconcile_high_water_mark()
+    if since is None:
+        return 0, 0, 0
+    shop_id = shop_id or settings.PRINTIFY_SHOP_ID
+    printify_orders = fetch_recent_printify_orders(api or PrintifyAPI(), shop_id, since)
+    if not printify_orders:
+        return 0, 0, 0
+
+    changed = []
+    newly_fulfilled = []
+    now = timezone.now()
+    for order in Order.objects.filter(external_id__in=list(printify_orders)):
+        was_fulfilled = order.printify_status == 'fulfilled'
+        if _apply_printify_order(order, printify_orders[order.external_id]):
+            order.updated_at = now
+            changed.append(order)
+            if order.printify_status == 'fulfilled' and not was_fulfilled:
+                newly_fulfilled.append(order.id)
+
+    with transaction.atomic():
+        Order.objects.bulk_update(changed, [
+            'printify_order_id', 'printify_status', 'tracking_carrier', 'tracking_number', 'tracking_url', 'fulfilled_at', 'updated_at',
+        ], batch_size=200)
+        if newly_fulfilled:
+            CustomDesign.objects.filter(order_item__order_id__in=newly_fulfilled).update(status='fulfilled')
+
+    if changed:
+        logger.info(f"🚚 Reconciled {len(printify_orders)} Printify order(s): {len(changed)} updated, {len(newly_fulfilled)} fulfilled.")
+    return len(printify_orders), len(changed), len(newly_fulfilled)
@@ -0,0 +1,41 @@
+# shop/management/commands/process_printify_outbox.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shop.fulfilment import OUTBOX_BATCH_SIZE, process_outbox, release_stale_entries
+
+
+class Command(BaseCommand):
+    help = (
+        "Submits paid orders to Printify from the order outbox, retrying failures with backoff. "
+        "Runs continuously unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Submit the entries due now, then exit.")
+        parser.add_argument('--poll', type=int, default=15, metavar='SECONDS', help="How often to check for due entries (default 15).")
+        parser.add_argument('--batch', type=int, default=OUTBOX_BATCH_SIZE, help=f"Entries claimed per round (default {OUTBOX_BATCH_SIZE}).")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.run_round(options['batch'])
+            return
+
+        self.stdout.write(f"Printify order outbox worker started, polling every {options['poll']}s.")
+        while True:
+            close_old_connections() # Long-running process: drop connections past CONN_MAX_AGE
+            if not self.run_round(options['batch']):
+                time.sleep(options['poll'])
+
+    def run_round(self, batch):
+        """Processes one batch. Returns the number of entries attempted."""
+        released = release_stale_entries()
+        if released:
+            self.stderr.write(self.style.WARNING(f"Re-queued {released} entr{'y' if released == 1 else 'ies'} left by a stopped worker."))
+        sent, failed = process_outbox(limit=batch)
+        if sent or failed:
+            style = self.style.SUCCESS if not failed else self.style.WARNING
+            self.stdout.write(style(f"Submitted {sent} order(s) to Printify, {failed} attempt(s) failed."))
+        return sent + failed
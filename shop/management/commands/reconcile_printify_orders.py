@@ -0,0 +1,53 @@
+# shop/management/commands/reconcile_printify_orders.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from shop.fulfilment import reconcile_high_water_mark, reconcile_printify_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the status and tracking details of submitted orders from Printify, reading only "
+        "orders created since the oldest order that is not yet fulfilled or canceled. "
+        "Runs once, or continuously with --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, metavar='N', help="Look at orders from the last N days instead of the high-water mark.")
+        parser.add_argument(
+            '--every', type=int, metavar='SECONDS', nargs='?', const=settings.PRINTIFY_RECONCILE_INTERVAL_SECONDS,
+            help="Scheduler mode: reconcile every SECONDS (default PRINTIFY_RECONCILE_INTERVAL_SECONDS).",
+        )
+
+    def handle(self, *args, **options):
+        if not options['every']:
+            try:
+                self.run_once(options['days'])
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            return
+
+        self.stdout.write(f"Printify order reconciliation started, every {options['every']}s.")
+        while True:
+            close_old_connections() # Long-running process: drop connections past CONN_MAX_AGE
+            try:
+                self.run_once(options['days'])
+            except RuntimeError as e:
+                # Printify unavailable: try again next round
+                self.stderr.write(self.style.ERROR(str(e)))
+            time.sleep(options['every'])
+
+    def run_once(self, days):
+        since = timezone.now() - timedelta(days=days) if days else reconcile_high_water_mark()
+        if since is None:
+            self.stdout.write("No submitted orders are waiting on Printify.")
+            return
+        read, updated, fulfilled = reconcile_printify_orders(since=since)
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {read} Printify order(s) created since {since:%Y-%m-%d %H:%M}: {updated} updated, {fulfilled} newly fulfilled."
+        ))
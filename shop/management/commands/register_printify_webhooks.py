@@ -0,0 +1,34 @@
+# shop/management/commands/register_printify_webhooks.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.printify import PrintifyAPI
+from shop.webhooks import PRINTIFY_PRODUCT_TOPICS
+
+
+class Command(BaseCommand):
+    help = "Registers the Printify product webhooks that keep the local catalog current between full syncs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help="Public base URL of this site, e.g. https://hoxobil.com")
+
+    def handle(self, *args, **options):
+        if not settings.PRINTIFY_SHOP_ID:
+            raise CommandError("PRINTIFY_SHOP_ID is not configured.")
+        if not settings.PRINTIFY_WEBHOOK_SECRET:
+            raise CommandError("PRINTIFY_WEBHOOK_SECRET is not configured; deliveries could not be verified.")
+
+        url = options['base_url'].rstrip('/') + '/webhooks/printify/'
+        api = PrintifyAPI()
+        existing = api.get_webhooks(settings.PRINTIFY_SHOP_ID)
+        registered = {(w.get('topic'), w.get('url')) for w in existing} if isinstance(existing, list) else set()
+
+        for topic in PRINTIFY_PRODUCT_TOPICS:
+            if (topic, url) in registered:
+                self.stdout.write(f"{topic} already registered.")
+                continue
+            result = api.create_webhook(settings.PRINTIFY_SHOP_ID, topic, url, settings.PRINTIFY_WEBHOOK_SECRET)
+            if isinstance(result, dict) and result.get('error'):
+                self.stderr.write(self.style.ERROR(f"{topic}: {result['error']}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{topic} -> {url}"))
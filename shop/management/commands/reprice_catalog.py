@@ -0,0 +1,22 @@
+# shop/management/commands/reprice_catalog.py
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog import current_exchange_rate
+from shop.sync import reprice_catalog
+
+
+class Command(BaseCommand):
+    help = "Recomputes stored NGN product and variant prices at the exchange rate in effect now."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Reprice even if the current rate was already applied.")
+
+    def handle(self, *args, **options):
+        exchange_rate = current_exchange_rate()
+        if exchange_rate is None:
+            raise CommandError("No exchange rate is in effect yet. Add one in the admin first.")
+        if exchange_rate.applied_at and not options['force']:
+            self.stdout.write(f"{exchange_rate} was already applied at {exchange_rate.applied_at:%Y-%m-%d %H:%M}. Use --force to reprice anyway.")
+            return
+        repriced = reprice_catalog(exchange_rate, force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f"Repriced {repriced} products at {exchange_rate}."))
@@ -0,0 +1,75 @@
+# shop/management/commands/sync_printify.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from shop.models import SyncRun
+from shop.sync import claim_next_queued_run, execute_sync_run, fail_stale_runs, reprice_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Synchronizes the Printify catalog into the local Product table. "
+        "With --every, keeps running: syncs on that interval, picks up runs queued from the website "
+        "and reprices the catalog when a new exchange rate takes effect."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int, metavar='SECONDS', nargs='?', const=settings.PRINTIFY_SYNC_INTERVAL_SECONDS,
+            help="Scheduler mode: sync every SECONDS (default PRINTIFY_SYNC_INTERVAL_SECONDS) and process queued runs.",
+        )
+        parser.add_argument(
+            '--poll', type=int, default=10, metavar='SECONDS',
+            help="Scheduler mode: how often to check for runs queued from the website (default 10).",
+        )
+        parser.add_argument(
+            '--queued-only', action='store_true',
+            help="Only process runs queued from the website, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        stale = fail_stale_runs()
+        if stale:
+            self.stderr.write(self.style.WARNING(f"Marked {stale} stale running sync run(s) as failed."))
+
+        if options['every']:
+            return self.run_scheduler(options['every'], options['poll'])
+
+        if options['queued_only']:
+            while (sync_run := claim_next_queued_run()) is not None:
+                self.report(execute_sync_run(sync_run))
+            return
+
+        self.report(execute_sync_run(SyncRun.objects.create(trigger='command', status='running', started_at=timezone.now())))
+
+    def run_scheduler(self, interval, poll):
+        self.stdout.write(f"Printify sync scheduler started: every {interval}s, polling the queue every {poll}s.")
+        next_scheduled = time.monotonic()
+        while True:
+            close_old_connections() # Long-running process: drop connections past CONN_MAX_AGE
+            repriced = reprice_catalog() # No-op unless a new exchange rate just took effect
+            if repriced:
+                self.stdout.write(self.style.SUCCESS(f"Repriced {repriced} products at the new exchange rate."))
+            sync_run = claim_next_queued_run()
+            if sync_run is None and time.monotonic() >= next_scheduled:
+                sync_run = SyncRun.objects.create(trigger='schedule', status='running', started_at=timezone.now())
+            if sync_run is not None:
+                self.report(execute_sync_run(sync_run))
+                # Any full sync (scheduled or queued) resets the schedule
+                next_scheduled = time.monotonic() + interval
+                continue
+            time.sleep(poll)
+
+    def report(self, sync_run):
+        style = self.style.SUCCESS if sync_run.status == 'succeeded' else self.style.WARNING
+        self.stdout.write(style(
+            f"Sync run {sync_run.id} {sync_run.status}: pages {sync_run.pages_fetched}/{sync_run.pages_total}, "
+            f"created {sync_run.products_created}, updated {sync_run.products_updated}, "
+            f"unchanged {sync_run.products_skipped}, removed {sync_run.products_removed}."
+        ))
+        for error in sync_run.errors:
+            self.stderr.write(self.style.ERROR(f"  {error}"))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Model options and help_text changes that were made to models.py but never migrated."""
+
+    dependencies = [
+        ('shop', '0002_orderitem_printify_variant_id_orderitem_product_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='order',
+            options={'ordering': ('-created_at',), 'verbose_name': 'Order', 'verbose_name_plural': 'Orders'},
+        ),
+        migrations.AlterModelOptions(
+            name='orderitem',
+            options={'verbose_name': 'Order Item', 'verbose_name_plural': 'Order Items'},
+        ),
+        migrations.AlterField(
+            model_name='customdesign',
+            name='product',
+            field=models.ForeignKey(help_text='The base product type this design is for (e.g., T-Shirt, Hoodie).', on_delete=django.db.models.deletion.CASCADE, related_name='custom_designs', to='shop.product'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='custom_design',
+            field=models.OneToOneField(blank=True, help_text='If this is a customized product, link to its design.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_item', to='shop.customdesign'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, help_text='The base product ordered.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='shop.product'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product_title',
+            field=models.CharField(help_text='Redundant but useful for displaying name if product is deleted or custom_design is null.', max_length=200),
+        ),
+    ]
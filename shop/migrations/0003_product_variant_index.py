@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+def backfill_variant_index(apps, schema_editor):
+    """Builds variant_index for already-synced products from their stored variants_data."""
+    Product = apps.get_model('shop', 'Product')
+    for product in Product.objects.exclude(variants_data=[]).iterator():
+        product.variant_index = {
+            str(v.get('id')): {
+                'title': v.get('title'),
+                'price_kobo': int(round(float(v.get('price_ngn') or 0) * 100)),
+                'is_enabled': v.get('is_enabled', True),
+                'is_available': v.get('is_available', True),
+                'image_url': product.primary_image_url or '',
+            }
+            for v in product.variants_data
+        }
+        product.save(update_fields=['variant_index'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_model_options_drift'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='variant_index',
+            field=models.JSONField(blank=True, default=dict, help_text='Variant ID -> price in kobo, title, availability and image. Built during sync for fast cart/checkout lookups.'),
+        ),
+        migrations.RunPython(backfill_variant_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_product_variant_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', help_text='Hash of the Printify product data at the last sync. Unchanged products are skipped.', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='printify_updated_at',
+            field=models.DateTimeField(blank=True, help_text="Printify's own updated_at for this product at the last sync.", null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='removed_from_printify_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Set when a full sync no longer finds this product in Printify.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='siteevent',
+            name='event_name',
+            field=models.CharField(choices=[('SITE_LAUNCH', 'Site Launch Date/Time'), ('CATALOG_SYNC', 'Last Completed Printify Catalog Sync')], help_text='The unique name of the event.', max_length=50, unique=True),
+        ),
+    ]
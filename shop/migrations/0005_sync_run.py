@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_catalog_sync_events(apps, schema_editor):
+    """Carries the CATALOG_SYNC SiteEvent marker over as a succeeded SyncRun."""
+    SiteEvent = apps.get_model('shop', 'SiteEvent')
+    SyncRun = apps.get_model('shop', 'SyncRun')
+    for event in SiteEvent.objects.filter(event_name='CATALOG_SYNC'):
+        SyncRun.objects.create(status='succeeded', trigger='web', started_at=event.event_datetime, finished_at=event.event_datetime)
+        event.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='siteevent',
+            name='event_name',
+            field=models.CharField(choices=[('SITE_LAUNCH', 'Site Launch Date/Time')], help_text='The unique name of the event.', max_length=50, unique=True),
+        ),
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('partial', 'Partially Succeeded'), ('failed', 'Failed')], db_index=True, default='queued', max_length=20)),
+                ('trigger', models.CharField(choices=[('web', 'Requested from the website'), ('command', 'Management command'), ('schedule', 'Scheduler')], default='command', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('pages_total', models.PositiveIntegerField(default=0)),
+                ('pages_fetched', models.PositiveIntegerField(default=0)),
+                ('products_created', models.PositiveIntegerField(default=0)),
+                ('products_updated', models.PositiveIntegerField(default=0)),
+                ('products_skipped', models.PositiveIntegerField(default=0, help_text='Products unchanged since the previous sync.')),
+                ('products_removed', models.PositiveIntegerField(default=0, help_text='Products flagged as no longer in Printify.')),
+                ('errors', models.JSONField(blank=True, default=list, help_text='Per-page and general errors encountered during the run.')),
+                ('requested_by', models.ForeignKey(blank=True, help_text='Staff user who queued this run from the website.', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sync Run',
+                'verbose_name_plural': 'Sync Runs',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RunPython(move_catalog_sync_events, migrations.RunPython.noop),
+    ]
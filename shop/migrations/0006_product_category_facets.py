@@ -0,0 +1,63 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+# Category keywords as of this migration (see shop.catalog.CATEGORY_RULES)
+CATEGORY_KEYWORDS = [
+    ("Hoodies & Sweatshirts", ("hoodie", "hooded sweatshirt")),
+    ("T-Shirts", ("t-shirt", "tee")),
+    ("Joggers & Sweatpants", ("jogger", "sweatpants")),
+    ("Tank Tops", ("tank top",)),
+    ("Mugs", ("mug",)),
+    ("Posters & Wall Art", ("poster",)),
+]
+
+
+def backfill_category(apps, schema_editor):
+    """Stores the title-inferred category on already-synced products. Facets are built by the next sync."""
+    Product = apps.get_model('shop', 'Product')
+    for product in Product.objects.only('id', 'title').iterator():
+        title_lower = (product.title or '').lower()
+        category = next((name for name, keywords in CATEGORY_KEYWORDS if any(k in title_lower for k in keywords)), "Other")
+        if category != "Other":
+            Product.objects.filter(id=product.id).update(category=category)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_sync_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'Category'), ('color', 'Color'), ('size', 'Size')], max_length=20)),
+                ('category', models.CharField(blank=True, default='', help_text='Category these counts are scoped to. Empty for the whole catalog.', max_length=50)),
+                ('value', models.CharField(max_length=100)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Catalog Facet',
+                'verbose_name_plural': 'Catalog Facets',
+                'ordering': ['facet', 'category', '-product_count', 'value'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.CharField(db_index=True, default='Other', help_text='Storefront category, inferred from the title at sync time.', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_published', 'category', 'title'], name='product_list_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='catalogfacet',
+            constraint=models.UniqueConstraint(fields=('facet', 'category', 'value'), name='unique_catalog_facet'),
+        ),
+        migrations.RunPython(backfill_category, migrations.RunPython.noop),
+    ]
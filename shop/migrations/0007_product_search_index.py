@@ -0,0 +1,67 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:40
+
+from django.db import migrations
+
+
+SQLITE_CREATE = [
+    # External-content FTS5 table: the text stays in shop_product, only the index is stored here
+    """CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5(
+        title, description, tags, content='shop_product', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS shop_product_fts_ai AFTER INSERT ON shop_product BEGIN
+        INSERT INTO shop_product_fts(rowid, title, description, tags) VALUES (new.id, new.title, new.description, new.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS shop_product_fts_ad AFTER DELETE ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, title, description, tags) VALUES ('delete', old.id, old.title, old.description, old.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS shop_product_fts_au AFTER UPDATE OF title, description, tags ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, title, description, tags) VALUES ('delete', old.id, old.title, old.description, old.tags);
+        INSERT INTO shop_product_fts(rowid, title, description, tags) VALUES (new.id, new.title, new.description, new.tags);
+    END""",
+    # Index the products that already exist
+    "INSERT INTO shop_product_fts(shop_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS shop_product_fts_au",
+    "DROP TRIGGER IF EXISTS shop_product_fts_ad",
+    "DROP TRIGGER IF EXISTS shop_product_fts_ai",
+    "DROP TABLE IF EXISTS shop_product_fts",
+]
+
+# Same expression as shop.search.POSTGRES_SEARCH_VECTOR
+POSTGRES_CREATE = [
+    """CREATE INDEX IF NOT EXISTS shop_product_search_idx ON shop_product USING GIN ((
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(tags::text, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ))""",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS shop_product_search_idx",
+]
+
+
+def _run(schema_editor, statements_by_vendor):
+    for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_product_category_facets'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
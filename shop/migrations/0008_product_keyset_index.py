@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_published', 'title', 'id'], name='product_title_keyset_idx'),
+        ),
+    ]
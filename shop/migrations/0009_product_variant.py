@@ -0,0 +1,81 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_product_variants(apps, schema_editor):
+    """Creates ProductVariant rows for already-synced products from variants_data and variant_index."""
+    Product = apps.get_model('shop', 'Product')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+    batch = []
+    for product in Product.objects.exclude(variants_data=[]).iterator():
+        value_titles = {
+            str(value.get('id')): (option.get('type'), value.get('title'))
+            for option in product.product_options_data or []
+            for value in option.get('values', [])
+        }
+        index = product.variant_index or {}
+        for v in product.variants_data:
+            vid = str(v.get('id'))
+            option_ids = [str(oid) for oid in v.get('option_value_ids', [])]
+            by_type = dict(value_titles[oid] for oid in option_ids if oid in value_titles)
+            entry = index.get(vid, {})
+            batch.append(ProductVariant(
+                product_id=product.id,
+                printify_variant_id=vid,
+                title=(v.get('title') or '')[:255],
+                sku=(v.get('sku') or '')[:100],
+                option_value_ids='|'.join(sorted(option_ids, key=lambda oid: (len(oid), oid))),
+                color=(by_type.get('color') or '')[:100],
+                size=(by_type.get('size') or '')[:100],
+                price_kobo=entry.get('price_kobo', int(round(float(v.get('price_ngn') or 0) * 100))),
+                is_enabled=v.get('is_enabled', True),
+                is_available=v.get('is_available', True),
+                image_url=entry.get('image_url') or product.primary_image_url or '',
+                last_synced_at=product.last_synced_at,
+            ))
+        if len(batch) >= 500:
+            ProductVariant.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ProductVariant.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_product_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('printify_variant_id', models.CharField(help_text='Variant ID from Printify.', max_length=50)),
+                ('title', models.CharField(blank=True, default='', max_length=255)),
+                ('sku', models.CharField(blank=True, default='', max_length=100)),
+                ('option_value_ids', models.CharField(blank=True, db_index=True, default='', help_text="Printify option value IDs, sorted and '|'-separated (e.g. '381|521').", max_length=255)),
+                ('color', models.CharField(blank=True, default='', help_text="Title of the variant's color option value, if any.", max_length=100)),
+                ('size', models.CharField(blank=True, default='', help_text="Title of the variant's size option value, if any.", max_length=100)),
+                ('price_kobo', models.PositiveIntegerField(db_index=True, default=0, help_text='Price in NGN kobo.')),
+                ('is_enabled', models.BooleanField(default=True)),
+                ('is_available', models.BooleanField(default=True)),
+                ('image_url', models.URLField(blank=True, default='', help_text='First product image showing this variant.', max_length=1024)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='shop.product')),
+            ],
+            options={
+                'verbose_name': 'Product Variant',
+                'verbose_name_plural': 'Product Variants',
+                'ordering': ['product', 'price_kobo', 'id'],
+                'indexes': [models.Index(fields=['product', 'color', 'size'], name='variant_option_idx'), models.Index(fields=['color', 'size', 'is_available', 'price_kobo'], name='variant_filter_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'printify_variant_id'), name='unique_product_variant')],
+            },
+        ),
+        migrations.RunPython(backfill_product_variants, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='product',
+            name='variant_index',
+        ),
+    ]
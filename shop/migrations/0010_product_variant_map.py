@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+def _normalize(title):
+    return ' '.join(str(title or '').split()).lower()
+
+
+def backfill_variant_map(apps, schema_editor):
+    """Builds variant_map for already-synced products from their orderable ProductVariant rows."""
+    Product = apps.get_model('shop', 'Product')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+    maps = {}
+    orderable = ProductVariant.objects.filter(is_enabled=True, is_available=True).order_by('product_id', 'id')
+    for product_id, variant_id, color, size in orderable.values_list('product_id', 'printify_variant_id', 'color', 'size').iterator():
+        maps.setdefault(product_id, {}).setdefault(f"{_normalize(color)}|{_normalize(size)}", variant_id)
+    for product_id, variant_map in maps.items():
+        Product.objects.filter(id=product_id).update(variant_map=variant_map)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_variant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='variant_map',
+            field=models.JSONField(blank=True, default=dict, help_text="Normalized 'color|size' -> Printify variant ID for orderable variants. Built during sync."),
+        ),
+        migrations.RunPython(backfill_variant_map, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:29
+
+from decimal import Decimal
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_price_cents_and_seed_rate(apps, schema_editor):
+    """
+    Copies each variant's USD price from variants_data into ProductVariant.price_cents and
+    records the rate the stored prices were computed with as the first ExchangeRate.
+    """
+    Product = apps.get_model('shop', 'Product')
+    ProductVariant = apps.get_model('shop', 'ProductVariant')
+    ExchangeRate = apps.get_model('shop', 'ExchangeRate')
+    for product in Product.objects.exclude(variants_data=[]).only('id', 'variants_data').iterator():
+        for v in product.variants_data:
+            ProductVariant.objects.filter(product_id=product.id, printify_variant_id=str(v.get('id'))).update(price_cents=v.get('price_cents') or 0)
+    if not ExchangeRate.objects.exists():
+        now = timezone.now()
+        ExchangeRate.objects.create(
+            usd_to_ngn=Decimal(getattr(settings, 'USD_TO_NGN_RATE', '1607.00')),
+            effective_at=now, applied_at=now, note="Rate in use before exchange rates were configurable.",
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_product_variant_map'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariant',
+            name='price_cents',
+            field=models.PositiveIntegerField(default=0, help_text='Printify price in USD cents. NGN prices are derived from it with the current ExchangeRate.'),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('usd_to_ngn', models.DecimalField(decimal_places=4, help_text='NGN per 1 USD, e.g. 1607.0000.', max_digits=12)),
+                ('effective_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='When this rate starts to apply.')),
+                ('applied_at', models.DateTimeField(blank=True, help_text='When stored product prices were recomputed with this rate.', null=True)),
+                ('note', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exchange_rates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Exchange Rate',
+                'verbose_name_plural': 'Exchange Rates',
+                'ordering': ['-effective_at', '-id'],
+            },
+        ),
+        migrations.RunPython(backfill_price_cents_and_seed_rate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_cart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingCheckout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(help_text='Paystack transaction reference.', max_length=100, unique=True)),
+                ('status', models.CharField(choices=[('initialized', 'Awaiting Payment'), ('paid', 'Paid, Creating Order'), ('completed', 'Order Created'), ('failed', 'Payment Failed'), ('expired', 'Expired')], db_index=True, default='initialized', max_length=20)),
+                ('amount_kobo', models.BigIntegerField(help_text='Amount sent to Paystack, in kobo.')),
+                ('customer', models.JSONField(default=dict, help_text='Contact and shipping details entered at checkout.')),
+                ('lines', models.JSONField(default=dict, help_text='Cart lines with the charged unit prices in kobo, by cart key.')),
+                ('printify_order', models.JSONField(blank=True, default=dict, help_text='Printify order payload to submit once paid.')),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('cart', models.ForeignKey(blank=True, help_text='Cart emptied once the order is created.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_checkouts', to='shop.cart')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_checkout', to='shop.order')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pending_checkouts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Pending Checkout',
+                'verbose_name_plural': 'Pending Checkouts',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
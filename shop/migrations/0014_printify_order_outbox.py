@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_pending_checkout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='external_id sent to Printify; identifies this order there.', max_length=100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='printify_order_id',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='Printify order ID once the order has been submitted.', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='printify_status',
+            field=models.CharField(blank=True, default='', help_text="Order status reported by Printify, or 'queued'/'failed' before it is accepted.", max_length=50),
+        ),
+        migrations.CreateModel(
+            name='PrintifyOrderOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(help_text='Printify order payload, including its external_id.')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('sent', 'Sent to Printify'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, help_text='When a worker claimed this entry.', null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='printify_outbox', to='shop.order')),
+            ],
+            options={
+                'verbose_name': 'Printify Order Outbox Entry',
+                'verbose_name_plural': 'Printify Order Outbox',
+                'ordering': ['next_attempt_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='printify_outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_printify_order_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaystackEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(help_text='Paystack event type, e.g. charge.success.', max_length=50)),
+                ('reference', models.CharField(help_text='Paystack transaction reference.', max_length=100)),
+                ('payload', models.JSONField(default=dict, help_text="The event's data object.")),
+                ('result', models.CharField(blank=True, default='', max_length=255)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Paystack Event',
+                'verbose_name_plural': 'Paystack Events',
+                'ordering': ['-received_at'],
+                'constraints': [models.UniqueConstraint(fields=('event', 'reference'), name='unique_paystack_event_reference')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_paystack_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='fulfilled_at',
+            field=models.DateTimeField(blank=True, help_text='When Printify reported the order fulfilled.', null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tracking_carrier',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tracking_number',
+            field=models.CharField(blank=True, default='', help_text="Tracking number(s) of the order's shipments.", max_length=255),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tracking_url',
+            field=models.URLField(blank=True, default='', max_length=1024),
+        ),
+    ]
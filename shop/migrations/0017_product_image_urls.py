@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_order_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_urls',
+            field=models.JSONField(blank=True, default=list, help_text="URLs of all the product's Printify images, primary first. Built during sync."),
+        ),
+    ]
@@ -81,14 +81,20 @@ class Product(models.Model):
     description = models.TextField(blank=True, null=True)
     base_price_ngn = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text="Base display price in NGN.")
     primary_image_url = models.URLField(max_length=1024, blank=True, null=True, help_text="URL of the primary display image.")
+    image_urls = models.JSONField(default=list, blank=True, help_text="URLs of all the product's Printify images, primary first. Built during sync.")
     product_options_data = models.JSONField(default=list, blank=True, help_text="Structured product options (e.g., Color, Size) from Printify.")
     variants_data = models.JSONField(default=list, blank=True, help_text="Detailed list of all product variants with their properties.")
+    variant_map = models.JSONField(default=dict, blank=True, help_text="Normalized 'color|size' -> Printify variant ID for orderable variants. Built during sync.")
     tags = models.JSONField(default=list, blank=True, help_text="Tags associated with the product from Printify.")
     printify_shop_id = models.CharField(max_length=100, blank=True, null=True, db_index=True, help_text="Printify Shop ID this product belongs to.")
     printify_blueprint_id = models.IntegerField(blank=True, null=True, help_text="Printify Blueprint ID for this product type.")
     printify_print_provider_id = models.IntegerField(blank=True, null=True, help_text="Printify Print Provider ID associated with this product.")
     is_published = models.BooleanField(default=True, help_text="Is the product published on Printify?")
     last_synced_at = models.DateTimeField(null=True, blank=True, help_text="Timestamp of the last sync from Printify.")
+    content_hash = models.CharField(max_length=64, blank=True, default='', help_text="Hash of the Printify product data at the last sync. Unchanged products are skipped.")
+    printify_updated_at = models.DateTimeField(null=True, blank=True, help_text="Printify's own updated_at for this product at the last sync.")
+    removed_from_printify_at = models.DateTimeField(null=True, blank=True, db_index=True, help_text="Set when a full sync no longer finds this product in Printify.")
+    category = models.CharField(max_length=50, default='Other', db_index=True, help_text="Storefront category, inferred from the title at sync time.")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -100,10 +106,58 @@ class Product(models.Model):
         ordering = ['title']
         verbose_name = "Synced Product"
         verbose_name_plural = "Synced Products"
+        indexes = [
+            # Serves the product list (all or one category) in title order from the index
+            models.Index(fields=['is_published', 'category', 'title'], name='product_list_idx'),
+            # Keyset pagination over all published products in (title, id) order
+            models.Index(fields=['is_published', 'title', 'id'], name='product_title_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} (ID: {self.printify_id})"
 
+class ProductVariant(models.Model):
+    """
+    One Printify variant (e.g. "Black / M") of a synced product. Rebuilt from the Printify
+    data whenever the product is synced, so variants can be resolved and filtered in SQL
+    instead of scanning Product.variants_data in Python.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
+    printify_variant_id = models.CharField(max_length=50, help_text="Variant ID from Printify.")
+    title = models.CharField(max_length=255, blank=True, default='')
+    sku = models.CharField(max_length=100, blank=True, default='')
+    option_value_ids = models.CharField(max_length=255, blank=True, default='', db_index=True, help_text="Printify option value IDs, sorted and '|'-separated (e.g. '381|521').")
+    color = models.CharField(max_length=100, blank=True, default='', help_text="Title of the variant's color option value, if any.")
+    size = models.CharField(max_length=100, blank=True, default='', help_text="Title of the variant's size option value, if any.")
+    price_cents = models.PositiveIntegerField(default=0, help_text="Printify price in USD cents. NGN prices are derived from it with the current ExchangeRate.")
+    price_kobo = models.PositiveIntegerField(default=0, db_index=True, help_text="Price in NGN kobo.")
+    is_enabled = models.BooleanField(default=True)
+    is_available = models.BooleanField(default=True)
+    image_url = models.URLField(max_length=1024, blank=True, default='', help_text="First product image showing this variant.")
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Product Variant"
+        verbose_name_plural = "Product Variants"
+        ordering = ['product', 'price_kobo', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'printify_variant_id'], name='unique_product_variant'),
+        ]
+        indexes = [
+            # Resolves a (product, color, size) selection, e.g. for custom designs
+            models.Index(fields=['product', 'color', 'size'], name='variant_option_idx'),
+            # Catalog queries such as "in-stock black hoodies under 30k"
+            models.Index(fields=['color', 'size', 'is_available', 'price_kobo'], name='variant_filter_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.title} - {self.title} (ID: {self.printify_variant_id})"
+
+    @property
+    def is_purchasable(self):
+        return self.is_enabled and self.is_available
+
+
 # +++ Custom Design Model +++
 class CustomDesign(models.Model):
     """
@@ -157,7 +211,71 @@ class CustomDesign(models.Model):
     def __str__(self):
         user_info = self.user.email if self.user else 'Guest'
         return f"Custom Design for {self.product.title} ({self.selected_size}, {self.selected_color}) by {user_info} on {self.created_at.strftime('%Y-%m-%d %H:%M')}"
-    
+
+
+# Cart Models
+class Cart(models.Model):
+    """
+    A shopping cart. Signed-in users have one cart each; a guest cart has no user and
+    is found through the 'cart_id' session key until it is merged at login (see shop/cart.py).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='cart')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Cart"
+        verbose_name_plural = "Carts"
+
+    def __str__(self):
+        return f"Cart {self.id} of {self.user.email if self.user else 'guest'}"
+
+class CartItem(models.Model):
+    """
+    One line of a cart. `key` is the line's cart key ("<printify product id>-<variant id>"
+    or "custom_design_<id>"), unique per cart, so quantity changes update a single row.
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    key = models.CharField(max_length=150)
+    printify_product_id = models.CharField(max_length=100)
+    variant_id = models.CharField(max_length=100, blank=True, default='')
+    custom_design = models.ForeignKey(CustomDesign, on_delete=models.CASCADE, null=True, blank=True, related_name='cart_items')
+    title = models.CharField(max_length=255)
+    variant_title = models.CharField(max_length=255, blank=True, default='')
+    price_kobo = models.BigIntegerField(help_text="Unit price in kobo when the item was added.")
+    quantity = models.PositiveIntegerField(default=1)
+    image_url = models.CharField(max_length=1024, blank=True, default='')
+    is_custom = models.BooleanField(default=False)
+    added_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Cart Item"
+        verbose_name_plural = "Cart Items"
+        ordering = ['added_at', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'key'], name='unique_cart_item_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.title} ({self.variant_title or 'N/A'}) in cart {self.cart_id}"
+
+    def as_line(self):
+        """The line in the dict form CartPricing and the checkout views work with."""
+        line = {
+            'id': self.printify_product_id,
+            'variant_id': self.variant_id,
+            'title': self.title,
+            'variant_title': self.variant_title,
+            'price_kobo': self.price_kobo,
+            'quantity': self.quantity,
+            'image_url': self.image_url,
+            'is_custom': self.is_custom,
+        }
+        if self.custom_design_id:
+            line['custom_design_id'] = str(self.custom_design_id)
+        return line
+
 
 # Order Models
 class Order(models.Model):
@@ -177,6 +295,15 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     paid = models.BooleanField(default=False)
     paystack_reference = models.CharField(max_length=100, blank=True, unique=True, null=True)
+    # Printify fulfilment, set by the order outbox worker (shop/fulfilment.py)
+    external_id = models.CharField(max_length=100, blank=True, unique=True, null=True, help_text="external_id sent to Printify; identifies this order there.")
+    printify_order_id = models.CharField(max_length=100, blank=True, default='', db_index=True, help_text="Printify order ID once the order has been submitted.")
+    printify_status = models.CharField(max_length=50, blank=True, default='', help_text="Order status reported by Printify, or 'queued'/'failed' before it is accepted.")
+    # Shipping details, refreshed by `manage.py reconcile_printify_orders`
+    tracking_carrier = models.CharField(max_length=100, blank=True, default='')
+    tracking_number = models.CharField(max_length=255, blank=True, default='', help_text="Tracking number(s) of the order's shipments.")
+    tracking_url = models.URLField(max_length=1024, blank=True, default='')
+    fulfilled_at = models.DateTimeField(null=True, blank=True, help_text="When Printify reported the order fulfilled.")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -222,6 +349,105 @@ class OrderItem(models.Model):
     def get_cost(self):
         return self.price_at_purchase * self.quantity
 
+class PendingCheckout(models.Model):
+    """
+    A checkout sent to Paystack, keyed by the Paystack reference. Holds what is needed
+    to create the Order once payment is confirmed, so completion does not depend on the
+    customer's session; the Paystack callback and webhook both complete it (shop/checkout.py).
+    """
+    STATUS_CHOICES = [
+        ('initialized', 'Awaiting Payment'),
+        ('paid', 'Paid, Creating Order'),
+        ('completed', 'Order Created'),
+        ('failed', 'Payment Failed'),
+        ('expired', 'Expired'),
+    ]
+    # Allowed status changes; anything else is refused by shop.checkout.transition_checkout
+    TRANSITIONS = {
+        'initialized': ('paid', 'failed', 'expired'),
+        'failed': ('paid', 'expired'), # Paystack lets the customer retry a failed charge on the same reference
+        'paid': ('completed',),
+        'completed': (),
+        'expired': ('paid',), # A payment that arrives late is still honoured
+    }
+    reference = models.CharField(max_length=100, unique=True, help_text="Paystack transaction reference.")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='pending_checkouts')
+    cart = models.ForeignKey(Cart, on_delete=models.SET_NULL, null=True, blank=True, related_name='pending_checkouts', help_text="Cart emptied once the order is created.")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='initialized', db_index=True)
+    amount_kobo = models.BigIntegerField(help_text="Amount sent to Paystack, in kobo.")
+    customer = models.JSONField(default=dict, help_text="Contact and shipping details entered at checkout.")
+    lines = models.JSONField(default=dict, help_text="Cart lines with the charged unit prices in kobo, by cart key.")
+    printify_order = models.JSONField(default=dict, blank=True, help_text="Printify order payload to submit once paid.")
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='pending_checkout')
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Pending Checkout"
+        verbose_name_plural = "Pending Checkouts"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Checkout {self.reference} ({self.get_status_display()})"
+
+class PrintifyOrderOutbox(models.Model):
+    """
+    A paid order waiting to be submitted to Printify. Written in the same transaction as
+    the Order, so no paid order can be missed, and worked off by
+    `manage.py process_printify_outbox` with retries (shop/fulfilment.py).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('sent', 'Sent to Printify'),
+        ('failed', 'Failed'), # Gave up after PRINTIFY_ORDER_MAX_ATTEMPTS; retry from the admin
+    ]
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='printify_outbox')
+    payload = models.JSONField(help_text="Printify order payload, including its external_id.")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True, help_text="When a worker claimed this entry.")
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Printify Order Outbox Entry"
+        verbose_name_plural = "Printify Order Outbox"
+        ordering = ['next_attempt_at']
+        indexes = [
+            # The worker's poll: due entries in the order they are due
+            models.Index(fields=['status', 'next_attempt_at'], name='printify_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Printify submission of order {self.order_id} ({self.get_status_display()}, {self.attempts} attempt(s))"
+
+class PaystackEvent(models.Model):
+    """
+    A Paystack webhook event that has been handled. The unique (event, reference) pair
+    makes redeliveries of the same event a no-op (shop/webhooks.py).
+    """
+    event = models.CharField(max_length=50, help_text="Paystack event type, e.g. charge.success.")
+    reference = models.CharField(max_length=100, help_text="Paystack transaction reference.")
+    payload = models.JSONField(default=dict, help_text="The event's data object.")
+    result = models.CharField(max_length=255, blank=True, default='')
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Paystack Event"
+        verbose_name_plural = "Paystack Events"
+        ordering = ['-received_at']
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'reference'], name='unique_paystack_event_reference'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.reference}"
+
 
 # UserProfile MODEL FOR REFERRALS
 class UserProfile(models.Model):
@@ -343,4 +569,116 @@ class SiteEvent(models.Model):
         ordering = ['-event_datetime']
 
     def __str__(self):
-        return f"{self.get_event_name_display()} - {self.event_datetime.strftime('%Y-%m-%d %H:%M %Z')}"
\ No newline at end of file
+        return f"{self.get_event_name_display()} - {self.event_datetime.strftime('%Y-%m-%d %H:%M %Z')}"
+
+
+# Catalog Sync Tracking
+class SyncRun(models.Model):
+    """
+    One Printify catalog synchronization run, whether queued from the web,
+    started from `manage.py sync_printify`, or triggered by its scheduler.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('partial', 'Partially Succeeded'), # Some pages could not be fetched
+        ('failed', 'Failed'),
+    ]
+    TRIGGER_CHOICES = [
+        ('web', 'Requested from the website'),
+        ('command', 'Management command'),
+        ('schedule', 'Scheduler'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', db_index=True)
+    trigger = models.CharField(max_length=20, choices=TRIGGER_CHOICES, default='command')
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, help_text="Staff user who queued this run from the website.")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    pages_total = models.PositiveIntegerField(default=0)
+    pages_fetched = models.PositiveIntegerField(default=0)
+    products_created = models.PositiveIntegerField(default=0)
+    products_updated = models.PositiveIntegerField(default=0)
+    products_skipped = models.PositiveIntegerField(default=0, help_text="Products unchanged since the previous sync.")
+    products_removed = models.PositiveIntegerField(default=0, help_text="Products flagged as no longer in Printify.")
+    errors = models.JSONField(default=list, blank=True, help_text="Per-page and general errors encountered during the run.")
+
+    class Meta:
+        verbose_name = "Sync Run"
+        verbose_name_plural = "Sync Runs"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Sync run {self.id} ({self.get_status_display()}) created {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'trigger': self.trigger,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'pages_total': self.pages_total,
+            'pages_fetched': self.pages_fetched,
+            'created': self.products_created,
+            'updated': self.products_updated,
+            'skipped': self.products_skipped,
+            'removed': self.products_removed,
+            'errors': self.errors,
+        }
+
+
+# Exchange rates
+class ExchangeRate(models.Model):
+    """
+    USD -> NGN rate used to price Printify products. The newest rate whose effective_at
+    has passed is current; stored NGN prices are recomputed in bulk once it takes effect
+    (`manage.py reprice_catalog`, or automatically by the sync worker).
+    """
+    usd_to_ngn = models.DecimalField(max_digits=12, decimal_places=4, help_text="NGN per 1 USD, e.g. 1607.0000.")
+    effective_at = models.DateTimeField(default=timezone.now, db_index=True, help_text="When this rate starts to apply.")
+    applied_at = models.DateTimeField(null=True, blank=True, help_text="When stored product prices were recomputed with this rate.")
+    note = models.CharField(max_length=255, blank=True, default='')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='exchange_rates')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Exchange Rate"
+        verbose_name_plural = "Exchange Rates"
+        ordering = ['-effective_at', '-id']
+
+    def __str__(self):
+        return f"1 USD = {self.usd_to_ngn} NGN from {self.effective_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+# Precomputed catalog facets
+class CatalogFacet(models.Model):
+    """
+    Number of published products per category, color and size. Rebuilt after each
+    sync and adjusted per product by webhooks, so the list page never has to scan the
+    catalog for counts.
+    """
+    FACET_CHOICES = [
+        ('category', 'Category'),
+        ('color', 'Color'),
+        ('size', 'Size'),
+    ]
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    category = models.CharField(max_length=50, blank=True, default='', help_text="Category these counts are scoped to. Empty for the whole catalog.")
+    value = models.CharField(max_length=100)
+    product_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Catalog Facet"
+        verbose_name_plural = "Catalog Facets"
+        ordering = ['facet', 'category', '-product_count', 'value']
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'category', 'value'], name='unique_catalog_facet'),
+        ]
+
+    def __str__(self):
+        scope = f" in {self.category}" if self.category else ""
+        return f"{self.get_facet_display()} {self.value}{scope}: {self.product_count}"
@@ -0,0 +1,94 @@
+# shop/pricing.py
+"""
+Cart pricing in integer kobo.
+
+Cart lines carry their unit price as `price_kobo` (an int, stored on the CartItem
+row and copied into the line dicts of shop.cart.cart_lines), so the cart, checkout
+and order views add up whole numbers and convert to naira only for display and for
+the Decimal columns of Order/OrderItem. What the customer sees is exactly what
+Paystack charges.
+"""
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+KOBO_PER_NAIRA = 100
+
+PricedLine = namedtuple('PricedLine', ['key', 'item', 'unit_kobo', 'quantity', 'total_kobo'])
+
+
+def ngn_to_kobo(amount):
+    """Converts a naira amount (Decimal, str, int or float) to whole kobo, rounding half up."""
+    return int((Decimal(str(amount or 0)) * KOBO_PER_NAIRA).quantize(Decimal('1'), ROUND_HALF_UP))
+
+
+def kobo_to_ngn(kobo):
+    """Converts whole kobo to a naira Decimal with two places, e.g. 150050 -> Decimal('1500.50')."""
+    return Decimal(int(kobo)).scaleb(-2)
+
+
+def line_unit_kobo(item):
+    """Unit price of a cart line dict in kobo. Lines of old session carts, stored before prices were kept in kobo, only have a float `price`."""
+    if 'price_kobo' in item:
+        return int(item['price_kobo'])
+    return ngn_to_kobo(item.get('price', 0))
+
+
+def line_quantity(item):
+    try:
+        return max(int(item.get('quantity', 0)), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class CartPricing:
+    """
+    Prices every line of a cart once, given as {cart key: line dict} (see shop.cart.cart_lines).
+
+    `unit_prices` optionally overrides the stored unit price of some lines (by cart key),
+    e.g. with the current variant price at checkout.
+    """
+
+    def __init__(self, cart, unit_prices=None):
+        unit_prices = unit_prices or {}
+        self.lines = []
+        for key, item in cart.items():
+            unit_kobo = unit_prices[key] if key in unit_prices else line_unit_kobo(item)
+            quantity = line_quantity(item)
+            self.lines.append(PricedLine(key, item, unit_kobo, quantity, unit_kobo * quantity))
+        self.subtotal_kobo = sum(line.total_kobo for line in self.lines)
+
+    @property
+    def total_kobo(self):
+        """Amount to charge in kobo, as sent to Paystack. No shipping or fees are added yet."""
+        return self.subtotal_kobo
+
+    @property
+    def total_ngn(self):
+        return kobo_to_ngn(self.total_kobo)
+
+    def display_items(self):
+        """Cart lines for the cart and checkout templates, keyed by cart key, with naira prices."""
+        items = {}
+        for line in self.lines:
+            item = line.item.copy()
+            item.update({
+                'cart_key': line.key,
+                'quantity': line.quantity,
+                'price_kobo': line.unit_kobo,
+                'price_per_unit': kobo_to_ngn(line.unit_kobo),
+                'total_price': kobo_to_ngn(line.total_kobo),
+            })
+            items[line.key] = item
+        return items
+
+    def snapshot(self):
+        """Copy of the cart lines with the charged unit price of each, kept until the order is created."""
+        snapshot = {}
+        for line in self.lines:
+            item = line.item.copy()
+            item.pop('price', None)
+            item.pop('image_url', None)
+            item['price_kobo'] = line.unit_kobo
+            item['quantity'] = line.quantity
+            snapshot[line.key] = item
+        return snapshot
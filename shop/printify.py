@@ -1,8 +1,10 @@
+import base64
 import os
 import requests
 from dotenv import load_dotenv
 import json
 import logging
+from . import transport
 
 # Set up logging for this module
 logger = logging.getLogger(__name__)
@@ -10,6 +12,42 @@ logger = logging.getLogger(__name__)
 # Load environment variables from .env file
 load_dotenv()
 
+
+class ImageUploadBody:
+    """
+    Request body {"file_name": ..., "contents": "<base64>"} for uploads/images.json, encoded
+    from an open binary file while it is sent. Only one chunk of the file and its base64 are
+    held in memory at a time. Its exact length is known up front, so requests sends a
+    Content-Length rather than a chunked body. Readable once.
+    """
+    CHUNK_SIZE = 3 * 64 * 1024 # A multiple of 3, so the base64 of consecutive chunks concatenates
+
+    def __init__(self, file_name, fileobj, size):
+        prefix = json.dumps({"file_name": file_name, "contents": ""})
+        self._head = prefix[:-2].encode('utf-8') # Everything up to the opening quote of contents
+        self._tail = b'"}'
+        self._file = fileobj
+        self._length = len(self._head) + 4 * ((size + 2) // 3) + len(self._tail)
+        self._buffer = self._head
+        self._pos = 0
+        self._done = False
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        while not self._done and len(self._buffer) - self._pos < size:
+            chunk = self._file.read(self.CHUNK_SIZE)
+            self._buffer = self._buffer[self._pos:] + (base64.b64encode(chunk) if chunk else self._tail)
+            self._pos = 0
+            self._done = not chunk
+        data = self._buffer[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+
 class PrintifyAPI:
     """
     A client for interacting with the Printify API.
@@ -28,17 +66,18 @@ class PrintifyAPI:
             'Content-Type': 'application/json'
         }
 
-    def _make_request(self, method, endpoint, json_data=None, params=None, files=None, timeout=30):
+    def _make_request(self, method, endpoint, json_data=None, params=None, files=None, data=None, timeout=30):
         """
-        Internal helper to make API requests.
+        Internal helper to make API requests. `data` is a ready-made request body (e.g. an
+        ImageUploadBody), sent instead of `json_data`.
         """
         url = f"{self.base_url}/{endpoint}"
         
         try:
             if method == 'GET':
-                response = requests.get(url, headers=self.headers, params=params, timeout=timeout)
+                response = transport.get(url, headers=self.headers, params=params, timeout=timeout)
             elif method == 'POST':
-                response = requests.post(url, headers=self.headers, json=json_data, files=files, timeout=timeout)
+                response = transport.post(url, headers=self.headers, json=json_data, files=files, data=data, timeout=timeout)
             # Add other methods (PUT, DELETE) if needed
             else:
                 raise ValueError(f"Unsupported HTTP method: {method}")
@@ -92,29 +131,38 @@ class PrintifyAPI:
         logger.info(f"🔍 Fetching details for product {product_id} in shop {shop_id}")
         return self._make_request('GET', f"shops/{shop_id}/products/{product_id}.json")
 
-    def upload_image(self, file_name, contents_base64):
+    def upload_image(self, file_name, contents_base64=None, url=None):
         """
-        Uploads an image to Printify's asset library.
+        Uploads an image to Printify's asset library, either from a public `url` (Printify
+        downloads it, so nothing is re-sent from here) or from `contents_base64`.
         contents_base64 should be the pure base64 string (without "data:image/png;base64,")
         """
-        if not file_name or not contents_base64:
-            logger.error("❌ File name and base64 content are required for image upload.")
-            return {"error": "File name and base64 content are required."}
-
-        # Printify expects the base64 string without the "data:image/png;base64," prefix.
-        # Ensure the string is clean before sending.
-        # The request in views.py already handles splitting this, so just ensure it's not double-prefixed.
-        if contents_base64.startswith("data:"):
-            logger.warning("Base64 string for Printify upload still contains 'data:' prefix. Attempting to strip.")
-            contents_base64 = contents_base64.split(';base64,')[-1]
+        if not file_name or not (contents_base64 or url):
+            logger.error("❌ File name and an image URL or base64 content are required for image upload.")
+            return {"error": "File name and an image URL or base64 content are required."}
 
-        payload = {
-            "file_name": file_name,
-            "contents": contents_base64
-        }
-        logger.info(f"⬆️ Attempting to upload image: {file_name} to Printify Assets.")
+        if url:
+            payload = {"file_name": file_name, "url": url}
+        else:
+            # Printify expects the base64 string without the "data:image/png;base64," prefix.
+            if contents_base64.startswith("data:"):
+                logger.warning("Base64 string for Printify upload still contains 'data:' prefix. Attempting to strip.")
+                contents_base64 = contents_base64.split(';base64,')[-1]
+            payload = {"file_name": file_name, "contents": contents_base64}
+        logger.info(f"⬆️ Attempting to upload image: {file_name} to Printify Assets{' from ' + url if url else ''}.")
         return self._make_request('POST', 'uploads/images.json', json_data=payload, timeout=60) # Increased timeout for uploads
 
+    def upload_image_file(self, file_name, fileobj, size):
+        """
+        Uploads an image to Printify's asset library from an open binary file of `size` bytes,
+        base64-encoding it while the request is sent (see ImageUploadBody).
+        """
+        if not file_name or fileobj is None:
+            logger.error("❌ File name and an image file are required for image upload.")
+            return {"error": "File name and an image file are required."}
+        logger.info(f"⬆️ Attempting to upload image: {file_name} ({size} bytes) to Printify Assets.")
+        return self._make_request('POST', 'uploads/images.json', data=ImageUploadBody(file_name, fileobj, size), timeout=60)
+
     def create_order(self, shop_id, order_payload):
         """
         Creates an order in a Printify shop.
@@ -125,6 +173,36 @@ class PrintifyAPI:
         logger.info(f"🛒 Creating Printify order for shop {shop_id}.")
         return self._make_request('POST', f"shops/{shop_id}/orders.json", json_data=order_payload)
 
+    def get_orders(self, shop_id, limit=10, page=1):
+        """
+        Retrieves a page of a shop's orders, newest first.
+        """
+        if not shop_id:
+            logger.error("❌ Shop ID is required to fetch orders.")
+            return {"error": "Shop ID is required."}
+        return self._make_request('GET', f"shops/{shop_id}/orders.json", params={'limit': limit, 'page': page})
+
+    def get_webhooks(self, shop_id):
+        """
+        Lists the webhooks registered for a shop.
+        """
+        logger.info(f"🪝 Fetching webhooks for shop {shop_id}.")
+        return self._make_request('GET', f"shops/{shop_id}/webhooks.json")
+
+    def create_webhook(self, shop_id, topic, url, secret=None):
+        """
+        Registers a webhook for one event topic (e.g. 'product:deleted'). Printify signs
+        each delivery with `secret` in the X-Pfy-Signature header.
+        """
+        if not shop_id or not topic or not url:
+            logger.error("❌ Shop ID, topic and URL are required to create a webhook.")
+            return {"error": "Shop ID, topic and URL are required."}
+        payload = {"topic": topic, "url": url}
+        if secret:
+            payload["secret"] = secret
+        logger.info(f"🪝 Registering Printify webhook {topic} -> {url}")
+        return self._make_request('POST', f"shops/{shop_id}/webhooks.json", json_data=payload)
+
 # --- Main execution for testing (optional) ---
 if __name__ == "__main__":
     print("🚀 Starting Printify API Script (Standalone Test)...")
@@ -0,0 +1,154 @@
+# shop/search.py
+"""
+Full-text product search over title, description and tags.
+
+SQLite (the default db.sqlite3) uses an FTS5 table, shop_product_fts, whose
+triggers keep it in step with every write to shop_product, including the bulk
+upserts of the sync and webhook updates. Postgres uses a GIN index on a weighted
+tsvector expression, which the database maintains itself. Both are created by
+migration 0007_product_search_index. Other databases fall back to icontains.
+
+Later migrations that alter shop_product make SQLite rebuild the table, which
+drops its triggers, so ensure_search_index() re-creates them after every migrate.
+"""
+import logging
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+
+from .catalog import PRODUCT_LIST_FIELDS
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = 24
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_TERMS = 8
+
+SQLITE_FTS_TABLE = 'shop_product_fts'
+
+# Triggers keeping the external-content FTS table in step with shop_product (as in migration 0007)
+SQLITE_SEARCH_TRIGGERS = {
+    'shop_product_fts_ai': """CREATE TRIGGER IF NOT EXISTS shop_product_fts_ai AFTER INSERT ON shop_product BEGIN
+        INSERT INTO shop_product_fts(rowid, title, description, tags) VALUES (new.id, new.title, new.description, new.tags);
+    END""",
+    'shop_product_fts_ad': """CREATE TRIGGER IF NOT EXISTS shop_product_fts_ad AFTER DELETE ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, title, description, tags) VALUES ('delete', old.id, old.title, old.description, old.tags);
+    END""",
+    'shop_product_fts_au': """CREATE TRIGGER IF NOT EXISTS shop_product_fts_au AFTER UPDATE OF title, description, tags ON shop_product BEGIN
+        INSERT INTO shop_product_fts(shop_product_fts, rowid, title, description, tags) VALUES ('delete', old.id, old.title, old.description, old.tags);
+        INSERT INTO shop_product_fts(rowid, title, description, tags) VALUES (new.id, new.title, new.description, new.tags);
+    END""",
+}
+
+# Must match the indexed expression in migration 0007 exactly, or Postgres will not use the index.
+POSTGRES_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(tags::text, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
+
+def search_terms(query):
+    """Splits a search box query into at most SEARCH_MAX_TERMS word tokens."""
+    return re.findall(r'\w+', (query or '').lower())[:SEARCH_MAX_TERMS]
+
+
+def _sqlite_search(terms, limit, offset):
+    # Every term must match; the last one also matches as a prefix ("hood" -> "hoodie")
+    match = ' AND '.join(f'"{t}"' for t in terms[:-1]) + (' AND ' if len(terms) > 1 else '') + f'"{terms[-1]}"*'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {SQLITE_FTS_TABLE} f JOIN shop_product p ON p.id = f.rowid "
+            f"WHERE {SQLITE_FTS_TABLE} MATCH %s AND p.is_published",
+            [match],
+        )
+        total = cursor.fetchone()[0]
+        # bm25 weights follow the FTS column order: title, description, tags
+        cursor.execute(
+            f"SELECT f.rowid FROM {SQLITE_FTS_TABLE} f JOIN shop_product p ON p.id = f.rowid "
+            f"WHERE {SQLITE_FTS_TABLE} MATCH %s AND p.is_published "
+            f"ORDER BY bm25({SQLITE_FTS_TABLE}, 10.0, 1.0, 4.0), p.title LIMIT %s OFFSET %s",
+            [match, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()], total
+
+
+def _postgres_search(terms, limit, offset):
+    tsquery = ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM shop_product WHERE is_published AND ({POSTGRES_SEARCH_VECTOR}) @@ to_tsquery('english', %s)",
+            [tsquery],
+        )
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT id FROM shop_product WHERE is_published AND ({POSTGRES_SEARCH_VECTOR}) @@ to_tsquery('english', %s) "
+            f"ORDER BY ts_rank_cd({POSTGRES_SEARCH_VECTOR}, to_tsquery('english', %s)) DESC, title LIMIT %s OFFSET %s",
+            [tsquery, tsquery, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()], total
+
+
+def _fallback_search(terms, limit, offset):
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term) | Q(tags__icontains=term)
+    matches = Product.objects.filter(condition, is_published=True).order_by('title')
+    return list(matches.values_list('id', flat=True)[offset:offset + limit]), matches.count()
+
+
+def search_products(query, page=1, page_size=SEARCH_PAGE_SIZE):
+    """
+    Runs a ranked full-text search over published products.
+    Returns (products, total): the Product rows of the requested page in rank order
+    (list-page columns only) and the total number of matches.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], 0
+    page_size = max(1, min(page_size, SEARCH_MAX_PAGE_SIZE))
+    offset = (max(page, 1) - 1) * page_size
+
+    if connection.vendor == 'sqlite':
+        ids, total = _sqlite_search(terms, page_size, offset)
+    elif connection.vendor == 'postgresql':
+        ids, total = _postgres_search(terms, page_size, offset)
+    else:
+        ids, total = _fallback_search(terms, page_size, offset)
+
+    found = Product.objects.only(*PRODUCT_LIST_FIELDS).in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found], total
+
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    """
+    Re-indexes every product. Only needed on SQLite if the FTS table was created
+    after products were stored or got out of step; Postgres maintains its index.
+    """
+    if connections[using].vendor == 'sqlite':
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
+        logger.info("🔎 Rebuilt the product search index.")
+
+
+def ensure_search_index(using=DEFAULT_DB_ALIAS):
+    """
+    Re-creates missing SQLite search triggers and re-indexes if any were missing.
+    Does nothing before migration 0007 has created the FTS table, or on other databases.
+    Returns True if the index was repaired.
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE name = %s OR name LIKE 'shop_product_fts_a_'", [SQLITE_FTS_TABLE])
+        existing = {name for _type, name in cursor.fetchall()}
+        if SQLITE_FTS_TABLE not in existing or existing.issuperset(SQLITE_SEARCH_TRIGGERS):
+            return False
+        for statement in SQLITE_SEARCH_TRIGGERS.values():
+            cursor.execute(statement)
+    logger.warning("⚠️ Product search triggers were missing (shop_product was rebuilt); re-created them.")
+    rebuild_search_index(using)
+    return True
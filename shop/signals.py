@@ -1,6 +1,7 @@
 # shop/signals.py
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_migrate
 from django.dispatch import receiver
+from django.contrib.auth.signals import user_logged_in
 from django.conf import settings
 from .models import UserProfile, WinningCode 
 from django.utils import timezone # *** ADDED THIS IMPORT ***
@@ -32,3 +33,22 @@ def process_successful_referral(referrer_user_profile):
                 print(f"Unlocked first digit '{referrer_user_profile.unlocked_first_digit}' for {referrer_user_profile.user.username} from code {winning_code_to_reveal.code}")
             else:
                 print(f"User {referrer_user_profile.user.username} reached 30 referrals, but no unclaimed winning codes available to reveal a digit (or code was empty).")
+
+
+@receiver(post_migrate)
+def repair_product_search_index(sender, using=None, **kwargs):
+    """
+    SQLite drops a table's triggers when a migration rebuilds it, which would silently
+    stop search indexing. Re-create them after migrations of the shop app.
+    """
+    if getattr(sender, 'name', None) == 'shop':
+        from .search import ensure_search_index
+        ensure_search_index(using or 'default')
+
+
+@receiver(user_logged_in)
+def merge_guest_cart_on_login(sender, request, user, **kwargs):
+    """Moves whatever a guest put in their cart into the account they just signed in to."""
+    if request is not None and hasattr(request, 'session'):
+        from .cart import merge_guest_cart
+        merge_guest_cart(request, user)
@@ -0,0 +1,304 @@
+# shop/sync.py
+"""
+Printify -> local database catalog synchronization.
+"""
+import logging
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .catalog import (
+    EXCHANGE_RATE_CACHE_KEY, build_product_defaults, cents_to_ngn, current_exchange_rate, product_content_hash,
+    rebuild_catalog_facets, save_product_variants,
+)
+from .models import CatalogFacet, Product, ProductVariant, SyncRun
+from .printify import PrintifyAPI
+
+logger = logging.getLogger(__name__)
+
+# One page of the Printify product listing. `error` is None when the page was fetched.
+PageResult = namedtuple('PageResult', ['page', 'products', 'error', 'last_page'])
+
+# Counts reported by sync_products_to_db.
+SyncStats = namedtuple('SyncStats', ['created', 'updated', 'skipped', 'removed'])
+
+# Rows per INSERT/UPDATE statement and per `printify_id IN (...)` lookup.
+SYNC_BATCH_SIZE = 500
+
+# Fields rewritten when a product changed. Excludes mockup_image (set in admin) and created_at.
+SYNCED_PRODUCT_FIELDS = [
+    'title', 'category', 'description', 'base_price_ngn', 'primary_image_url', 'image_urls', 'variants_data',
+    'variant_map', 'product_options_data', 'tags', 'printify_shop_id',
+    'printify_blueprint_id', 'printify_print_provider_id', 'is_published',
+    'last_synced_at', 'content_hash', 'printify_updated_at', 'removed_from_printify_at',
+    'updated_at',
+]
+
+
+def _fetch_page(api, shop_id, page, limit, last_page=None):
+    response = api.get_products(shop_id, limit=limit, page=page)
+    if not isinstance(response, dict):
+        return PageResult(page, [], f"Unexpected response for page {page}.", last_page or page)
+    if response.get('error'):
+        return PageResult(page, [], response['error'], last_page or page)
+    return PageResult(page, response.get('data', []), None, last_page or int(response.get('last_page') or page))
+
+
+def iter_product_pages(api, shop_id, limit=100, max_workers=None):
+    """
+    Yields every page of a shop's products as a PageResult, in page order.
+
+    Page 1 is read first to learn `last_page`; later pages are fetched on a thread
+    pool with at most `max_workers` requests in flight (settings.PRINTIFY_SYNC_CONCURRENCY
+    by default). A new page is only requested when the consumer takes one, so at most
+    `max_workers` + 1 pages are held in memory regardless of catalog size.
+
+    A failed page is yielded with its error instead of aborting the iteration.
+    """
+    if max_workers is None:
+        max_workers = settings.PRINTIFY_SYNC_CONCURRENCY
+
+    first = _fetch_page(api, shop_id, 1, limit)
+    if first.error:
+        logger.error(f"❌ Failed to fetch products page 1: {first.error}")
+    yield first
+    last_page = first.last_page
+    if first.error or last_page <= 1:
+        return
+
+    logger.info(f"📚 Streaming pages 2-{last_page} with {max_workers} concurrent requests.")
+    pages = iter(range(2, last_page + 1))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, last_page - 1))) as executor:
+        in_flight = deque()
+        for page in pages:
+            in_flight.append(executor.submit(_fetch_page, api, shop_id, page, limit, last_page))
+            if len(in_flight) >= max_workers:
+                break
+        while in_flight:
+            result = in_flight.popleft().result()
+            next_page = next(pages, None)
+            if next_page is not None:
+                in_flight.append(executor.submit(_fetch_page, api, shop_id, next_page, limit, last_page))
+            if result.error:
+                logger.error(f"❌ Failed to fetch products page {result.page}: {result.error}")
+            yield result
+
+
+def _chunks(items, size=SYNC_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def sync_products_to_db(products_from_api):
+    """
+    Synchronizes product data fetched from Printify API into the local Django database.
+    Called once per fetched page by the streaming sync.
+
+    Products whose content hash matches the stored one are skipped without any write.
+    New and changed products and their ProductVariant rows are upserted with
+    bulk_create(update_conflicts=True) in batches inside one transaction, so a no-op
+    sync costs one SELECT per SYNC_BATCH_SIZE products.
+    """
+    incoming = {str(pd.get("id")): pd for pd in products_from_api or []}
+    if not incoming:
+        return SyncStats(0, 0, 0, 0)
+
+    stored_hashes = {}
+    for pid_batch in _chunks(incoming):
+        stored_hashes.update(Product.objects.filter(printify_id__in=pid_batch).values_list('printify_id', 'content_hash'))
+
+    to_write = []
+    created_count = updated_count = 0
+    for pid, pd in incoming.items():
+        content_hash = product_content_hash(pd)
+        if stored_hashes.get(pid) == content_hash:
+            continue
+        try:
+            to_write.append(Product(printify_id=pid, updated_at=timezone.now(), **build_product_defaults(pd, content_hash)))
+        except Exception as e:
+            logger.error(f"Error preparing product {pid} for sync: {e}")
+            continue
+        if pid in stored_hashes: updated_count += 1
+        else: created_count += 1
+
+    if to_write:
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                to_write,
+                batch_size=SYNC_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['printify_id'],
+                update_fields=SYNCED_PRODUCT_FIELDS,
+            )
+            # Variants of the written products, keyed by the (possibly new) product pks
+            written = {product.printify_id: product.variants_data for product in to_write}
+            product_pks = {}
+            for pid_batch in _chunks(written):
+                product_pks.update(Product.objects.filter(printify_id__in=pid_batch).values_list('printify_id', 'id'))
+            save_product_variants([(product_pks[pid], incoming[pid], variants) for pid, variants in written.items()])
+
+    skipped_count = len(incoming) - len(to_write)
+    logger.info(f"💾 Synced {len(incoming)} products: {created_count} created, {updated_count} updated, {skipped_count} unchanged.")
+    return SyncStats(created_count, updated_count, skipped_count, 0)
+
+
+def flag_removed_products(seen_printify_ids):
+    """
+    Unpublishes products that a complete sync did not see in Printify any more and
+    stamps removed_from_printify_at. The content hash is cleared so that a product which
+    comes back unchanged is rewritten (and republished) rather than skipped.
+    Only call this after every page was fetched.
+    Returns the number of products flagged.
+    """
+    now = timezone.now()
+    seen = set(seen_printify_ids)
+    current = Product.objects.filter(removed_from_printify_at__isnull=True).values_list('printify_id', flat=True)
+    missing = [pid for pid in current if pid not in seen]
+    with transaction.atomic():
+        for pid_batch in _chunks(missing):
+            Product.objects.filter(printify_id__in=pid_batch).update(is_published=False, removed_from_printify_at=now, content_hash='', updated_at=now)
+    if missing:
+        logger.info(f"🗑️ Flagged {len(missing)} products no longer in Printify.")
+    return len(missing)
+
+
+# --- Exchange-rate repricing ---
+
+def reprice_catalog(exchange_rate=None, force=False):
+    """
+    Recomputes every stored NGN price from the stored USD cents at `exchange_rate`
+    (default: the rate in effect now) and marks the rate as applied.
+
+    ProductVariant.price_kobo is recomputed by a single UPDATE in integer arithmetic.
+    Product.base_price_ngn and the price_ngn values inside variants_data are rewritten in
+    batches of SYNC_BATCH_SIZE products with bulk_update, so memory stays bounded.
+    Returns the number of products repriced (0 if the rate was already applied and not force).
+    """
+    exchange_rate = exchange_rate or current_exchange_rate()
+    if exchange_rate is None or (exchange_rate.applied_at and not force):
+        return 0
+    rate = exchange_rate.usd_to_ngn
+    cache.delete(EXCHANGE_RATE_CACHE_KEY) # New syncs price with this rate from now on
+    logger.info(f"💱 Repricing catalog at 1 USD = {rate} NGN.")
+
+    # kobo = round_half_up(cents * rate); the rate has 4 decimal places, so scale it to an integer
+    rate_e4 = int(rate * 10000)
+    variants_repriced = ProductVariant.objects.update(
+        price_kobo=(Cast(F('price_cents'), BigIntegerField()) * rate_e4 + 5000) / 10000,
+    )
+
+    products_repriced = 0
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    for id_batch in _chunks(product_ids):
+        products = list(Product.objects.filter(id__in=id_batch).only('id', 'variants_data'))
+        for product in products:
+            for variant in product.variants_data or []:
+                variant['price_ngn'] = float(cents_to_ngn(variant.get('price_cents', 0), rate))
+            first_variant = (product.variants_data or [{}])[0]
+            product.base_price_ngn = cents_to_ngn(first_variant.get('price_cents', 0), rate)
+        with transaction.atomic():
+            Product.objects.bulk_update(products, ['variants_data', 'base_price_ngn'], batch_size=SYNC_BATCH_SIZE)
+        products_repriced += len(products)
+
+    exchange_rate.applied_at = timezone.now()
+    exchange_rate.save(update_fields=['applied_at'])
+    cache.delete(EXCHANGE_RATE_CACHE_KEY)
+    logger.info(f"✅ Repriced {products_repriced} products and {variants_repriced} variants at 1 USD = {rate} NGN.")
+    return products_repriced
+
+
+# --- Sync runs ---
+
+def enqueue_sync_run(requested_by=None):
+    """
+    Queues a catalog sync for the sync worker (`manage.py sync_printify --every ...`).
+    If a run is already queued or running, that run is returned instead of a new one.
+    Returns (sync_run, created).
+    """
+    active_run = SyncRun.objects.filter(status__in=['queued', 'running']).order_by('created_at').first()
+    if active_run:
+        return active_run, False
+    return SyncRun.objects.create(status='queued', trigger='web', requested_by=requested_by), True
+
+
+def claim_next_queued_run():
+    """
+    Atomically moves the oldest queued run to 'running' and returns it, or None.
+    Safe when several workers poll the queue at once.
+    """
+    for run_id in SyncRun.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:5]:
+        if SyncRun.objects.filter(id=run_id, status='queued').update(status='running', started_at=timezone.now()):
+            return SyncRun.objects.get(id=run_id)
+    return None
+
+
+def fail_stale_runs(max_age_seconds=6 * 60 * 60):
+    """Marks runs stuck in 'running' (e.g. the worker was killed) as failed."""
+    cutoff = timezone.now() - timedelta(seconds=max_age_seconds)
+    return SyncRun.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='failed', finished_at=timezone.now(), errors=[{'error': 'Run did not finish (worker stopped?).'}]
+    )
+
+
+def execute_sync_run(sync_run, api=None, shop_id=None):
+    """
+    Runs a full catalog sync and records its progress and outcome on sync_run.
+    """
+    shop_id = shop_id or settings.PRINTIFY_SHOP_ID
+    sync_run.status = 'running'
+    sync_run.started_at = sync_run.started_at or timezone.now()
+    sync_run.errors = []
+    sync_run.save(update_fields=['status', 'started_at', 'errors'])
+    logger.info(f"🔄 Sync run {sync_run.id} started ({sync_run.trigger}).")
+
+    try:
+        if not shop_id:
+            raise ValueError("PRINTIFY_SHOP_ID is not configured.")
+        api = api or PrintifyAPI()
+
+        # Streaming pipeline: fetch page -> transform -> write batch. Each page is written
+        # and released before the next one is taken; only product IDs are kept across pages.
+        seen_printify_ids = set()
+        for result in iter_product_pages(api, shop_id, limit=100):
+            sync_run.pages_total = result.last_page
+            if result.error:
+                sync_run.errors = sync_run.errors + [{'page': result.page, 'error': result.error}]
+            else:
+                sync_run.pages_fetched += 1
+                stats = sync_products_to_db(result.products)
+                sync_run.products_created += stats.created
+                sync_run.products_updated += stats.updated
+                sync_run.products_skipped += stats.skipped
+                seen_printify_ids.update(str(product.get('id')) for product in result.products)
+            del result
+            # Progress is visible at /sync/<id>/ while the run is going
+            sync_run.save(update_fields=['pages_total', 'pages_fetched', 'products_created', 'products_updated', 'products_skipped', 'errors'])
+
+        if sync_run.errors:
+            sync_run.status = 'partial' if seen_printify_ids else 'failed'
+        else:
+            # Only a complete, non-empty listing can tell us which products disappeared
+            if seen_printify_ids:
+                sync_run.products_removed = flag_removed_products(seen_printify_ids)
+            sync_run.status = 'succeeded'
+
+        if sync_run.products_created or sync_run.products_updated or sync_run.products_removed or not CatalogFacet.objects.exists():
+            rebuild_catalog_facets()
+    except Exception as e:
+        logger.exception(f"❌ Sync run {sync_run.id} failed:")
+        sync_run.errors = sync_run.errors + [{'error': str(e)}]
+        sync_run.status = 'failed'
+
+    sync_run.finished_at = timezone.now()
+    sync_run.save()
+    logger.info(f"✅ Sync run {sync_run.id} finished: {sync_run.status} (created {sync_run.products_created}, updated {sync_run.products_updated}, unchanged {sync_run.products_skipped}, removed {sync_run.products_removed}).")
+    return sync_run
@@ -1,3 +1,700 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .cart import CartOperationError, add_item, apply_cart_operations, get_item
+from .catalog import EXCHANGE_RATE_CACHE_KEY, catalog_page, cents_to_ngn, invalidate_product_caches, mark_product_removed, product_facet_keys, product_to_detail, rebuild_catalog_facets, upsert_product
+from .checkout import complete_checkout
+from .fulfilment import OUTBOX_LOCK_SECONDS, RECONCILE_WATERMARK_MARGIN, process_outbox, reconcile_high_water_mark, reconcile_printify_orders, release_stale_entries, requeue_entries
+from .models import Cart, CatalogFacet, CustomDesign, ExchangeRate, Order, OrderItem, PaystackEvent, PendingCheckout, PrintifyOrderOutbox, Product
+from .printify import ImageUploadBody
+from .sync import SyncStats, flag_removed_products, reprice_catalog, sync_products_to_db
+from .webhooks import handle_printify_event
+
+PAYSTACK_TEST_SECRET = 'sk_test_webhook'
+
+
+def printify_product(printify_id='p1', title='Classic Tee', **fields):
+    """A minimal product as returned by the Printify API."""
+    return {
+        'id': printify_id,
+        'title': title,
+        'description': 'Soft cotton tee.',
+        'visible': True,
+        'images': [
+            {'src': f'https://images.example/{printify_id}/front.png', 'variant_ids': [1], 'is_default': True},
+            {'src': f'https://images.example/{printify_id}/back.png', 'variant_ids': [1], 'is_default': False},
+        ],
+        'options': [
+            {'name': 'Colors', 'type': 'color', 'values': [{'id': 521, 'title': 'Black'}]},
+            {'name': 'Sizes', 'type': 'size', 'values': [{'id': 14, 'title': 'M'}]},
+        ],
+        'variants': [{'id': 1, 'title': 'Black / M', 'price': 1000, 'sku': 'TEE-B-M', 'options': [521, 14]}],
+        **fields,
+    }
+
+
+@override_settings(PAYSTACK_SECRET_KEY=PAYSTACK_TEST_SECRET)
+class PaystackWebhookTests(TestCase):
+    """POST /webhooks/paystack/: signature check and idempotent completion of checkouts."""
+
+    def setUp(self):
+        self.pending = PendingCheckout.objects.create(
+            reference='HOXOBIL-TEST1',
+            amount_kobo=1500000,
+            customer={'first_name': 'Ada', 'email': 'ada@example.com', 'address': '1 Marina', 'city': 'Lagos', 'state': 'Lagos'},
+            lines={},
+            printify_order={'external_id': 'hoxobil_order_HOXOBIL-TEST1'},
+        )
+
+    def charge_success(self, **data):
+        data = {'reference': self.pending.reference, 'amount': self.pending.amount_kobo, 'currency': 'NGN', 'status': 'success', **data}
+        return {'event': 'charge.success', 'data': data}
+
+    def post_event(self, event, secret=PAYSTACK_TEST_SECRET, signature=None):
+        body = json.dumps(event).encode('utf-8')
+        if signature is None:
+            signature = hmac.new(secret.encode('utf-8'), body, hashlib.sha512).hexdigest()
+        headers = {'HTTP_X_PAYSTACK_SIGNATURE': signature} if signature else {}
+        return self.client.post(reverse('paystack_webhook'), body, content_type='application/json', **headers)
+
+    def test_signed_charge_success_completes_checkout(self):
+        response = self.post_event(self.charge_success())
+
+        self.assertEqual(response.status_code, 200)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'completed')
+        order = Order.objects.get(paystack_reference=self.pending.reference)
+        self.assertEqual(self.pending.order, order)
+        self.assertTrue(order.paid)
+        self.assertEqual(order.first_name, 'Ada')
+        self.assertTrue(PrintifyOrderOutbox.objects.filter(order=order).exists())
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.post_event(self.charge_success(), secret='sk_test_wrong')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Order.objects.exists())
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'initialized')
+
+    def test_missing_signature_is_rejected(self):
+        response = self.post_event(self.charge_success(), signature='')
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Order.objects.exists())
+
+    def test_redelivered_event_creates_one_order(self):
+        first = self.post_event(self.charge_success())
+        second = self.post_event(self.charge_success())
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertIn('already processed', second.json()['message'])
+        self.assertEqual(Order.objects.filter(paystack_reference=self.pending.reference).count(), 1)
+        self.assertEqual(PrintifyOrderOutbox.objects.count(), 1)
+        self.assertEqual(PaystackEvent.objects.filter(reference=self.pending.reference).count(), 1)
+
+    def test_amount_mismatch_fails_checkout(self):
+        response = self.post_event(self.charge_success(amount=100))
+
+        self.assertEqual(response.status_code, 200)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'failed')
+        self.assertIn('Amount mismatch', self.pending.last_error)
+        self.assertFalse(Order.objects.exists())
+
+    def test_currency_mismatch_fails_checkout(self):
+        response = self.post_event(self.charge_success(currency='USD'))
+
+        self.assertEqual(response.status_code, 200)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'failed')
+        self.assertFalse(Order.objects.exists())
+
+
+@mock.patch('shop.views.PAYSTACK_SECRET_KEY', PAYSTACK_TEST_SECRET)
+class PaystackCallbackTests(TestCase):
+    """GET /paystack/callback/ before the webhook: the verified charge must match the checkout."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('ada@example.com', 'pw', first_name='Ada', last_name='Lovelace')
+        self.client.force_login(self.user)
+        self.pending = PendingCheckout.objects.create(
+            reference='HOXOBIL-TEST4',
+            amount_kobo=1500000,
+            customer={'first_name': 'Ada', 'email': 'ada@example.com'},
+            lines={},
+            printify_order={'external_id': 'hoxobil_order_HOXOBIL-TEST4'},
+        )
+
+    def callback(self, **data):
+        verified = mock.Mock()
+        verified.json.return_value = {'status': True, 'data': {'status': 'success', 'amount': self.pending.amount_kobo, 'currency': 'NGN', **data}}
+        with mock.patch('shop.views.transport.get', return_value=verified):
+            return self.client.get(reverse('paystack_callback'), {'reference': self.pending.reference})
+
+    def test_matching_charge_completes_checkout(self):
+        response = self.callback()
+
+        self.assertRedirects(response, reverse('order_success', kwargs={'order_reference': self.pending.reference}), fetch_redirect_response=False)
+        self.assertTrue(Order.objects.filter(paystack_reference=self.pending.reference).exists())
+
+    def test_charge_in_another_currency_is_rejected(self):
+        response = self.callback(currency='USD')
+
+        self.assertRedirects(response, reverse('order_failure_specific', kwargs={'error_message': 'Payment amount mismatch.'}), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+    def test_charge_for_another_amount_is_rejected(self):
+        response = self.callback(amount=100)
+
+        self.assertRedirects(response, reverse('order_failure_specific', kwargs={'error_message': 'Payment amount mismatch.'}), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+
+class CompleteCheckoutTests(TestCase):
+    """complete_checkout() creates at most one Order per Paystack reference."""
+
+    def setUp(self):
+        self.pending = PendingCheckout.objects.create(
+            reference='HOXOBIL-TEST2',
+            amount_kobo=1500000,
+            customer={'first_name': 'Ada', 'email': 'ada@example.com'},
+            lines={'p1_1': {'id': 'p1', 'variant_id': '1', 'title': 'Tee', 'variant_title': 'L', 'price_kobo': 500000, 'quantity': 3, 'is_custom': False}},
+            printify_order={},
+        )
+
+    def test_second_call_returns_existing_order(self):
+        order, created = complete_checkout(self.pending)
+        duplicate = PendingCheckout.objects.get(pk=self.pending.pk)
+        again, created_again = complete_checkout(duplicate)
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again, order)
+        self.assertEqual(Order.objects.filter(paystack_reference=self.pending.reference).count(), 1)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 1)
+        self.assertEqual(PrintifyOrderOutbox.objects.count(), 1)
+
+    def test_stale_checkout_returns_existing_order(self):
+        order, _ = complete_checkout(self.pending)
+        stale = PendingCheckout.objects.get(pk=self.pending.pk)
+        stale.status = 'initialized' # As read by a request racing the one that completed it
+
+        again, created = complete_checkout(stale)
+
+        self.assertFalse(created)
+        self.assertEqual(again, order)
+        self.assertEqual(OrderItem.objects.count(), 1)
+        self.assertEqual(PrintifyOrderOutbox.objects.count(), 1)
+
+    def test_order_already_stored_under_reference_is_reused(self):
+        existing = Order.objects.create(paystack_reference=self.pending.reference, total_amount=15000, paid=True)
+
+        order, created = complete_checkout(self.pending)
+
+        self.assertFalse(created)
+        self.assertEqual(order, existing)
+        self.assertEqual(Order.objects.filter(paystack_reference=self.pending.reference).count(), 1)
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(PrintifyOrderOutbox.objects.exists())
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'completed')
+        self.assertEqual(self.pending.order, existing)
+
+
+class ProductDetailTests(TestCase):
+    """Stored products render the same detail data as a live Printify fetch."""
+
+    def test_detail_keeps_every_printify_image(self):
+        product = upsert_product(printify_product())
+
+        images = product_to_detail(product)['images']
+
+        self.assertEqual([image['src'] for image in images], [
+            'https://images.example/p1/front.png',
+            'https://images.example/p1/back.png',
+        ])
+
+    def test_detail_page_shows_thumbnail_gallery(self):
+        upsert_product(printify_product())
+
+        response = self.client.get(reverse('product_detail', kwargs={'product_id': 'p1'}))
+
+        self.assertContains(response, 'thumbnail-images')
+        self.assertContains(response, 'https://images.example/p1/back.png')
+
+
+class IncrementalSyncTests(TestCase):
+    """sync_products_to_db skips unchanged products, but never leaves a returning product unpublished."""
+
+    def test_unchanged_product_is_skipped(self):
+        sync_products_to_db([printify_product()])
+
+        stats = sync_products_to_db([printify_product()])
+
+        self.assertEqual(stats, SyncStats(created=0, updated=0, skipped=1, removed=0))
+
+    def test_changed_product_is_updated(self):
+        sync_products_to_db([printify_product()])
+
+        stats = sync_products_to_db([printify_product(title='Classic Tee v2')])
+
+        self.assertEqual(stats, SyncStats(created=0, updated=1, skipped=0, removed=0))
+        self.assertEqual(Product.objects.get(printify_id='p1').title, 'Classic Tee v2')
+
+    def test_product_missing_from_one_sync_is_republished_when_back(self):
+        sync_products_to_db([printify_product()])
+        self.assertEqual(flag_removed_products(seen_printify_ids=[]), 1)
+
+        stats = sync_products_to_db([printify_product()])
+
+        self.assertEqual(stats.updated, 1)
+        product = Product.objects.get(printify_id='p1')
+        self.assertTrue(product.is_published)
+        self.assertIsNone(product.removed_from_printify_at)
+
+    def test_product_deleted_by_webhook_is_republished_when_back(self):
+        sync_products_to_db([printify_product()])
+        self.assertTrue(mark_product_removed('p1'))
+
+        stats = sync_products_to_db([printify_product()])
+
+        self.assertEqual(stats.updated, 1)
+        self.assertTrue(Product.objects.get(printify_id='p1').is_published)
+
+
+class CatalogFacetAdjustmentTests(TestCase):
+    """Product webhooks move the facet counts by one product instead of rebuilding them."""
+
+    def setUp(self):
+        upsert_product(printify_product('p1', 'Classic Tee'))
+        upsert_product(printify_product('p2', 'Cozy Hoodie'))
+        rebuild_catalog_facets()
+
+    def facet_counts(self):
+        return set(CatalogFacet.objects.values_list('facet', 'category', 'value', 'product_count'))
+
+    def test_adjusted_counts_match_a_full_rebuild(self):
+        before = product_facet_keys('p1')
+        changed = printify_product('p1', 'Classic Hoodie')
+        changed['options'][0]['values'] = [{'id': 522, 'title': 'Navy'}]
+        upsert_product(changed)
+
+        invalidate_product_caches('p1', before)
+        adjusted = self.facet_counts()
+        rebuild_catalog_facets()
+
+        self.assertEqual(adjusted, self.facet_counts())
+
+    @override_settings(PRINTIFY_SHOP_ID='shop1')
+    def test_deleted_product_webhook_does_not_rebuild(self):
+        event = {'id': 'evt1', 'type': 'product:deleted', 'resource': {'id': 'p2', 'type': 'product', 'data': {'shop_id': 'shop1'}}}
+
+        with mock.patch('shop.catalog.rebuild_catalog_facets') as rebuild:
+            ok, _message = handle_printify_event(event)
+
+        self.assertTrue(ok)
+        rebuild.assert_not_called()
+        adjusted = self.facet_counts()
+        rebuild_catalog_facets()
+        self.assertEqual(adjusted, self.facet_counts())
+
+
+class CatalogPaginationTests(TestCase):
+    """catalog_page: keyset cursors walk the catalog in (title, id) order in both directions."""
+
+    def setUp(self):
+        titles = [('Alpha Tee', 'T-Shirts'), ('Beta Mug', 'Mugs'), ('Beta Mug', 'Mugs'), ('Delta Tee', 'T-Shirts'), ('Echo Mug', 'Mugs'), ('Foxtrot Tee', 'T-Shirts')]
+        for n, (title, category) in enumerate(titles):
+            Product.objects.create(printify_id=f'p{n}', title=title, category=category)
+        Product.objects.create(printify_id='hidden', title='Aardvark Tee', category='T-Shirts', is_published=False)
+        self.expected = list(Product.objects.filter(is_published=True).order_by('title', 'pk').values_list('pk', flat=True))
+
+    def walk_forward(self, **kwargs):
+        pages, cursor = [], None
+        while True:
+            rows, next_cursor, prev_cursor = catalog_page(cursor=cursor, page_size=2, **kwargs)
+            pages.append((rows, next_cursor, prev_cursor))
+            if next_cursor is None:
+                return pages
+            cursor = next_cursor
+
+    def test_next_cursors_visit_every_product_once(self):
+        pages = self.walk_forward()
+
+        self.assertEqual([product.pk for rows, _n, _p in pages for product in rows], self.expected)
+        self.assertIsNone(pages[0][2])
+
+    def test_prev_cursor_returns_the_previous_page(self):
+        pages = self.walk_forward()
+
+        for (earlier, _n, _p), (_rows, _next, prev_cursor) in zip(pages, pages[1:]):
+            rows, _next_cursor, _prev_cursor = catalog_page(cursor=prev_cursor, page_size=2)
+            self.assertEqual([product.pk for product in rows], [product.pk for product in earlier])
+
+    def test_category_filter_pages_only_that_category(self):
+        pages = self.walk_forward(category='Mugs')
+
+        titles = [product.title for rows, _n, _p in pages for product in rows]
+        self.assertEqual(titles, ['Beta Mug', 'Beta Mug', 'Echo Mug'])
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ('not-a-cursor', 'WyJzaWRld2F5cyIsIngiLDFd'): # the second decodes to ["sideways","x",1]
+            with self.assertRaises(ValueError):
+                catalog_page(cursor=cursor)
+
+
+class RepriceCatalogTests(TestCase):
+    """reprice_catalog: stored NGN prices follow a new exchange rate, in integer kobo."""
+
+    PRICES_CENTS = [1, 999, 1000, 2499]
+
+    def setUp(self):
+        cache.delete(EXCHANGE_RATE_CACHE_KEY)
+        product = printify_product()
+        product['variants'] = [
+            {'id': n, 'title': f'Variant {n}', 'price': cents, 'sku': f'SKU-{n}', 'options': []}
+            for n, cents in enumerate(self.PRICES_CENTS, start=1)
+        ]
+        self.product = upsert_product(product)
+
+    def tearDown(self):
+        cache.delete(EXCHANGE_RATE_CACHE_KEY)
+
+    def test_prices_follow_the_new_rate_rounding_half_up(self):
+        rate = ExchangeRate.objects.create(usd_to_ngn=Decimal('1607.3333'))
+
+        self.assertEqual(reprice_catalog(rate), 1)
+
+        variants = dict(self.product.variants.values_list('price_cents', 'price_kobo'))
+        self.assertEqual(variants, {cents: int(cents_to_ngn(cents, rate.usd_to_ngn) * 100) for cents in self.PRICES_CENTS})
+        self.assertEqual(variants[1], 1607) # 1607.3333 kobo
+        self.assertEqual(variants[999], 1605726) # 1605725.9667 kobo
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.base_price_ngn, Decimal('16.07'))
+        self.assertEqual([v['price_ngn'] for v in self.product.variants_data], [16.07, 16057.26, 16073.33, 40167.26])
+
+    def test_exact_half_kobo_rounds_up(self):
+        rate = ExchangeRate.objects.create(usd_to_ngn=Decimal('1.5'))
+
+        reprice_catalog(rate)
+
+        self.assertEqual(self.product.variants.get(price_cents=1).price_kobo, 2) # 1.5 kobo
+
+    def test_applied_rate_is_not_reapplied_unless_forced(self):
+        rate = ExchangeRate.objects.create(usd_to_ngn=Decimal('1500'))
+        reprice_catalog(rate)
+        rate.refresh_from_db()
+
+        self.assertIsNotNone(rate.applied_at)
+        self.assertEqual(reprice_catalog(rate), 0)
+        self.assertEqual(reprice_catalog(rate, force=True), 1)
+
+
+class CartBatchTests(TestCase):
+    """apply_cart_operations and POST /cart/batch/: all operations apply, or none do."""
+
+    def setUp(self):
+        upsert_product(printify_product())
+        self.user = get_user_model().objects.create_user('ada@example.com', 'pw', first_name='Ada', last_name='Lovelace')
+        self.cart = Cart.objects.create(user=self.user)
+        add_item(self.cart, 'p1-1', 1, printify_product_id='p1', variant_id='1', title='Classic Tee', variant_title='Black / M', price_kobo=1607, is_custom=False)
+
+    def post_batch(self, operations):
+        self.client.force_login(self.user)
+        return self.client.post(reverse('cart_batch'), json.dumps({'operations': operations}), content_type='application/json')
+
+    def test_failing_operation_rolls_back_the_earlier_ones(self):
+        operations = [
+            {'op': 'set_quantity', 'key': 'p1-1', 'quantity': 5},
+            {'op': 'add', 'product_id': 'p1', 'variant_id': '999', 'quantity': 1},
+        ]
+
+        with self.assertRaises(CartOperationError) as raised:
+            with transaction.atomic():
+                apply_cart_operations(self.cart, operations, self.user)
+
+        self.assertEqual(raised.exception.index, 1)
+        self.assertEqual(get_item(self.cart, 'p1-1').quantity, 1)
+
+    def test_view_reports_the_failing_operation_and_leaves_the_cart_alone(self):
+        response = self.post_batch([
+            {'op': 'set_quantity', 'key': 'p1-1', 'quantity': 5},
+            {'op': 'remove', 'key': 'p1-1'},
+            {'op': 'frobnicate'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertEqual(body['operation'], 2)
+        self.assertEqual([line['quantity'] for line in body['cart']['items']], [1])
+        self.assertEqual(get_item(self.cart, 'p1-1').quantity, 1)
+
+    def test_view_applies_every_operation(self):
+        response = self.post_batch([
+            {'op': 'set_quantity', 'key': 'p1-1', 'quantity': 3},
+            {'op': 'add', 'product_id': 'p1', 'variant_id': '1', 'quantity': 2},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_item(self.cart, 'p1-1').quantity, 5)
+
+    def test_too_many_operations_are_rejected_before_any_apply(self):
+        response = self.post_batch([{'op': 'set_quantity', 'key': 'p1-1', 'quantity': 2}] * 51)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(response.json()['operation'])
+        self.assertEqual(get_item(self.cart, 'p1-1').quantity, 1)
+
+
+class PrintifyOutboxTests(TestCase):
+    """process_outbox submits each paid order to Printify once, across failures, crashes and requeues."""
+
+    def setUp(self):
+        self.order = Order.objects.create(paystack_reference='HOXOBIL-TEST3', total_amount=15000, paid=True)
+        self.entry = PrintifyOrderOutbox.objects.create(order=self.order, payload={'external_id': 'HOXOBIL-TEST3', 'line_items': []})
+        self.api = mock.Mock()
+        self.api.create_order.return_value = {'id': 'pf-1', 'status': 'on-hold'}
+        self.api.get_orders.return_value = {
+            'data': [{'id': 'pf-1', 'external_id': 'HOXOBIL-TEST3', 'status': 'on-hold', 'created_at': timezone.now().isoformat()}],
+            'last_page': 1,
+        }
+
+    def test_first_attempt_submits_without_looking_up(self):
+        self.assertEqual(process_outbox(api=self.api, shop_id='1'), (1, 0))
+
+        self.api.get_orders.assert_not_called()
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('sent', 1))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.printify_order_id, 'pf-1')
+
+    def test_failed_attempt_is_counted_and_retried_later(self):
+        self.api.create_order.return_value = {'error': 'Service unavailable'}
+
+        self.assertEqual(process_outbox(api=self.api, shop_id='1'), (0, 1))
+
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('pending', 1))
+        self.assertEqual(self.entry.last_error, 'Service unavailable')
+        self.assertGreater(self.entry.next_attempt_at, timezone.now())
+
+    def test_crash_after_create_order_does_not_submit_twice(self):
+        # The worker dies after Printify created the order but before it was recorded
+        with mock.patch('shop.fulfilment._mark_sent', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                process_outbox(api=self.api, shop_id='1')
+        PrintifyOrderOutbox.objects.filter(pk=self.entry.pk).update(locked_at=timezone.now() - timedelta(seconds=OUTBOX_LOCK_SECONDS + 1))
+        self.assertEqual(release_stale_entries(), 1)
+
+        self.assertEqual(process_outbox(api=self.api, shop_id='1'), (1, 0))
+
+        self.assertEqual(self.api.create_order.call_count, 1)
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('sent', 2))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.printify_order_id, 'pf-1')
+
+    def test_requeued_entry_looks_up_before_submitting(self):
+        PrintifyOrderOutbox.objects.filter(pk=self.entry.pk).update(status='failed', attempts=8, last_error='Read timed out.')
+        self.assertEqual(requeue_entries(PrintifyOrderOutbox.objects.all()), 1)
+
+        self.assertEqual(process_outbox(api=self.api, shop_id='1'), (1, 0))
+
+        self.api.get_orders.assert_called_once()
+        self.api.create_order.assert_not_called()
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('sent', 1))
+
+
+class ReconcilePrintifyOrdersTests(TestCase):
+    """reconcile_printify_orders reads Printify orders back to the high-water mark and updates Orders in bulk."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.done = self.create_order('HOXOBIL-R1', days_ago=10, printify_order_id='pf-1', printify_status='fulfilled')
+        self.shipping = self.create_order('HOXOBIL-R2', days_ago=3, printify_order_id='pf-2', printify_status='in-production')
+        self.waiting = self.create_order('HOXOBIL-R3', days_ago=1, printify_order_id='pf-3', printify_status='on-hold')
+        self.unsubmitted = self.create_order('HOXOBIL-R4', days_ago=5, printify_status='queued')
+        product = Product.objects.create(printify_id='p1', title='Classic Tee')
+        self.design = CustomDesign.objects.create(
+            product=product, design_image='custom_designs/test.png', selected_product_type='T-Shirt',
+            selected_size='M', selected_color='Black', status='order_created',
+        )
+        OrderItem.objects.create(order=self.shipping, product=product, custom_design=self.design, product_title='Classic Tee', quantity=1, price_at_purchase=16000)
+
+    def create_order(self, reference, days_ago, **fields):
+        order = Order.objects.create(paystack_reference=reference, external_id=f'hoxobil_order_{reference}', total_amount=16000, paid=True, **fields)
+        Order.objects.filter(pk=order.pk).update(created_at=self.now - timedelta(days=days_ago))
+        order.refresh_from_db()
+        return order
+
+    def printify_order(self, order, days_ago, status, **fields):
+        return {
+            'id': order.printify_order_id, 'external_id': order.external_id, 'status': status,
+            'created_at': (self.now - timedelta(days=days_ago)).isoformat(), **fields,
+        }
+
+    def test_high_water_mark_is_the_oldest_unfinished_submitted_order(self):
+        self.assertEqual(reconcile_high_water_mark(), self.shipping.created_at - RECONCILE_WATERMARK_MARGIN)
+
+        Order.objects.exclude(printify_order_id='').update(printify_status='canceled')
+        self.assertIsNone(reconcile_high_water_mark())
+
+    def test_updates_changed_orders_and_stops_paging_at_the_mark(self):
+        shipped = self.printify_order(
+            self.shipping, 3, 'fulfilled', fulfilled_at=self.now.isoformat(),
+            shipments=[{'carrier': 'DHL', 'number': 'JD0001', 'url': 'https://track.example/JD0001'}],
+        )
+        api = mock.Mock()
+        api.get_orders.side_effect = [
+            {'data': [self.printify_order(self.waiting, 1, 'on-hold'), {'id': 'pf-x', 'status': 'on-hold', 'created_at': self.now.isoformat()}], 'last_page': 3},
+            {'data': [shipped, self.printify_order(self.done, 10, 'fulfilled')], 'last_page': 3},
+        ]
+        waiting_updated_at = self.waiting.updated_at
+
+        read, updated, fulfilled = reconcile_printify_orders(api=api, shop_id='1')
+
+        self.assertEqual((read, updated, fulfilled), (2, 1, 1))
+        self.assertEqual(api.get_orders.call_count, 2) # page 2 reaches orders older than the mark
+        self.shipping.refresh_from_db()
+        self.assertEqual(self.shipping.printify_status, 'fulfilled')
+        self.assertEqual((self.shipping.tracking_carrier, self.shipping.tracking_number), ('DHL', 'JD0001'))
+        self.assertEqual(self.shipping.tracking_url, 'https://track.example/JD0001')
+        self.assertIsNotNone(self.shipping.fulfilled_at)
+        self.design.refresh_from_db()
+        self.assertEqual(self.design.status, 'fulfilled')
+        self.waiting.refresh_from_db()
+        self.assertEqual(self.waiting.updated_at, waiting_updated_at) # unchanged orders are not written
+
+    def test_nothing_to_reconcile_reads_no_pages(self):
+        Order.objects.exclude(printify_order_id='').update(printify_status='fulfilled')
+        api = mock.Mock()
+
+        self.assertEqual(reconcile_printify_orders(api=api, shop_id='1'), (0, 0, 0))
+        api.get_orders.assert_not_called()
+
+
+def image_bytes(image_format='PNG'):
+    """A tiny image encoded in `image_format`."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), 'black').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class ImageUploadBodyTests(TestCase):
+    """ImageUploadBody streams the JSON body of a Printify image upload with an exact length."""
+
+    def test_body_is_the_json_upload_payload(self):
+        for size in (0, 1, 2, 3, ImageUploadBody.CHUNK_SIZE + 1):
+            contents = bytes(range(256)) * (size // 256) + bytes(size % 256)
+            body = ImageUploadBody('design "1".png', io.BytesIO(contents), size)
+
+            sent = b''.join(iter(lambda: body.read(1000), b''))
+
+            self.assertEqual(len(sent), len(body))
+            self.assertEqual(json.loads(sent), {'file_name': 'design "1".png', 'contents': base64.b64encode(contents).decode()})
+
+
+@mock.patch('shop.views.PRINTIFY_API_TOKEN', 'test-token')
+class SubmitCustomDesignTests(TestCase):
+    """POST /api/submit-custom-design/: only real PNG/JPEG images within the size limit are stored and uploaded."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.product = Product.objects.create(printify_id='p1', title='Classic Tee')
+        self.user = get_user_model().objects.create_user('ada@example.com', 'pw', first_name='Ada', last_name='Lovelace')
+        self.client.force_login(self.user)
+        self.uploaded = {}
+        client_patch = mock.patch('shop.views.printify_client')
+        self.printify_client = client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.printify_client.upload_image_file.side_effect = self.read_upload
+
+    def read_upload(self, file_name, fileobj, size):
+        self.uploaded[file_name] = json.loads(ImageUploadBody(file_name, fileobj, size).read())
+        return {'id': 'img-1'}
+
+    def submit(self, design_image):
+        return self.client.post(reverse('submit_custom_design'), {
+            'product_id': self.product.id, 'design_image': design_image,
+            'product_type': 'T-Shirt', 'size': 'M', 'color': 'Black',
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_png_file_is_stored_and_uploaded(self):
+        png = image_bytes()
+
+        response = self.submit(SimpleUploadedFile('design.png', png, content_type='image/png'))
+
+        self.assertEqual(response.status_code, 200)
+        design = CustomDesign.objects.get()
+        self.assertEqual((design.status, design.printify_image_id), ('uploaded_to_printify', 'img-1'))
+        self.assertTrue(design.design_image.name.endswith('.png'))
+        (payload,) = self.uploaded.values()
+        self.assertEqual(base64.b64decode(payload['contents']), png)
+
+    def test_non_image_bytes_are_rejected(self):
+        response = self.submit(SimpleUploadedFile('design.png', b'not an image at all', content_type='image/png'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CustomDesign.objects.exists())
+        self.printify_client.upload_image_file.assert_not_called()
+
+    def test_spoofed_content_type_is_rejected(self):
+        # A real image, but a GIF sent as image/png
+        response = self.submit(SimpleUploadedFile('design.png', image_bytes('GIF'), content_type='image/png'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CustomDesign.objects.exists())
+
+    def test_jpeg_sent_as_png_is_stored_as_jpeg(self):
+        response = self.submit(SimpleUploadedFile('design.png', image_bytes('JPEG'), content_type='image/png'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(CustomDesign.objects.get().design_image.name.endswith('.jpg'))
+
+    def test_file_over_the_size_limit_is_rejected(self):
+        oversized = image_bytes() + bytes(25 * 1024 * 1024)
+
+        response = self.submit(SimpleUploadedFile('design.png', oversized, content_type='image/png'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'The design image is too large.')
+        self.assertFalse(CustomDesign.objects.exists())
+
+    def test_legacy_data_url_is_accepted(self):
+        png = image_bytes()
+
+        response = self.submit('data:image/png;base64,' + base64.b64encode(png).decode())
+
+        self.assertEqual(response.status_code, 200)
+        (payload,) = self.uploaded.values()
+        self.assertEqual(base64.b64decode(payload['contents']), png)
+
+    def test_unreadable_data_url_is_rejected(self):
+        response = self.submit('data:image/png,iVBORw0KGgo')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CustomDesign.objects.exists())
@@ -0,0 +1,101 @@
+# shop/transport.py
+"""
+Shared outbound HTTP transport for everything that talks to Printify or Paystack.
+
+One requests.Session per worker process keeps a keep-alive connection pool per
+host, so repeated calls reuse TCP+TLS connections instead of handshaking every
+time. Idempotent requests are retried on 429/5xx with jittered exponential
+backoff, honouring (a capped) Retry-After header.
+"""
+import logging
+import os
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+DEFAULT_TIMEOUT = 30
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class CappedRetry(Retry):
+    """
+    Retry policy that honours Retry-After but never sleeps longer than
+    settings.HTTP_RETRY_AFTER_MAX seconds, so a web worker is not parked
+    for minutes by an upstream rate limiter.
+    """
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, settings.HTTP_RETRY_AFTER_MAX)
+
+
+def build_retry():
+    """
+    Retries connection errors for any method (nothing was sent yet), but only
+    retries read errors and 429/5xx responses for idempotent methods. POSTs such
+    as Paystack initialization or Printify order creation are never re-sent.
+    """
+    return CappedRetry(
+        total=settings.HTTP_MAX_RETRIES,
+        connect=settings.HTTP_MAX_RETRIES,
+        backoff_factor=settings.HTTP_RETRY_BACKOFF,
+        backoff_jitter=settings.HTTP_RETRY_BACKOFF,
+        backoff_max=settings.HTTP_RETRY_AFTER_MAX,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _build_session():
+    session = requests.Session()
+    # urllib3 keeps a separate pool per host; pool_maxsize bounds the number of
+    # kept-alive connections per host in this worker process.
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+        max_retries=build_retry(),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Returns this process's shared Session. A new one is built after a fork
+    (e.g. gunicorn preload) so workers never share sockets with their parent.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+                logger.debug(f"Built pooled HTTP session for process {pid}.")
+    return _session
+
+
+def request(method, url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Sends a request through the shared pooled session. Same arguments as requests.request."""
+    return get_session().request(method, url, timeout=timeout, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
@@ -9,6 +9,8 @@ urlpatterns = [
 
     # Product views
     path('products/', views.fetch_printify_products, name='product_list'),
+    path('products/search/', views.product_search, name='product_search'),
+    path('api/catalog/', views.catalog_api, name='catalog_api'),
     path('product/<str:product_id>/', views.product_detail, name='product_detail'),
 
     # --- NEW: Product Customizer URL ---
@@ -20,6 +22,7 @@ urlpatterns = [
     path('cart/add/<str:product_id>/', views.add_to_cart, name='add_to_cart'), 
     path('cart/add/custom/', views.add_to_cart_custom_design_ajax, name='add_to_cart_custom_design_ajax'), # Make sure this one is here
     path('cart/remove/<str:cart_key>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
 
     # Checkout URLs
     path('checkout/', views.checkout_page, name='checkout'),
@@ -35,6 +38,11 @@ urlpatterns = [
 
     # Product Synchronization URL
     path('sync/', views.sync_products_view, name='sync_products'),
+    path('sync/<int:run_id>/', views.sync_run_status, name='sync_run_status'),
+
+    # Webhooks
+    path('webhooks/printify/', views.printify_webhook, name='printify_webhook'),
+    path('webhooks/paystack/', views.paystack_webhook, name='paystack_webhook'),
 
     # Competition URLs
     path('competition/', views.competition_page, name='competition_page'),
@@ -1,26 +1,44 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import HttpResponse, JsonResponse, Http404, HttpResponseBadRequest
 from django.urls import reverse
-from .models import Product, Order, OrderItem, WinningCode, CompetitionAttempt, SiteEvent, UserProfile, CustomDesign
+from .models import Product, Order, PendingCheckout, WinningCode, CompetitionAttempt, SiteEvent, UserProfile, CustomDesign, SyncRun
 import requests
 import os
 import json
 import uuid
 from django.contrib import messages
 from django.conf import settings
-from decimal import Decimal, ROUND_HALF_UP
 from django.utils import timezone
+from django.db import transaction
 from django.views.decorators.http import require_POST, require_http_methods
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth import login, logout, authenticate, get_user_model
+from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from collections import defaultdict
 from django.contrib.auth.views import redirect_to_login
 from .forms import CustomUserCreationForm, EmailAuthenticationForm
 from .signals import process_successful_referral
 from .printify import PrintifyAPI # Import your PrintifyAPI client
+from . import transport # Pooled, retrying HTTP session for Printify/Paystack
+from .sync import enqueue_sync_run
+from .pricing import CartPricing, ngn_to_kobo
+from .checkout import create_pending_checkout, fail_checkout, complete_checkout
+from .cart import get_cart, cart_lines, cart_item_count, get_item, add_item, set_quantity, remove_item, apply_cart_operations, cart_summary, load_cart_references, CartOperationError
+from .webhooks import verify_printify_signature, handle_printify_event, verify_paystack_signature, handle_paystack_event, PAYSTACK_CURRENCY
+from .search import search_products, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE
+from .catalog import (
+    cents_to_ngn, current_usd_ngn_rate, PLACEHOLDER_IMAGE_URL, use_local_catalog, catalog_last_synced_at, is_fresh,
+    product_to_list_item, product_to_api_item, product_to_detail, upsert_product,
+    refresh_product_in_background, last_refresh_failed, lookup_variant, resolve_variant_id, product_synced_at,
+    infer_category_from_title, resolve_category, catalog_facets, catalog_page, CATALOG_API_FIELDS, CATALOG_PAGE_SIZE,
+)
 import base64 # For base64 encoding/decoding image data
+from django import forms
+from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from django.template.defaultfilters import slugify # For generating clean filenames
 import logging
 
@@ -41,8 +59,6 @@ if not PRINTIFY_SHOP_ID: logger.warning("🔴 CRITICAL WARNING: PRINTIFY_SHOP_ID
 
 # Define common headers for Printify API requests
 HEADERS = { 'Authorization': f'Bearer {PRINTIFY_API_TOKEN}', 'Content-Type': 'application/json'}
-# Define USD to NGN conversion rate. IMPORTANT: Keep this up-to-date!
-USD_TO_NGN_RATE = Decimal('1607.00')
 API_BASE_URL = "https://api.printify.com/v1"
 PAYSTACK_API_BASE_URL = "https://api.paystack.co"
 
@@ -50,23 +66,6 @@ PAYSTACK_API_BASE_URL = "https://api.paystack.co"
 printify_client = PrintifyAPI(api_key=PRINTIFY_API_TOKEN)
 
 
-# --- Cart Helper Functions ---
-def get_cart(request):
-    """
-    Retrieves the current cart from the user's session.
-    If no cart exists, an empty dictionary is returned.
-    """
-    cart = request.session.get('cart', {})
-    return cart
-
-def save_cart(request, cart):
-    """
-    Saves the provided cart dictionary back into the user's session.
-    Marks the session as modified to ensure it's saved.
-    """
-    request.session['cart'] = cart
-    request.session.modified = True
-
 # --- General Views ---
 def home(request):
     """
@@ -74,140 +73,252 @@ def home(request):
     """
     return render(request, 'mystore/home.html')
 
-def infer_category_from_title(title):
+def categorize_local_products(category=None, cursor=None):
     """
-    Infers a product category based on keywords in its title.
-    This is a simple heuristic and can be expanded.
+    Builds one page of the categorized product list from the local Product table with one
+    indexed keyset query, using the category stored at sync time. Pass category to list
+    only that one. Returns (categorized_products, next_cursor, prev_cursor).
     """
-    title_lower = title.lower()
-    if "hoodie" in title_lower or "hooded sweatshirt" in title_lower: return "Hoodies & Sweatshirts"
-    if "t-shirt" in title_lower or "tee" in title_lower: return "T-Shirts"
-    if "jogger" in title_lower or "sweatpants" in title_lower: return "Joggers & Sweatpants"
-    if "tank top" in title_lower: return "Tank Tops"
-    if "mug" in title_lower: return "Mugs"
-    if "poster" in title_lower: return "Posters & Wall Art"
-    return "Other"
+    products, next_cursor, prev_cursor = catalog_page(category, cursor)
+    categorized_products = defaultdict(list)
+    for product in products:
+        categorized_products[product.category].append(product_to_list_item(product))
+    return dict(categorized_products), next_cursor, prev_cursor
 
-def fetch_printify_products(request):
+def categorize_live_products(only_category=None):
     """
-    Fetches products from the Printify API, processes their data (e.g., price conversion),
-    categorizes them, and renders the product list page.
+    Fetches products from the Printify API, processes their data (e.g., price conversion)
+    and categorizes them. Raises on any API or processing error.
     """
-    # Check for API configuration before making external requests
-    if not PRINTIFY_API_TOKEN:
-        messages.error(request, "API token not configured.")
-        return render(request, 'mystore/products.html', {'categorized_products': {}, 'error': 'API token not configured.'})
-    if not PRINTIFY_SHOP_ID:
-        messages.error(request, "Shop ID not configured.")
-        return render(request, 'mystore/products.html', {'categorized_products': {}, 'error': 'Shop ID not configured.'})
-
     api_url = f"{API_BASE_URL}/shops/{PRINTIFY_SHOP_ID}/products.json"
     categorized_products = defaultdict(list)
-    error_message_for_template = None
 
-    try:
-        # Make a GET request to the Printify API
-        response = requests.get(api_url, headers=HEADERS, timeout=15)
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        raw_products = response.json().get('data', [])
-
-        # Process each product fetched from Printify
-        for item in raw_products:
-            variants = item.get('variants', [])
-            # Get the price of the first variant as a base price, if available
-            price_cents = variants[0].get('price', 0) if variants else 0
-            # Convert price from cents (Printify) to NGN
-            price_ngn = (Decimal(price_cents) / Decimal('100.0')) * USD_TO_NGN_RATE
-            # Get the first image URL, or a placeholder if none
-            img_url = item.get('images', [{}])[0].get('src', 'https://placehold.co/600x400?text=No+Image')
-            product_title = item.get('title', 'No Title')
-            category = infer_category_from_title(product_title)
-
-            proc_variants = []
-            # Process each variant of the product
-            for v_data in variants:
-                v_price_cents = Decimal(v_data.get('price', 0))
-                v_price_ngn = (v_price_cents / Decimal('100.0')) * USD_TO_NGN_RATE
-                proc_variants.append({
-                    'id': str(v_data.get('id')),
-                    'title': v_data.get('title', 'N/A'),
-                    'price_ngn': float(v_price_ngn.quantize(Decimal('0.01'), ROUND_HALF_UP)),
-                    'is_enabled': v_data.get('is_enabled', False),
-                    'is_available': v_data.get('is_available', True),
-                    'option_value_ids': [str(oid) for oid in v_data.get('options',[])]
-                })
-            
-            # Prepare product data for the template
-            product_item_data = {
-                'id': str(item.get('id')),
-                'title': product_title,
-                'price': float(price_ngn.quantize(Decimal('0.01'), ROUND_HALF_UP)),
-                'image_url': img_url,
-                'variants': proc_variants,
-                'options': item.get('options', [])
-            }
-            categorized_products[category].append(product_item_data)
+    # Make a GET request to the Printify API
+    response = transport.get(api_url, headers=HEADERS, timeout=15)
+    response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
+    raw_products = response.json().get('data', [])
+    rate = current_usd_ngn_rate()
+
+    # Process each product fetched from Printify
+    for item in raw_products:
+        variants = item.get('variants', [])
+        # Get the price of the first variant as a base price, if available
+        price_cents = variants[0].get('price', 0) if variants else 0
+        # Convert price from cents (Printify) to NGN at the current exchange rate
+        price_ngn = cents_to_ngn(price_cents, rate)
+        # Get the first image URL, or a placeholder if none
+        img_url = item.get('images', [{}])[0].get('src', PLACEHOLDER_IMAGE_URL)
+        product_title = item.get('title', 'No Title')
+        category = infer_category_from_title(product_title)
+        if only_category and category != only_category:
+            continue
+
+        proc_variants = []
+        # Process each variant of the product
+        for v_data in variants:
+            v_price_ngn = cents_to_ngn(v_data.get('price', 0), rate)
+            proc_variants.append({
+                'id': str(v_data.get('id')),
+                'title': v_data.get('title', 'N/A'),
+                'price_ngn': float(v_price_ngn),
+                'is_enabled': v_data.get('is_enabled', False),
+                'is_available': v_data.get('is_available', True),
+                'option_value_ids': [str(oid) for oid in v_data.get('options',[])]
+            })
+        
+        # Prepare product data for the template
+        product_item_data = {
+            'id': str(item.get('id')),
+            'title': product_title,
+            'price': float(price_ngn),
+            'image_url': img_url,
+            'variants': proc_variants,
+            'options': item.get('options', [])
+        }
+        categorized_products[category].append(product_item_data)
+
+    return dict(categorized_products)
 
+def fetch_printify_products(request):
+    """
+    Renders the product list page, optionally for one category (?category=hoodies).
+    Local pages are keyset-paginated (?cursor=...) in title order.
+    In 'local' catalog mode the list is served from the synced Product table while it is
+    fresh (see CATALOG_MAX_AGE_SECONDS). Otherwise products are fetched live from Printify,
+    and if that fails the last synced local data is served instead of an error.
+    """
+    category = None
+    if request.GET.get('category'):
+        category = resolve_category(request.GET['category'])
+        if category is None:
+            raise Http404("Unknown category.")
+    cursor = request.GET.get('cursor') or None
+
+    def list_page(categorized_products, error=None, **extra):
+        context = {
+            'categorized_products': categorized_products,
+            'error': error,
+            'active_category': category,
+            'active_category_slug': request.GET.get('category', '') if category else '',
+            'facets': catalog_facets(category),
+            **extra,
+        }
+        return render(request, 'mystore/products.html', context)
+
+    def local_page(**extra):
+        try:
+            categorized_products, next_cursor, prev_cursor = categorize_local_products(category, cursor)
+        except ValueError:
+            return HttpResponseBadRequest("Invalid cursor.")
+        return list_page(categorized_products, next_cursor=next_cursor, prev_cursor=prev_cursor, **extra)
+
+    local_synced_at = None
+    if use_local_catalog():
+        local_synced_at = catalog_last_synced_at()
+        if is_fresh(local_synced_at):
+            return local_page()
+        if local_synced_at:
+            logger.warning(f"⚠️ Local catalog is stale (last synced {local_synced_at.isoformat()}). Trying Printify.")
+
+    # Check for API configuration before making external requests
+    if not PRINTIFY_API_TOKEN or not PRINTIFY_SHOP_ID:
+        error_message_for_template = 'API token not configured.' if not PRINTIFY_API_TOKEN else 'Shop ID not configured.'
+        if local_synced_at:
+            return local_page(catalog_is_stale=True)
+        messages.error(request, error_message_for_template)
+        return list_page({}, error_message_for_template)
+
+    try:
+        return list_page(categorize_live_products(category))
     except Exception as e:
         # Catch any exceptions during API call or data processing
         error_message_for_template = f"Error fetching products: {str(e)}"
         logger.error(f"❌ {error_message_for_template}")
-        messages.error(request, "Could not fetch products.")
-        
-    return render(request, 'mystore/products.html', {'categorized_products': dict(categorized_products), 'error': error_message_for_template })
+
+    if local_synced_at:
+        # Printify is unavailable, but we still have the last synced catalog.
+        logger.info("ℹ️ Serving stale local catalog because Printify could not be reached.")
+        return local_page(catalog_is_stale=True)
+
+    messages.error(request, "Could not fetch products.")
+    return list_page({}, error_message_for_template)
+
+def catalog_api(request):
+    """
+    Compact JSON catalog for the frontend and mobile apps, served from the local Product table.
+    GET /api/catalog/?category=hoodies&cursor=...&page_size=24. Follow next_cursor/prev_cursor
+    to page; only the listing columns are loaded, never the variant JSON.
+    """
+    category = None
+    if request.GET.get('category'):
+        category = resolve_category(request.GET['category'])
+        if category is None:
+            return JsonResponse({'status': 'error', 'message': 'Unknown category.'}, status=404)
+    try:
+        page_size = int(request.GET.get('page_size', CATALOG_PAGE_SIZE))
+        products, next_cursor, prev_cursor = catalog_page(category, request.GET.get('cursor') or None, page_size, fields=CATALOG_API_FIELDS)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({
+        'category': category,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'results': [product_to_api_item(product) for product in products],
+    })
+
+def product_search(request):
+    """
+    Ranked full-text search over product titles, descriptions and tags.
+    GET /products/search/?q=hoodie&page=1&page_size=24 returns one page of results as JSON.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = max(1, min(int(request.GET.get('page_size', SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'page and page_size must be integers.'}, status=400)
+
+    products, total = search_products(query, page=page, page_size=page_size)
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'page_size': page_size,
+        'total': total,
+        'has_next': page * page_size < total,
+        'results': [product_to_api_item(product) for product in products],
+    })
+
+def fetch_live_product_detail(product_id):
+    """
+    Fetches details for a single product from Printify and processes them for the template.
+    Raises on any API or processing error.
+    """
+    url = f"{API_BASE_URL}/shops/{PRINTIFY_SHOP_ID}/products/{product_id}.json"
+    res = transport.get(url, headers=HEADERS, timeout=10)
+    res.raise_for_status()
+    item = res.json()
+
+    # Store what we fetched so the next visit is served locally
+    local_product_obj = upsert_product(item)
+    rate = current_usd_ngn_rate()
+
+    # Process product options for display
+    opts = [{'name':o.get('name'),'type':o.get('type'),'values':[{'id':str(v.get('id')),'title':v.get('title')} for v in o.get('values',[])]} for o in item.get('options',[])]
+    
+    proc_vars = []
+    # Process product variants for display
+    for v_data in item.get('variants', []):
+        v_price_ngn = cents_to_ngn(v_data.get('price',0), rate)
+        proc_vars.append({
+            'id':str(v_data.get('id')),
+            'title':v_data.get('title','N/A'),
+            'price_ngn':float(v_price_ngn),
+            'is_enabled':v_data.get('is_enabled',False),
+            'is_available':v_data.get('is_available',True),
+            'option_value_ids':[str(oid) for oid in v_data.get('options',[])]
+        })
+    base_price = proc_vars[0]['price_ngn'] if proc_vars else 0.0
+
+    # Prepare final product data for the template
+    return {
+        'id':str(item.get('id')),
+        'title':item.get('title','N/A'),
+        'description':item.get('description',''),
+        'images':item.get('images',[]),
+        'options':opts,
+        'variants':proc_vars,
+        'price': base_price,
+        'mockup_image_url': local_product_obj.mockup_image.url if local_product_obj.mockup_image else None
+    }
 
 def product_detail(request, product_id):
     """
-    Fetches details for a single product from Printify, processes it,
-    and renders the product detail page.
+    Renders the product detail page from the stored Product row (stale-while-revalidate).
+    If the row is older than PRODUCT_DETAIL_TTL_SECONDS a background refresh from Printify
+    is started and the stored data is served right away. Only products we have never
+    synced are fetched from Printify while the visitor waits.
     """
+    local_product_obj = Product.objects.filter(printify_id=product_id).first()
+    if local_product_obj:
+        is_stale = False
+        if not is_fresh(product_synced_at(local_product_obj), settings.PRODUCT_DETAIL_TTL_SECONDS):
+            if PRINTIFY_API_TOKEN and PRINTIFY_SHOP_ID:
+                refresh_product_in_background(local_product_obj.printify_id)
+            # Flag the page only when Printify could not be reached on the last attempt
+            is_stale = last_refresh_failed(local_product_obj.printify_id)
+        return render(request, 'mystore/product_detail.html', {'product': product_to_detail(local_product_obj), 'error': None, 'is_stale': is_stale})
+
     # Check for API configuration
     if not PRINTIFY_API_TOKEN or not PRINTIFY_SHOP_ID:
         messages.error(request, "API/Shop token not configured.")
         return render(request, 'mystore/product_detail.html', {'product': None, 'error': 'Configuration error.'})
     
-    url = f"{API_BASE_URL}/shops/{PRINTIFY_SHOP_ID}/products/{product_id}.json"
     product_data_for_template = None
     error_msg = None
 
     try:
-        # Fetch product details from Printify
-        res = requests.get(url, headers=HEADERS, timeout=10)
-        res.raise_for_status()
-        item = res.json()
-
-        # Process product options for display
-        opts = [{'name':o.get('name'),'type':o.get('type'),'values':[{'id':str(v.get('id')),'title':v.get('title')} for v in o.get('values',[])]} for o in item.get('options',[])]
-        
-        proc_vars = []
-        # Process product variants for display
-        for v_data in item.get('variants', []):
-            v_price_ngn = (Decimal(v_data.get('price',0))/Decimal('100.0'))*USD_TO_NGN_RATE
-            proc_vars.append({
-                'id':str(v_data.get('id')),
-                'title':v_data.get('title','N/A'),
-                'price_ngn':float(v_price_ngn.quantize(Decimal('0.01'), ROUND_HALF_UP)),
-                'is_enabled':v_data.get('is_enabled',False),
-                'is_available':v_data.get('is_available',True),
-                'option_value_ids':[str(oid) for oid in v_data.get('options',[])]
-            })
-        base_price = proc_vars[0]['price_ngn'] if proc_vars else 0.0
-        
-        # Look up the local Product model instance for the mockup image (if available)
-        local_product_obj = Product.objects.filter(printify_id=product_id).first()
-        mockup_image_url = local_product_obj.mockup_image.url if local_product_obj and local_product_obj.mockup_image else None
-
-        # Prepare final product data for the template
-        product_data_for_template = {
-            'id':str(item.get('id')),
-            'title':item.get('title','N/A'),
-            'description':item.get('description',''),
-            'images':item.get('images',[]),
-            'options':opts,
-            'variants':proc_vars,
-            'price': float(base_price) if isinstance(base_price, Decimal) else base_price,
-            'mockup_image_url': mockup_image_url # Add mockup_image_url
-        }
+        product_data_for_template = fetch_live_product_detail(product_id)
     except Exception as e:
         # Catch any exceptions during API call or data processing
         error_msg = f"Error fetching product {product_id}: {str(e)}"
@@ -220,7 +331,7 @@ def product_detail(request, product_id):
 @login_required # Ensure user is logged in to add to cart
 def add_to_cart(request, product_id=None): # product_id can be None if custom_design_id is passed
     """
-    Adds a product (standard or custom) to the user's cart stored in the session.
+    Adds a product (standard or custom) to the user's cart (a CartItem row per line).
     Handles quantity updates and removal.
     """
     is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -228,7 +339,7 @@ def add_to_cart(request, product_id=None): # product_id can be None if custom_de
     # Check for custom design ID in POST data
     custom_design_id = request.POST.get('custom_design_id')
 
-    cart = get_cart(request)
+    cart = get_cart(request, create=True)
     try:
         quantity = int(request.POST.get('quantity', 1))
         if quantity <= 0:
@@ -252,24 +363,21 @@ def add_to_cart(request, product_id=None): # product_id can be None if custom_de
             
             cart_item_key = f"custom_design_{custom_design.id}" # Unique key for custom designs
             
-            # If item already in cart, increment quantity
-            if cart_item_key in cart:
-                cart[cart_item_key]['quantity'] += quantity
-                final_message_text = f"Added {quantity} more of your custom '{custom_design.product.title}' design to cart."
-            else:
-                # Add new custom design to cart
-                price = custom_design.product.base_price_ngn # Use the base product price for now
-                cart[cart_item_key] = {
-                    'id': custom_design.product.printify_id, # Printify ID of the base product
-                    'custom_design_id': str(custom_design.id),
-                    'title': custom_design.product.title,
-                    'variant_title': f"Custom: {custom_design.selected_size}, {custom_design.selected_color}", # Describe the custom variant
-                    'price': float(price),
-                    'quantity': quantity,
-                    'image_url': custom_design.design_image.url, # Use the uploaded custom image URL
-                    'is_custom': True,
-                }
+            # Adds a new line, or increments the quantity if the design is already in the cart
+            created = add_item(
+                cart, cart_item_key, quantity,
+                printify_product_id=custom_design.product.printify_id, # Printify ID of the base product
+                custom_design=custom_design,
+                title=custom_design.product.title,
+                variant_title=f"Custom: {custom_design.selected_size}, {custom_design.selected_color}", # Describe the custom variant
+                price_kobo=ngn_to_kobo(custom_design.product.base_price_ngn), # Use the base product price for now
+                image_url=custom_design.design_image.url, # Use the uploaded custom image URL
+                is_custom=True,
+            )
+            if created:
                 final_message_text = f"Your custom '{custom_design.product.title}' design has been added to cart."
+            else:
+                final_message_text = f"Added {quantity} more of your custom '{custom_design.product.title}' design to cart."
             
             custom_design.status = 'added_to_cart'
             custom_design.save()
@@ -284,6 +392,12 @@ def add_to_cart(request, product_id=None): # product_id can be None if custom_de
             logger.exception(f"Error adding custom design {custom_design_id} to cart:")
             item_added_or_updated = False
 
+        if is_ajax:
+            status = 'success' if item_added_or_updated else 'error'
+            return JsonResponse({'status':status,'message':final_message_text,'cart_total_items':cart_item_count(cart)}, status=200 if item_added_or_updated else 400)
+        (messages.success if item_added_or_updated else messages.error)(request, final_message_text)
+        return redirect('view_cart')
+
     else:
         # --- Original logic for adding standard Printify products to cart ---
         # This path is for non-customized products
@@ -303,75 +417,62 @@ def add_to_cart(request, product_id=None): # product_id can be None if custom_de
                 cart_item_key = request.POST.get('cart_key', product_id_str) # Expect cart_key from frontend for updates
 
             if quantity <= 0 and is_update:
-                if cart_item_key in cart:
+                removed_item = remove_item(cart, cart_item_key)
+                if removed_item:
                     # If it's a custom design being removed via update=true with quantity 0
-                    if cart[cart_item_key].get('is_custom') and 'custom_design_id' in cart[cart_item_key]:
+                    if removed_item.is_custom and removed_item.custom_design_id:
                         try:
-                            custom_design_obj = CustomDesign.objects.get(id=cart[cart_item_key]['custom_design_id'])
+                            custom_design_obj = CustomDesign.objects.get(id=removed_item.custom_design_id)
                             custom_design_obj.delete() # This will also delete the associated image file
-                            logger.info(f"🗑️ Deleted CustomDesign {custom_design_obj.id} when updating to 0 quantity.")
+                            logger.info(f"🗑️ Deleted CustomDesign {removed_item.custom_design_id} when updating to 0 quantity.")
                         except CustomDesign.DoesNotExist:
-                            logger.warning(f"⚠️ CustomDesign {cart[cart_item_key]['custom_design_id']} not found for deletion during update.")
-                    
-                    del cart[cart_item_key]
+                            logger.warning(f"⚠️ CustomDesign {removed_item.custom_design_id} not found for deletion during update.")
                     msg_text = "Item removed."
                 else:
                     msg_text = "Item not found to remove."
-                save_cart(request, cart)
-                if is_ajax: return JsonResponse({'status':'success','message':msg_text,'cart_total_items':len(cart)})
+                if is_ajax: return JsonResponse({'status':'success','message':msg_text,'cart_total_items':cart_item_count(cart)})
                 messages.success(request, msg_text); return redirect('view_cart')
 
-            if cart_item_key in cart:
-                title_msg = cart[cart_item_key].get('variant_title', cart[cart_item_key].get('title','Item'))
+            existing_item = get_item(cart, cart_item_key)
+            if existing_item:
+                title_msg = existing_item.variant_title or existing_item.title or 'Item'
                 if is_update:
-                    cart[cart_item_key]['quantity'] = quantity
+                    set_quantity(cart, cart_item_key, quantity)
                     final_message_text = f"Updated {title_msg}."
                 else:
-                    cart[cart_item_key]['quantity'] += quantity
+                    add_item(cart, cart_item_key, quantity)
                     final_message_text = f"Added another {title_msg}."
                 item_added_or_updated = True
             else:
                 if not selected_variant_id:
                     final_message_text = "Please select a variant."
-                elif not PRINTIFY_SHOP_ID or not PRINTIFY_API_TOKEN:
-                    final_message_text = "Shop/API not configured."
                 else:
-                    url = f"{API_BASE_URL}/shops/{PRINTIFY_SHOP_ID}/products/{product_id_str}.json"
-                    try:
-                        res = requests.get(url, headers=HEADERS, timeout=10)
-                        res.raise_for_status()
-                        item_data = res.json()
-                        variant = next((v for v in item_data.get('variants',[]) if str(v.get('id'))==selected_variant_id),None)
-                        if not variant:
-                            final_message_text = "Variant not found."
-                            raise ValueError(final_message_text)
-                        
-                        title = item_data.get('title','N/A')
-                        v_title = variant.get('title','N/A')
-                        price_ngn_decimal = (Decimal(variant.get('price',0))/Decimal('100.0'))*USD_TO_NGN_RATE
-                        price_ngn = float(price_ngn_decimal.quantize(Decimal('0.01'), ROUND_HALF_UP))
-                        img=item_data.get('images',[{}])[0].get('src','https://placehold.co/100x100?text=No+Img')
-                        cart[cart_item_key]={
-                            'id':product_id_str,
-                            'variant_id':selected_variant_id,
-                            'title':title,
-                            'variant_title':v_title,
-                            'price':price_ngn,
-                            'quantity':quantity,
-                            'image_url':img,
-                            'is_custom': False
-                        }
+                    # Local point lookup in the variant index built during sync
+                    variant = lookup_variant(product_id_str, selected_variant_id)
+                    if not variant:
+                        final_message_text = "Variant not found."
+                    elif not (variant['is_enabled'] and variant['is_available']):
+                        final_message_text = "Selected variant is unavailable."
+                    else:
+                        title = variant['product_title']
+                        v_title = variant['title'] or 'N/A'
+                        add_item(
+                            cart, cart_item_key, quantity,
+                            printify_product_id=product_id_str,
+                            variant_id=selected_variant_id,
+                            title=title,
+                            variant_title=v_title,
+                            price_kobo=variant['price_kobo'],
+                            image_url=variant['image_url'] or 'https://placehold.co/100x100?text=No+Img',
+                            is_custom=False,
+                        )
                         final_message_text=f"Added {title} ({v_title}) to cart."; item_added_or_updated=True
-                    except Exception as e:
-                        final_message_text = f"Error adding item: {str(e)}"
-                        logger.error(f"Error fetching Printify product {product_id_str} for cart: {e}")
             
             if item_added_or_updated:
-                save_cart(request,cart)
-                if is_ajax: return JsonResponse({'status':'success','message':final_message_text,'cart_total_items':len(cart)})
+                if is_ajax: return JsonResponse({'status':'success','message':final_message_text,'cart_total_items':cart_item_count(cart)})
                 messages.success(request,final_message_text)
             else:
-                if is_ajax: return JsonResponse({'status':'error','message':final_message_text,'cart_total_items':len(cart)})
+                if is_ajax: return JsonResponse({'status':'error','message':final_message_text,'cart_total_items':cart_item_count(cart)})
                 messages.error(request,final_message_text)
 
             if is_update and not is_ajax: return redirect('view_cart')
@@ -382,37 +483,47 @@ def add_to_cart(request, product_id=None): # product_id can be None if custom_de
             # Fallback for unexpected AJAX or non-AJAX redirects
             if is_ajax:
                 # Ensure a valid JsonResponse is always returned for AJAX
-                return JsonResponse({'status':'error','message':final_message_text or 'Unexpected AJAX issue.','cart_total_items':len(cart)}, status=500)
+                return JsonResponse({'status':'error','message':final_message_text or 'Unexpected AJAX issue.','cart_total_items':cart_item_count(cart)}, status=500)
             return redirect('product_list')
 
 
 def view_cart(request):
     """
-    Renders the cart view, displaying all items currently in the user's session cart
+    Renders the cart view, displaying all items currently in the user's cart
     and calculating the total price.
     """
-    cart = get_cart(request)
-    cart_items_processed = {}
-    cart_total_price = Decimal('0.0')
+    pricing = CartPricing(cart_lines(get_cart(request)))
+    return render(request, 'mystore/cart.html', {'cart_items':pricing.display_items(),'cart_total_price':pricing.total_ngn})
 
-    for k, item_details in cart.items():
-        try:
-            price = Decimal(str(item_details.get('price',0.0)))
-            quantity = int(item_details.get('quantity',0))
-        except (ValueError, TypeError):
-            price = Decimal('0.0')
-            quantity = 0
-        
-        current_item = item_details.copy();
-        current_item['price_per_unit_decimal'] = price
-        current_item['price'] = float(price)
-        current_item['quantity']=quantity
-        current_item['total_price']= float(price*quantity)
-        current_item['cart_key']=k
-        cart_items_processed[k]=current_item;
-        cart_total_price+= (price*quantity)
-        
-    return render(request, 'mystore/cart.html', {'cart_items':cart_items_processed,'cart_total_price':cart_total_price})
+@require_POST
+@login_required
+def cart_batch(request):
+    """
+    Applies several cart changes in one request, all or nothing.
+    POST /cart/batch/ with a JSON body {"operations": [...]} (see shop.cart.apply_cart_operations
+    for the operation types). Returns the updated cart summary, or a 400 naming the failing
+    operation, in which case none of the operations were applied.
+    """
+    try:
+        operations = json.loads(request.body).get('operations')
+    except (ValueError, AttributeError):
+        operations = None
+    if not isinstance(operations, list):
+        return JsonResponse({'status': 'error', 'message': 'Expected a JSON body {"operations": [...]}.'}, status=400)
+
+    cart = get_cart(request, create=True)
+    try:
+        with transaction.atomic():
+            removed_design_ids = apply_cart_operations(cart, operations, request.user)
+    except CartOperationError as e:
+        return JsonResponse({'status': 'error', 'message': str(e), 'operation': e.index, 'cart': cart_summary(cart)}, status=400)
+
+    # Designs removed from the cart are discarded, as in remove_from_cart
+    for custom_design_obj in CustomDesign.objects.filter(id__in=removed_design_ids, user=request.user):
+        custom_design_obj.delete()
+        logger.info(f"🗑️ Deleted CustomDesign {custom_design_obj.id} removed by a cart batch.")
+
+    return JsonResponse({'status': 'success', 'cart': cart_summary(cart)})
 
 @login_required
 def remove_from_cart(request, cart_key):
@@ -420,20 +531,18 @@ def remove_from_cart(request, cart_key):
     Removes an item from the cart based on its cart_key.
     If the item is a custom design, it also deletes the associated CustomDesign object.
     """
-    cart = get_cart(request)
-    if cart_key in cart:    
-        title = cart[cart_key].get('variant_title',cart[cart_key].get('title','Item'))
+    removed_item = remove_item(get_cart(request), cart_key)
+    if removed_item:
+        title = removed_item.variant_title or removed_item.title or 'Item'
         # If it's a custom design, also delete the CustomDesign object from the database
-        if cart[cart_key].get('is_custom') and 'custom_design_id' in cart[cart_key]:
+        if removed_item.is_custom and removed_item.custom_design_id:
             try:
-                custom_design_obj = CustomDesign.objects.get(id=cart[cart_key]['custom_design_id'])
+                custom_design_obj = CustomDesign.objects.get(id=removed_item.custom_design_id)
                 custom_design_obj.delete() # This will also delete the associated image file
-                logger.info(f"🗑️ Deleted CustomDesign {custom_design_obj.id} when removing from cart.")
+                logger.info(f"🗑️ Deleted CustomDesign {removed_item.custom_design_id} when removing from cart.")
             except CustomDesign.DoesNotExist:
-                logger.warning(f"⚠️ CustomDesign {cart[cart_key]['custom_design_id']} not found for deletion.")
+                logger.warning(f"⚠️ CustomDesign {removed_item.custom_design_id} not found for deletion.")
             
-        del cart[cart_key]
-        save_cart(request,cart)
         messages.success(request,f"Removed {title} from cart.")
     else:
         messages.error(request,"Item not found in cart. Could not remove.")
@@ -444,32 +553,15 @@ def checkout_page(request):
     """
     Renders the checkout page, displaying cart items and preparing for payment.
     """
-    cart = get_cart(request)
+    cart = cart_lines(get_cart(request))
     if not cart:
         messages.info(request, "Your cart is empty.")
         return redirect('view_cart')
     
-    cart_items_display = {}
-    cart_total_price_decimal = Decimal('0.0')
-    for cart_key, item_details in cart.items():
-        try:
-            price = Decimal(str(item_details.get('price', '0.0')))
-            quantity = int(item_details.get('quantity', 0))
-        except (ValueError, TypeError):
-            price = Decimal('0.0')
-            quantity = 0
-        
-        current_item = item_details.copy();
-        current_item['price_per_unit'] = float(price);
-        current_item['quantity'] = quantity
-        current_item['total_price'] = float(price * quantity);
-        current_item['cart_key'] = cart_key
-        cart_items_display[cart_key] = current_item;
-        cart_total_price_decimal += (price * quantity)
-    
+    pricing = CartPricing(cart)
     context = {
-        'cart_items': cart_items_display,
-        'cart_total_price': cart_total_price_decimal,
+        'cart_items': pricing.display_items(),
+        'cart_total_price': pricing.total_ngn,
         'paystack_public_key': PAYSTACK_PUBLIC_KEY
     }
     return render(request, 'mystore/checkout.html', context)
@@ -481,7 +573,8 @@ def checkout_submit(request):
     and prepares data for Printify order creation.
     """
     if request.method == 'POST':
-        cart = get_cart(request)
+        cart_obj = get_cart(request)
+        cart = cart_lines(cart_obj)
         if not cart:
             messages.error(request, "Your cart is empty.")
             return redirect('view_cart')
@@ -499,37 +592,41 @@ def checkout_submit(request):
         country = request.POST.get('country', 'NG') # Default to NG for Nigeria
         # --- End variable definition ---
 
-        cart_total_price_ngn_decimal = Decimal('0.0');
-        cart_snapshot_for_session = {} # To store cart details for OrderItem creation later
+        current_unit_prices = {} # Current variant prices (kobo) of standard items, by cart key
         
         # Prepare line items for Printify order
         printify_line_items = []
 
+        # Load every variant and design the cart refers to up front: two queries for the whole cart
+        standard_variants, custom_designs = load_cart_references(cart, request.user)
+
         for item_key, item_details in cart.items():
-            item_price_decimal = Decimal(str(item_details.get('price', '0.0')))
             item_quantity = int(item_details.get('quantity', 0))
-            cart_total_price_ngn_decimal += item_price_decimal * item_quantity
-            
-            cart_snapshot_for_session[item_key] = item_details.copy()
-            cart_snapshot_for_session[item_key]['price'] = float(item_price_decimal)
+
+            standard_variant = None
+            if not item_details.get('is_custom'):
+                # Re-price standard items from the variant index rather than trusting the stored price
+                standard_variant = standard_variants.get((str(item_details.get('id')), str(item_details.get('variant_id'))))
+                if not standard_variant:
+                    logger.error(f"Variant {item_details.get('variant_id')} of product {item_details.get('id')} not found in variant index for order.")
+                    messages.error(request, f"{item_details.get('title', 'An item')} is no longer available. Please remove it from cart.")
+                    return redirect('view_cart')
+                if not (standard_variant['is_enabled'] and standard_variant['is_available']):
+                    messages.error(request, f"{item_details.get('title', 'An item')} ({item_details.get('variant_title', '')}) is out of stock. Please remove it from cart.")
+                    return redirect('view_cart')
+                current_unit_prices[item_key] = standard_variant['price_kobo']
 
             # Build Printify line item for each product in cart
             if item_details.get('is_custom'):
                 try:
-                    custom_design_obj = CustomDesign.objects.get(id=item_details['custom_design_id'], user=request.user)
+                    custom_design_obj = custom_designs.get(int(item_details['custom_design_id']))
+                    if custom_design_obj is None:
+                        raise CustomDesign.DoesNotExist
                     if not custom_design_obj.printify_image_id:
                         raise ValueError(f"Custom design {custom_design_obj.id} has no Printify image ID. Please upload it first.")
 
-                    # --- CRITICAL LOGIC FOR FINDING PRINTIFY VARIANT ID ---
-                    # This logic assumes variant title is "Color / Size" (e.g., "White / S")
-                    # You might need to fetch or map Printify's option_value_ids for the selected color/size
-                    matched_printify_variant_id = None
-                    if custom_design_obj.product and custom_design_obj.product.variants_data:
-                        for pv in custom_design_obj.product.variants_data:
-                            # Example matching by title. Adjust based on how Printify provides variant options.
-                            if pv.get('title') == f"{custom_design_obj.selected_color} / {custom_design_obj.selected_size}" and pv.get('is_enabled') and pv.get('is_available'):
-                                matched_printify_variant_id = pv.get('id')
-                                break
+                    # O(1) lookup in the (color, size) -> variant map built at sync time
+                    matched_printify_variant_id = resolve_variant_id(custom_design_obj.product, custom_design_obj.selected_color, custom_design_obj.selected_size)
                     
                     if not matched_printify_variant_id:
                         logger.error(f"Could not find matching Printify variant for custom design {custom_design_obj.id}: Product={custom_design_obj.product.title}, Size={custom_design_obj.selected_size}, Color={custom_design_obj.selected_color}")
@@ -567,21 +664,11 @@ def checkout_submit(request):
                     return redirect('view_cart')
             else:
                 # For standard products, use their printify_id and selected_variant_id
-                product_id_from_cart = item_details.get('id') # This is Printify product ID from original sync
-                variant_id_from_cart = item_details.get('variant_id') # This is Printify variant ID from original sync
-                
-                # Retrieve the actual Product object from your DB to get print_provider_id
-                local_product = Product.objects.filter(printify_id=product_id_from_cart).first()
-                if not local_product:
-                    logger.error(f"Product {product_id_from_cart} not found in database for order. Skipping.")
-                    messages.error(request, f"Product {product_id_from_cart} not found in database for order. Please remove it from cart.")
-                    return redirect('view_cart')
-                
                 printify_line_items.append({
-                    "product_id": local_product.printify_id,
-                    "variant_id": variant_id_from_cart,
+                    "product_id": str(item_details.get('id')),
+                    "variant_id": item_details.get('variant_id'),
                     "quantity": item_quantity,
-                    "print_provider_id": local_product.printify_print_provider_id    
+                    "print_provider_id": standard_variant['print_provider_id']
                 })
 
         # Final checks before proceeding with payment
@@ -589,8 +676,9 @@ def checkout_submit(request):
             messages.error(request, "No valid items found in cart for Printify order.")
             return redirect('view_cart')
 
-        # Calculate total price in kobo for Paystack
-        cart_total_price_kobo = int(cart_total_price_ngn_decimal.quantize(Decimal('0.01'), ROUND_HALF_UP) * 100)
+        # Price the cart once; the same kobo total is charged, stored and shown
+        pricing = CartPricing(cart, current_unit_prices)
+        cart_total_price_kobo = pricing.total_kobo
         if cart_total_price_kobo <= 0:
             messages.error(request, "Order total is invalid.");
             return redirect('view_cart')
@@ -618,6 +706,18 @@ def checkout_submit(request):
             messages.error(request, "Payment gateway not configured.")
             return redirect('checkout')
         
+        # Everything needed to create the order is stored server-side under the reference before
+        # the customer leaves, so the callback or the Paystack webhook can complete it without this session
+        pending_checkout = create_pending_checkout(
+            order_reference, request.user, cart_obj, pricing,
+            customer={
+                'first_name': first_name, 'last_name': last_name, 'email': email, 'phone': phone,
+                'address': address, 'city': city, 'state': state_province, 'zipcode': zipcode,
+                'country': country,
+            },
+            printify_order=printify_order_payload,
+        )
+
         init_url = f"{PAYSTACK_API_BASE_URL}/transaction/initialize"
         callback_url = request.build_absolute_uri(reverse('paystack_callback'))
         
@@ -629,7 +729,7 @@ def checkout_submit(request):
             "callback_url": callback_url,
             "metadata": {
                 "customer_name": name,
-                "cart_id": request.session.session_key or "unknown_session",
+                "cart_id": cart_obj.pk,
                 "order_items_count": len(cart),
                 "user_id": request.user.id if request.user.is_authenticated else None
             }
@@ -640,7 +740,7 @@ def checkout_submit(request):
         }
         try:
             logger.info(f"🚀 Initializing Paystack. Ref: {order_reference}, Amount: {cart_total_price_kobo} Kobo")
-            response = requests.post(init_url, headers=paystack_headers, json=payload, timeout=20)
+            response = transport.post(init_url, headers=paystack_headers, json=payload, timeout=20)
             response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
             response_data = response.json()
             logger.info(f"✅ Paystack Init Response: {json.dumps(response_data, indent=2)}")
@@ -648,32 +748,26 @@ def checkout_submit(request):
             if response_data.get("status"):
                 authorization_url = response_data["data"]["authorization_url"]
                 request.session['paystack_reference'] = order_reference
-                # Store the Printify order payload in session for later use after Paystack success
-                request.session['printify_order_payload'] = printify_order_payload    
-                request.session['order_details_for_completion'] = {
-                    'first_name': first_name, 'last_name': last_name, 'email': email, 'phone': phone,
-                    'address': address, 'city': city, 'state': state_province, 'zipcode': zipcode,
-                    'country': country,
-                    'total_amount': float(cart_total_price_ngn_decimal.quantize(Decimal('0.01'), ROUND_HALF_UP)),
-                    'cart_snapshot': cart_snapshot_for_session, # Store cart content to create OrderItems
-                    'user_id': request.user.id if request.user.is_authenticated else None
-                }
                 logger.info(f"Redirecting to Paystack: {authorization_url}")
                 return redirect(authorization_url)
             else:
                 error_msg = response_data.get("message", "Failed to initialize payment.");
                 messages.error(request, error_msg);
                 logger.error(f"❌ Paystack Init Error: {error_msg}")
+                fail_checkout(pending_checkout, f"Paystack initialization: {error_msg}")
         except requests.exceptions.HTTPError as http_err:
             error_text = http_err.response.text if http_err.response is not None else "No response body"
             logger.error(f"❌ HTTPError Paystack init: {http_err} - Response: {error_text}")
             messages.error(request, "Could not connect to payment gateway.")
+            fail_checkout(pending_checkout, f"Paystack initialization: {http_err}")
         except requests.exceptions.RequestException as req_err:
             logger.error(f"❌ RequestException Paystack init: {req_err}")
             messages.error(request, "A network error occurred.")
+            fail_checkout(pending_checkout, f"Paystack initialization: {req_err}")
         except Exception as e:
             logger.exception(f"❌ Unexpected error Paystack init:") # Uses logger.exception to get traceback
             messages.error(request, "An unexpected error occurred.")
+            fail_checkout(pending_checkout, f"Paystack initialization: {e}")
         return redirect('checkout')
     return redirect('checkout')
 
@@ -681,7 +775,9 @@ def checkout_submit(request):
 def paystack_callback(request):
     """
     Handles the callback from Paystack after a payment attempt.
-    Verifies the transaction, creates a local order, and attempts to create a Printify order.
+    Normally the paystack_webhook has already completed the checkout, so this only reads
+    its status. If the webhook has not arrived yet, verifies the transaction and completes
+    the pending checkout itself: creates the local order and queues it for Printify.
     """
     reference = request.GET.get('reference') or request.GET.get('trxref')
     logger.info(f"📞 Paystack Callback received. Reference: {reference}")
@@ -700,6 +796,18 @@ def paystack_callback(request):
         del request.session['paystack_reference']
         request.session.modified = True
 
+    pending_checkout = PendingCheckout.objects.filter(reference=reference).first()
+    if pending_checkout is None:
+        messages.error(request, "Order details not found. Contact support with reference: " + reference);
+        logger.error(f"❌ Callback: no pending checkout for ref {reference}.");
+        return redirect(reverse('order_failure_specific', kwargs={'error_message': "Order details not found."}))
+    if pending_checkout.status in ('paid', 'completed'):
+        # Completed by the Paystack webhook (or being completed right now)
+        logger.info(f"ℹ️ Checkout {reference} is {pending_checkout.status}. Redirecting to success page.")
+        messages.success(request, "Payment successful! Your order has been placed and is being sent for production.")
+        return redirect('order_success', order_reference=reference)
+
+    # The webhook has not arrived yet: verify with Paystack and complete the checkout here
     if not PAYSTACK_SECRET_KEY:
         messages.error(request, "Payment gateway verification not configured.");
         logger.error("❌ Callback: Paystack secret key missing.");
@@ -710,141 +818,41 @@ def paystack_callback(request):
 
     try:
         logger.info(f"🔎 Verifying Paystack transaction. URL: {verify_url}");
-        response = requests.get(verify_url, headers=paystack_headers, timeout=15);
+        response = transport.get(verify_url, headers=paystack_headers, timeout=15);
         response.raise_for_status()
         response_data = response.json();
         logger.info(f"✅ Paystack Verify Response: {json.dumps(response_data, indent=2)}")
 
         if response_data.get("status") and response_data["data"]["status"] == "success":
             logger.info("🎉 Payment Successful!");
-            
-            order_details_session = request.session.get('order_details_for_completion')
-            printify_order_payload = request.session.get('printify_order_payload')
-
-            if not order_details_session or not printify_order_payload:
-                messages.error(request, "Order details lost. Contact support with reference: " + reference);
-                logger.error(f"❌ Callback: 'order_details_for_completion' or 'printify_order_payload' missing from session for ref {reference}.");
-                return redirect(reverse('order_failure_specific', kwargs={'error_message': "Order details lost after payment."}))
-
-            cart_snapshot = order_details_session.pop('cart_snapshot', {})
 
-            user_for_order = None
-            user_id_from_session = order_details_session.pop('user_id', None)
-
-            # Determine the user for the order
-            if user_id_from_session:
-                User = get_user_model()
-                try:
-                    user_for_order = User.objects.get(id=user_id_from_session)
-                except User.DoesNotExist:
-                    logger.warning(f"⚠️ User with ID {user_id_from_session} not found for order {reference}. Trying current request user.")
-                    if request.user.is_authenticated:
-                        user_for_order = request.user
-                        logger.info(f"Using current request.user: {user_for_order.email} as user_for_order (session user ID {user_id_from_session} not found).")
-            elif request.user.is_authenticated:
-                user_for_order = request.user
-                logger.info(f"No user_id in session, using current request.user: {user_for_order.email} as user_for_order.")
-
-            # Prevent duplicate orders
-            if Order.objects.filter(paystack_reference=reference).exists():
-                messages.info(request, "This payment has already been processed.");
-                logger.info(f"ℹ️ Order with reference {reference} already exists. Redirecting to success page.")
-                # Clear session data to avoid issues even if it's a re-process
-                if 'cart' in request.session: del request.session['cart']
-                if 'order_details_for_completion' in request.session: del request.session['order_details_for_completion']
-                if 'printify_order_payload' in request.session: del request.session['printify_order_payload']
-                request.session.modified = True
-                return redirect('order_success', order_reference=reference)
+            paid_kobo, paid_currency = response_data["data"].get("amount"), response_data["data"].get("currency")
+            if paid_kobo is None or int(paid_kobo) != pending_checkout.amount_kobo or paid_currency != PAYSTACK_CURRENCY:
+                logger.error(f"❌ Callback: ref {reference} paid {paid_kobo} {paid_currency} but the checkout is for {pending_checkout.amount_kobo} {PAYSTACK_CURRENCY}.")
+                messages.error(request, "The amount paid does not match your order. Contact support with reference: " + reference);
+                return redirect(reverse('order_failure_specific', kwargs={'error_message': "Payment amount mismatch."}))
 
             try:
-                # Create the local Order in your database
-                order_data = {
-                    'first_name':order_details_session.get('first_name'), 'last_name':order_details_session.get('last_name'),
-                    'email':order_details_session.get('email'), 'phone':order_details_session.get('phone'),
-                    'address':order_details_session.get('address'), 'city':order_details_session.get('city'), # Use the correct variables from session
-                    'state':order_details_session.get('state'), 'zipcode':order_details_session.get('zipcode'), # Use the correct variables from session
-                    'country':order_details_session.get('country'), # Use the correct variables from session
-                    'total_amount':Decimal(str(order_details_session.get('total_amount', '0.0'))).quantize(Decimal('0.01'), ROUND_HALF_UP),
-                    'paid':True, 'paystack_reference':reference
-                }
-                if user_for_order:
-                    order_data['user'] = user_for_order
-
-                order = Order.objects.create(**order_data)
-                logger.info(f"📝 Order {order.id} created locally for reference {reference}.")
-
-                # Process OrderItems
-                for item_key, item_data in cart_snapshot.items():
-                    custom_design_id = item_data.get('custom_design_id')
-                    custom_design_obj = None
-                    product_obj = None # This will be the local Product model instance
-
-                    if custom_design_id:
-                        try:
-                            custom_design_obj = CustomDesign.objects.get(id=custom_design_id, user=user_for_order) # Link to user who ordered
-                            product_obj = custom_design_obj.product # Get the base product
-                            # Update status for custom design to indicate it's part of an order
-                            custom_design_obj.status = 'order_created'
-                            custom_design_obj.save()
-                        except CustomDesign.DoesNotExist:
-                            logger.warning(f"⚠️ CustomDesign {custom_design_id} not found during order item creation for order {order.id}.")
-                            # Consider how to handle: should this fail the entire order or proceed?
-                            # For now, it will create OrderItem with custom_design=None.
-                    else:
-                        # For standard product, find the Product object
-                        product_obj = Product.objects.filter(printify_id=item_data.get('id')).first()
-                        if not product_obj:
-                            logger.warning(f"⚠️ Product with Printify ID {item_data.get('id')} not found for order item {order.id}.")
-
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product_obj, # Link to your local Product model
-                        custom_design=custom_design_obj, # Link to CustomDesign if applicable
-                        product_title=item_data.get('title'),
-                        variant_title=item_data.get('variant_title'),
-                        quantity=item_data.get('quantity'),
-                        price_at_purchase=Decimal(str(item_data.get('price', '0.0'))).quantize(Decimal('0.01'), ROUND_HALF_UP),
-                        printify_variant_id=item_data.get('variant_id') # Store Printify variant ID if applicable
-                    )
-                logger.info(f"🛍️ Order items created for Order {order.id}.")
-
-                # --- Create Order on Printify ---
-                if PRINTIFY_API_TOKEN and PRINTIFY_SHOP_ID:
-                    logger.info(f"📦 Attempting to create Printify order for shop {PRINTIFY_SHOP_ID} with payload: {json.dumps(printify_order_payload, indent=2)}")
-                    try:
-                        printify_response = printify_client.create_order(shop_id=PRINTIFY_SHOP_ID, order_payload=printify_order_payload)
-                        if printify_response and printify_response.get('id'):
-                            logger.info(f"✅ Printify Order created: {printify_response['id']}")
-                            # Update your local Order model with Printify Order ID if you add a field for it
-                            # order.printify_order_id = printify_response['id']
-                            # order.save()
-                            messages.success(request, "Payment successful and Printify order placed!")
-                        else:
-                            logger.error(f"❌ Failed to create Printify order. Response: {printify_response}")
-                            messages.warning(request, "Payment successful, but failed to create Printify order. We'll handle this manually. Reference: " + reference)
-                    except Exception as printify_e:
-                        logger.exception(f"❌ Exception while creating Printify order for ref {reference}:")
-                        messages.warning(request, "Payment successful, but an error occurred sending order to Printify. We'll handle this manually. Reference: " + reference)
-                else:
-                    logger.warning("⚠️ Printify API not configured. Order will not be sent to Printify automatically.")
-                    messages.warning(request, "Payment successful, but Printify API not configured. Order will be processed manually. Reference: " + reference)
-
-                # Clear session data after successful order and Printify call
-                if 'cart' in request.session: del request.session['cart']
-                if 'order_details_for_completion' in request.session: del request.session['order_details_for_completion']
-                if 'printify_order_payload' in request.session: del request.session['printify_order_payload']
-                request.session.modified = True
-                logger.info("🗑️ Cart and session payment data cleared.")
-
-                return redirect('order_success', order_reference=reference)
+                order, created = complete_checkout(pending_checkout)
             except Exception as e:
                 logger.exception(f"❌ Error creating order in DB for ref {reference}:")
                 messages.error(request, "Payment successful, but issue creating order. Contact support with reference: " + reference);
                 return redirect(reverse('order_failure_specific', kwargs={'error_message': "DB order creation failed."}))
+
+            if not created:
+                # Completed by the Paystack webhook (or another tab) in the meantime
+                messages.success(request, "Payment successful! Your order has been placed and is being sent for production.")
+                return redirect('order_success', order_reference=reference)
+            logger.info(f"🛍️ Order items created for Order {order.id}.")
+
+            # The Printify order is submitted by `manage.py process_printify_outbox`, not while the customer waits
+            messages.success(request, "Payment successful! Your order has been placed and is being sent for production.")
+            return redirect('order_success', order_reference=reference)
         else:
             error_msg = response_data["data"].get("gateway_response", "Payment not successful.") if response_data.get("data") else response_data.get("message", "Payment verification failed.")
             messages.error(request, f"Payment Failed: {error_msg}");
             logger.error(f"❌ Payment Failed/Verification Error for ref {reference}: {error_msg}");
+            fail_checkout(pending_checkout, error_msg)
             return redirect(reverse('order_failure_specific', kwargs={'error_message': error_msg}))
     except requests.exceptions.HTTPError as http_err:
         error_text = http_err.response.text if http_err.response is not None else "No response body"
@@ -865,11 +873,9 @@ def order_success(request, order_reference):
     """
     try:
         order = Order.objects.get(paystack_reference=order_reference, paid=True)
-        # Clear residual session data just in case
-        if 'paystack_reference' in request.session: del request.session['paystack_reference']
-        if 'order_details_for_completion' in request.session: del request.session['order_details_for_completion']
-        if 'printify_order_payload' in request.session: del request.session['printify_order_payload']
-        request.session.modified = True
+        # Clear residual session data just in case (the payload keys are left by checkouts from before PendingCheckout)
+        for session_key in ('paystack_reference', 'order_details_for_completion', 'printify_order_payload'):
+            request.session.pop(session_key, None)
     except Order.DoesNotExist:
         messages.error(request, "Order not found or payment not confirmed.");
         return redirect('home')
@@ -1044,118 +1050,77 @@ def terms_of_service_view(request):
     """
     return render(request, 'mystore/terms_of_service.html')
 
-def sync_products_to_db(products_from_api):
-    """
-    Synchronizes product data fetched from Printify API into the local Django database.
-    Updates existing products or creates new ones.
-    """
-    created_count = 0
-    updated_count = 0
-    if not products_from_api: return 0, 0
-    
-    for pd in products_from_api:
-        pid = str(pd.get("id"))
-        title = pd.get("title", "N/A")
-        desc = pd.get("description", "")
-        img_url = pd.get("images", [{}])[0].get("src", "")
-        options_data = pd.get('options', [])
-        vars_api = pd.get("variants", [])
-        
-        # Get base price from the first variant if available
-        p_cents = vars_api[0].get("price", 0) if vars_api else 0
-
-        proc_vars = []
-        
-        # Determine blueprint and print provider IDs from Printify product data
-        blueprint_id = pd.get('blueprint_id')
-        # Print provider ID is usually available at the product level or in variants
-        print_provider_id = pd.get('print_provider_id')    
-        if not print_provider_id and vars_api: # Fallback to first variant's print_provider_id
-            print_provider_id = vars_api[0].get('print_provider_id')
-
-
-        for v_api in vars_api:
-            v_p_cents = v_api.get("price",0)
-            proc_vars.append({
-                "id":str(v_api.get("id")),
-                "title":v_api.get("title"),
-                "price_cents":v_p_cents,
-                "price_ngn":float((Decimal(v_p_cents)/Decimal('100.0'))*USD_TO_NGN_RATE.quantize(Decimal('0.01'), ROUND_HALF_UP)),
-                "sku":v_api.get("sku"),
-                "is_available":v_api.get("is_available",True),
-                "is_enabled":v_api.get("is_enabled",True),
-                'option_value_ids': [str(opt_id) for opt_id in v_api.get('options', [])]
-            })
-            
-        p_ngn_decimal = (Decimal(p_cents)/Decimal('100.0'))*USD_TO_NGN_RATE
-        p_ngn = float(p_ngn_decimal.quantize(Decimal('0.01'), ROUND_HALF_UP))
-
-        defaults = {
-            'title': title,
-            'description': desc,
-            'base_price_ngn': Decimal(p_ngn),
-            'primary_image_url': img_url,
-            'variants_data': proc_vars, # Store all variants data
-            'product_options_data': options_data, # Store all options data
-            'printify_shop_id': PRINTIFY_SHOP_ID,
-            'printify_blueprint_id': blueprint_id, # Set blueprint ID
-            'printify_print_provider_id': print_provider_id, # Set print provider ID
-            'is_published': pd.get('visible', True),
-            'last_synced_at': timezone.now(),
-            # 'mockup_image': None, # This should be manually set in Django admin for each product
-        }
-        
-        try:
-            obj, cr = Product.objects.update_or_create(printify_id=pid, defaults=defaults)
-            if cr: created_count += 1
-            else: updated_count += 1
-        except Exception as e:
-            logger.error(f"DB Error syncing product {pid}: {e}")
-            
-    return created_count, updated_count
-
+@staff_member_required
+@require_http_methods(["GET", "POST"])
 def sync_products_view(request):
     """
-    View to trigger synchronization of products from Printify to the local database.
-    Fetches all pages of products from Printify.
+    Queues a Printify catalog synchronization and returns the sync run ID right away.
+    The sync itself runs in the sync worker (`manage.py sync_printify --every`), so it
+    never holds a web worker. If a run is already queued or running, that run is returned.
     """
     if not PRINTIFY_API_TOKEN:
         messages.error(request, "API token not configured."); return JsonResponse({'status': 'error', 'message': 'API token not configured.'})
     if not PRINTIFY_SHOP_ID:
         messages.error(request, "Shop ID not configured."); return JsonResponse({'status': 'error', 'message': 'Shop ID not configured.'})
-    
-    all_products_from_api = []
-    page = 1
-    while True:
-        api_url = f"{API_BASE_URL}/shops/{PRINTIFY_SHOP_ID}/products.json?page={page}&limit=100"
-        logger.info(f"    Fetching page {page} from {api_url}")
-        try:
-            response = requests.get(api_url, headers=HEADERS, timeout=20)
-            response.raise_for_status()
-            data = response.json()
-            current_page_products = data.get('data', [])
-            if not current_page_products: break # No more products to fetch
-            
-            all_products_from_api.extend(current_page_products)
-            
-            if data.get('current_page') == data.get('last_page') or not data.get('next_page_url'): break
-            page += 1
-        except Exception as e:
-            error_msg = f'Failed to fetch products for sync (page {page}): {str(e)}'
-            logger.error(f"❌ {error_msg}")
-            messages.error(request, error_msg)
-            return JsonResponse({'status': 'error', 'message': error_msg})
-            
-    if not all_products_from_api:
-        messages.info(request, "No products found in Printify shop to sync.")
-        return JsonResponse({'status': 'info', 'message': 'No products found in Printify shop to sync.'})
-    
-    logger.info(f"    Total products fetched from Printify API: {len(all_products_from_api)}")
-    created, updated = sync_products_to_db(all_products_from_api)
-    msg = f"Synchronization complete. Products created: {created}, Products updated: {updated}."
-    logger.info(f"✅ {msg}")
-    messages.success(request, msg)
-    return JsonResponse({'status': 'success', 'message': msg, 'created': created, 'updated': updated})
+
+    sync_run, created = enqueue_sync_run(requested_by=request.user)
+    msg = f"Sync run {sync_run.id} queued." if created else f"Sync run {sync_run.id} is already {sync_run.status}."
+    logger.info(f"🔄 {msg}")
+    return JsonResponse({
+        'status': sync_run.status,
+        'message': msg,
+        'sync_run_id': sync_run.id,
+        'status_url': reverse('sync_run_status', kwargs={'run_id': sync_run.id}),
+    }, status=202)
+
+@staff_member_required
+def sync_run_status(request, run_id):
+    """
+    Returns the progress and outcome of one sync run as JSON.
+    """
+    sync_run = get_object_or_404(SyncRun, id=run_id)
+    return JsonResponse(sync_run.as_dict())
+
+@csrf_exempt # Called by Printify, authenticated by the HMAC signature instead
+@require_POST
+def printify_webhook(request):
+    """
+    Receives Printify product events and updates just the affected Product row.
+    Returns 401 for an invalid signature and 503 when Printify should retry the delivery.
+    """
+    if not verify_printify_signature(request.body, request.headers.get('X-Pfy-Signature', '')):
+        logger.warning("⚠️ Rejected Printify webhook with a missing or invalid signature.")
+        return JsonResponse({'status': 'error', 'message': 'Invalid signature.'}, status=401)
+    try:
+        event = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON.'}, status=400)
+    if not isinstance(event, dict):
+        return JsonResponse({'status': 'error', 'message': 'Invalid event.'}, status=400)
+
+    ok, msg = handle_printify_event(event)
+    return JsonResponse({'status': 'success' if ok else 'error', 'message': msg}, status=200 if ok else 503)
+
+
+@csrf_exempt # Called by Paystack, authenticated by the HMAC signature instead
+@require_POST
+def paystack_webhook(request):
+    """
+    Receives Paystack events; charge.success completes the checkout with that reference.
+    Returns 401 for an invalid signature and 503 when Paystack should retry the delivery.
+    """
+    if not verify_paystack_signature(request.body, request.headers.get('X-Paystack-Signature', '')):
+        logger.warning("⚠️ Rejected Paystack webhook with a missing or invalid signature.")
+        return JsonResponse({'status': 'error', 'message': 'Invalid signature.'}, status=401)
+    try:
+        event = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON.'}, status=400)
+    if not isinstance(event, dict):
+        return JsonResponse({'status': 'error', 'message': 'Invalid event.'}, status=400)
+
+    ok, msg = handle_paystack_event(event)
+    return JsonResponse({'status': 'success' if ok else 'error', 'message': msg}, status=200 if ok else 503)
 
 
 # --- New Views for Customization ---
@@ -1177,25 +1142,40 @@ def product_customizer_view(request, product_id):
     }
     return render(request, 'mystore/product_customizer.html', context)
 
+# Design images accepted from the customizer, with the file extension they are stored under
+CUSTOM_DESIGN_IMAGE_TYPES = {'image/png': 'png', 'image/jpeg': 'jpg'}
+CUSTOM_DESIGN_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+
+@csrf_exempt # The upload handler must be set before the CSRF check reads request.POST; _submit_custom_design applies the check
 @require_POST
 @login_required # Only logged-in users can submit custom designs
 def submit_custom_design(request):
     """
     Receives custom design data (image, options) from the frontend,
     saves the image locally, uploads it to Printify, and creates a CustomDesign object.
+    The image is a multipart file upload, streamed to a temporary file in chunks; a base64
+    data URL in the `design_image` field is still accepted from older clients.
     """
+    request.upload_handlers = [TemporaryFileUploadHandler(request)]
+    return _submit_custom_design(request)
+
+
+@csrf_protect
+def _submit_custom_design(request):
     # Ensure it's an AJAX request (X-Requested-With header)
     if request.headers.get('X-Requested-With') != 'XMLHttpRequest':
         return JsonResponse({'status': 'error', 'message': 'Invalid request type.'}, status=400)
 
     product_id = request.POST.get('product_id')
-    design_image_data_url = request.POST.get('design_image') # Base64 string from canvas.toDataURL()
+    design_file = request.FILES.get('design_image') # PNG blob from canvas.toBlob()
+    design_image_data_url = request.POST.get('design_image') # Fallback: base64 string from canvas.toDataURL()
     selected_product_type = request.POST.get('product_type')
     selected_size = request.POST.get('size')
     selected_color = request.POST.get('color')
     # design_json_str = request.POST.get('design_json') # Uncomment if you're sending Fabric.js JSON
 
-    if not all([product_id, design_image_data_url, selected_product_type, selected_size, selected_color]):
+    if not all([product_id, design_file or design_image_data_url, selected_product_type, selected_size, selected_color]):
         logger.error("Missing required fields for custom design submission.")
         return JsonResponse({'status': 'error', 'message': 'Missing required design data.'}, status=400)
 
@@ -1203,14 +1183,40 @@ def submit_custom_design(request):
         product_instance = get_object_or_404(Product, id=product_id)
         user = request.user # User is guaranteed to be authenticated by @login_required
 
-        # Convert data URL to Django ContentFile
-        # Expected format: data:image/png;base64,iVBORw0KGgo...
-        _format, imgstr = design_image_data_url.split(';base64,')
-        ext = _format.split('/')[-1] # e.g., 'png'
-        
+        # Reject combinations that cannot be ordered before anything is stored or uploaded
+        if product_instance.variant_map and not resolve_variant_id(product_instance, selected_color, selected_size):
+            return JsonResponse({'status': 'error', 'message': f'{selected_color} / {selected_size} is not available for this product.'}, status=400)
+
+        if design_file:
+            # Saved from the temporary file, so the image is never held in memory as a whole
+            data = design_file
+        else:
+            # Convert data URL to Django ContentFile
+            # Expected format: data:image/png;base64,iVBORw0KGgo...
+            # This path does hold the image in memory (the string and the decoded bytes), but
+            # the field is a form value, so DATA_UPLOAD_MAX_MEMORY_SIZE caps it well below
+            # CUSTOM_DESIGN_MAX_UPLOAD_BYTES.
+            try:
+                _format, imgstr = design_image_data_url.split(';base64,')
+                data = ContentFile(base64.b64decode(imgstr), name='design')
+            except ValueError:
+                return JsonResponse({'status': 'error', 'message': 'The design image could not be read.'}, status=400)
+        if data.size > CUSTOM_DESIGN_MAX_UPLOAD_BYTES:
+            return JsonResponse({'status': 'error', 'message': 'The design image is too large.'}, status=400)
+
+        # Check the content really is a PNG or JPEG (Pillow sets content_type from the decoded
+        # image), whatever Content-Type the client sent
+        try:
+            forms.ImageField().to_python(data)
+            ext = CUSTOM_DESIGN_IMAGE_TYPES.get(data.content_type)
+        except ValidationError:
+            ext = None
+        if not ext:
+            return JsonResponse({'status': 'error', 'message': 'The design must be a PNG or JPEG image.'}, status=400)
+
         # Create a unique filename for the design image
         file_name = f'custom_design_{slugify(product_instance.title)}_{uuid.uuid4().hex[:8]}.{ext}'
-        data = ContentFile(base64.b64decode(imgstr), name=file_name)
+        data.name = file_name
 
         # 1. Save the CustomDesign to your database locally first
         custom_design = CustomDesign(
@@ -1237,10 +1243,14 @@ def submit_custom_design(request):
                 'redirect_url': reverse('view_cart') # Fallback redirect if no JS add to cart
             })
 
-        upload_response = printify_client.upload_image(
-            file_name=file_name,
-            contents_base64=imgstr # Pass just the base64 string without 'data:image/png;base64,' part
-        )
+        image_url = custom_design.design_image.url
+        if image_url.startswith(('http://', 'https://')):
+            # Public storage (e.g. a CDN): Printify downloads the image itself
+            upload_response = printify_client.upload_image(file_name=file_name, url=image_url)
+        else:
+            # Base64-encoded from the stored file while it is sent, a chunk at a time
+            with custom_design.design_image.open('rb') as design_fh:
+                upload_response = printify_client.upload_image_file(file_name, design_fh, custom_design.design_image.size)
 
         if upload_response and upload_response.get('id'):
             custom_design.printify_image_id = upload_response['id']
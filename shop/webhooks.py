@@ -0,0 +1,156 @@
+# shop/webhooks.py
+"""
+Verification and handling of incoming webhooks. Printify product events update
+the single affected Product row, so full catalog syncs can run rarely. Paystack
+charge.success events complete the checkout server-side, so an order is created even
+if the customer never returns to paystack_callback.
+"""
+import hashlib
+import hmac
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .catalog import invalidate_product_caches, mark_product_removed, product_facet_keys, refresh_product
+from .checkout import complete_checkout, fail_checkout
+from .models import PaystackEvent, PendingCheckout
+
+logger = logging.getLogger(__name__)
+
+# Topics registered by `manage.py register_printify_webhooks`.
+PRINTIFY_PRODUCT_TOPICS = ('product:publish:started', 'product:deleted')
+
+# Delivered event IDs are remembered for a day so Printify's retries are not re-applied.
+PRINTIFY_EVENT_SEEN_KEY = 'webhooks:printify-event:{event_id}'
+PRINTIFY_EVENT_SEEN_TTL = 24 * 60 * 60
+
+# Paystack events that complete a checkout; every other event is acknowledged and ignored.
+PAYSTACK_CHARGE_EVENTS = ('charge.success',)
+PAYSTACK_CURRENCY = 'NGN'
+
+
+def verify_printify_signature(body, signature_header, secret=None):
+    """
+    Checks the X-Pfy-Signature header ("sha256=<hex HMAC of the raw body>") against
+    settings.PRINTIFY_WEBHOOK_SECRET. Always False when no secret is configured.
+    """
+    secret = secret if secret is not None else settings.PRINTIFY_WEBHOOK_SECRET
+    if not secret or not signature_header:
+        return False
+    received = signature_header.split('=', 1)[1] if signature_header.startswith('sha256=') else signature_header
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, received.strip())
+
+
+def handle_printify_event(event):
+    """
+    Applies one verified Printify event to the local catalog.
+
+    product:deleted unpublishes the stored product. Any other product event re-fetches
+    that one product from Printify and upserts it through build_product_defaults, the
+    same transform the full sync uses, so the stored row always reflects Printify's
+    current state whatever order events arrive in.
+
+    Returns (ok, message). ok is False only when the event should be retried.
+    """
+    topic = event.get('type', '')
+    resource = event.get('resource') or {}
+    printify_id = str(resource.get('id') or '')
+    if not topic.startswith('product:') or resource.get('type', 'product') != 'product' or not printify_id:
+        return True, f"Ignored event {topic or '(no type)'}."
+
+    shop_id = (resource.get('data') or {}).get('shop_id')
+    if shop_id and str(shop_id) != str(settings.PRINTIFY_SHOP_ID):
+        return True, f"Ignored event for shop {shop_id}."
+
+    event_id = event.get('id')
+    seen_key = PRINTIFY_EVENT_SEEN_KEY.format(event_id=event_id)
+    if event_id and not cache.add(seen_key, True, PRINTIFY_EVENT_SEEN_TTL):
+        return True, f"Event {event_id} already processed."
+
+    try:
+        facet_keys_before = product_facet_keys(printify_id)
+        if topic == 'product:deleted':
+            changed = mark_product_removed(printify_id)
+            message = f"Product {printify_id} {'unpublished' if changed else 'was not stored'}."
+        else:
+            if refresh_product(printify_id) is None:
+                raise RuntimeError(f"Could not fetch product {printify_id} from Printify.")
+            message = f"Product {printify_id} refreshed."
+        invalidate_product_caches(printify_id, facet_keys_before)
+    except Exception as e:
+        # Let Printify redeliver this event
+        if event_id:
+            cache.delete(seen_key)
+        logger.error(f"❌ Printify webhook {topic} for product {printify_id} failed: {e}")
+        return False, str(e)
+
+    logger.info(f"🪝 Printify webhook {topic}: {message}")
+    return True, message
+
+
+def verify_paystack_signature(body, signature_header, secret=None):
+    """
+    Checks the X-Paystack-Signature header (hex HMAC-SHA512 of the raw body, keyed with
+    settings.PAYSTACK_SECRET_KEY). Always False when no secret key is configured.
+    """
+    secret = secret if secret is not None else settings.PAYSTACK_SECRET_KEY
+    if not secret or not signature_header:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature_header.strip().lower())
+
+
+def handle_paystack_event(event):
+    """
+    Applies one verified Paystack event.
+
+    charge.success completes the PendingCheckout with that reference from what was stored
+    at checkout; the event itself is proof of payment, so no verify call is made. The
+    PaystackEvent row is written in the same transaction as the order, and its unique
+    (event, reference) constraint turns a redelivery into a no-op; a failure rolls both
+    back so Paystack's retry can try again.
+
+    Returns (ok, message). ok is False only when the event should be retried.
+    """
+    event_type = event.get('event', '')
+    data = event.get('data') or {}
+    reference = str(data.get('reference') or '')
+    if event_type not in PAYSTACK_CHARGE_EVENTS or not reference:
+        return True, f"Ignored event {event_type or '(no event)'}."
+
+    pending = PendingCheckout.objects.select_related('order').filter(reference=reference).first()
+    if pending is None:
+        logger.warning(f"⚠️ Paystack webhook {event_type} for unknown reference {reference}.")
+        return True, f"No checkout for reference {reference}."
+
+    try:
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = PaystackEvent.objects.create(event=event_type, reference=reference, payload=data)
+            except IntegrityError:
+                return True, f"Event {event_type} for {reference} already processed."
+            if data.get('status', 'success') != 'success':
+                result = f"Charge status {data.get('status')}."
+            elif int(data.get('amount') or 0) != pending.amount_kobo or (data.get('currency') or PAYSTACK_CURRENCY) != PAYSTACK_CURRENCY:
+                # Not completed: someone paid a different amount than the checkout was for
+                result = f"Amount mismatch: paid {data.get('amount')} {data.get('currency')}, expected {pending.amount_kobo} {PAYSTACK_CURRENCY}."
+                logger.error(f"❌ Paystack webhook for {reference}: {result}")
+                fail_checkout(pending, result)
+            else:
+                order, created = complete_checkout(pending)
+                if order is None:
+                    # Another request is completing it right now; let Paystack redeliver
+                    raise RuntimeError(f"Checkout {reference} is being completed elsewhere.")
+                result = f"Order {order.id} {'created' if created else 'already existed'}."
+            record.result = result[:255]
+            record.save(update_fields=['result'])
+    except Exception as e:
+        logger.error(f"❌ Paystack webhook {event_type} for {reference} failed: {e}")
+        return False, str(e)
+
+    logger.info(f"🪝 Paystack webhook {event_type} {reference}: {result}")
+    return True, result